@@ -101,6 +101,7 @@ response_feedback_color = (0, 255, 255)
 stimulus_feedback_color = (211, 211, 211)
 feedback_duration = 2000  # ms
 ignore_points_at = [(1919,1079),(119,1079),(239,1079)]  # list of (x,y) coordinates to be removed
+trace_render_tolerance = None  # merge consecutive tracing points within this many px when drawing feedback, None draws all
 
 ########################################
 # Button Bar Controls
@@ -115,6 +116,10 @@ control_q = "How many times did the dot change course {0}?"  # the {0} will cont
 # Figure Controls
 ########################################
 generation_timeout = 0.5  # seconds
+cache_figures = True  # cache scaled & interpolated pre-generated figures in ExpAssets/Local
+parallel_figure_loading = True  # load pre-generated figures using multiple CPU cores
+arc_length_tolerance = None  # max frame spacing error on curves (in px) for exact spacing, None keeps legacy frames
+time_driven_animation = True  # skip animation frames after missed refreshes to keep dot velocity constant
 
 generate_quadrant_intersections = True  # Not quite sure what this does
 outer_margin_v = 50  # minimum vertical distance figure points can be from screen margins (in px)
@@ -144,6 +149,9 @@ gen_tlfs = True  # segments file
 gen_tlfp = True  # points file
 gen_png = True   # image file
 gen_ext_png = False  # image file from extended interpolation
+use_figure_store = False  # write each unique figure's files once per session, not per trial
+use_session_archive = False  # write all trial files to one session.tlsa, not one zip per trial
+binary_traces = False  # write trial frames/tracings as binary .tlfab/.tltb, not text
 
 #########################################
 # Data Export Settings
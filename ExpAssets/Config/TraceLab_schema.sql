@@ -79,6 +79,38 @@ CREATE TABLE trials (
 	vivid_rating     TEXT                              NOT NULL
 );
 
+/*
+The 'frame_timing' table has one row per animation, summarizing its screen flip timing.
+KLibs doesn't expose the id of the 'trials' row it writes for each trial, so instead of
+a foreign key, rows for trial animations (animation = 'figure') are joined to their trials
+on all four trial identifier columns:
+
+  SELECT * FROM trials t JOIN frame_timing f
+    ON f.participant_id = t.participant_id AND f.session_num = t.session_num
+    AND f.block_num = t.block_num AND f.trial_num = t.trial_num
+  WHERE f.animation = 'figure';
+
+Rows for tutorial animations (animation = 'tutorial') have a trial_num of 0 and no matching
+trial. 'skipped_frames' is a JSON list of the indices of any animation frames skipped to
+keep the animation on schedule.
+*/
+
+CREATE TABLE frame_timing (
+	id               INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+	participant_id   INTEGER                           NOT NULL,
+	session_num      INTEGER                           NOT NULL,
+	block_num        INTEGER                           NOT NULL,
+	trial_num        INTEGER                           NOT NULL,
+	animation        TEXT                              NOT NULL,
+	refresh_rate     FLOAT                             NOT NULL,
+	flips            INTEGER                           NOT NULL,
+	mean_interval    FLOAT                             NOT NULL,
+	max_jitter       FLOAT                             NOT NULL,
+	dropped_frames   INTEGER                           NOT NULL,
+	interval_hist    TEXT                              NOT NULL,
+	skipped_frames   TEXT                              NOT NULL
+);
+
 CREATE TABLE sessions (
 	id             INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
 	participant_id INTEGER                           NOT NULL,
@@ -14,6 +14,7 @@ from klibs import P
 from klibs.KLJSON_Object import JSON_Object
 from klibs.KLBoundary import RectangleBoundary
 from klibs.KLUserInterface import ui_request
+from klibs.KLTime import precise_time
 from klibs.KLUtilities import line_segment_len, scale, pump
 from klibs.KLUtilities import colored_stdout as cso
 from klibs.KLGraphics import blit, flip, fill
@@ -99,6 +100,7 @@ class KeyFrame(object):
 		self.enabled = data.enabled
 		self.audio_track = None
 		self.audio_start_time = 0
+		self.flip_times = []  # times of each screen flip during last playback
 		self.screen_bounds = RectangleBoundary('screen', (0, 0), P.screen_x_y)
 		if self.enabled:
 			self.__render_frames__()
@@ -123,6 +125,7 @@ class KeyFrame(object):
 			pass
 		start = time()
 		frames_played = False
+		self.flip_times = []
 		while time() - start < self.duration:
 			if self.key_pressed(SDLK_DELETE):
 				try:
@@ -148,6 +151,7 @@ class KeyFrame(object):
 					for asset in frame:
 						blit(asset[0], asset[2], asset[1])
 					flip()
+					self.flip_times.append(precise_time())
 				frames_played = True
 
 		return False
@@ -265,6 +269,7 @@ class FrameSet(object):
 		else:
 			self.assets_file = None
 		self.key_frames_file = join(P.resources_dir, "code", key_frames_file + ".json")
+		self.flip_times = []  # flip times for each keyframe during last playback
 		self.generate_key_frames()
 
 	def __load_assets__(self, assets_file):
@@ -281,8 +286,10 @@ class FrameSet(object):
 
 	def play(self):
 		ui_request()
+		self.flip_times = []
 		for kf in self.key_frames:
 			if kf.enabled:
 				skip = kf.play()
+				self.flip_times.append(kf.flip_times)
 				if skip:
 					break
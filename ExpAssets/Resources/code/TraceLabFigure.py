@@ -1,67 +1,30 @@
 # -*- coding: utf-8 -*-
 __author__ = 'Jonathan Mulle & Austin Hurst'
 
-import os
-import io
 import math
 from itertools import chain
 from random import random, randrange, uniform, choice, shuffle
 
-import zipfile
-import aggdraw
 import numpy as np
-from PIL import Image
 
 from klibs.KLExceptions import TrialException
 from klibs.KLEnvironment import EnvAgent
 import klibs.KLParams as P
 from klibs.KLBoundary import RectangleBoundary
 from klibs.KLTime import precise_time as time
-from klibs.KLUtilities import angle_between, acute_angle, point_pos, scale, utf8, line_segment_len
+from klibs.KLUtilities import angle_between, acute_angle, point_pos, scale, line_segment_len
 from klibs.KLUserInterface import ui_request
-from klibs.KLGraphics import blit, flip, fill
+from klibs.KLGraphics import blit, flip
 from klibs.KLGraphics.KLDraw import Ellipse
 from klibs.KLCommunication import message
 
-from drawingutils import (bezier_length, bezier_bounds, linear_intersection,
-	bezier_transitions_by_dist, bezier_interpolation,
-	linear_transitions_by_dist, linear_interpolation)
-
-
-def frames_to_path(frames, unique=False):
-	"""Renders a list of (x, y) tuples representing the frames of a figure into an
-	aggdraw Path object for drawing.
-	"""
-	path = aggdraw.Path()
-	path.moveto(frames[0][0], frames[0][1]) # start at first point
-
-	prev = frames[0]
-	for f in frames:
-		# If current frame not different than previous one, discard it
-		if unique and (f[0] == prev[0] and f[1] == prev[1]):
-			continue
-		path.lineto(f[0], f[1])
-		prev = f
-
-	path.close()
-	return path
-
-
-def segments_to_symbol(segments):
-	"""Renders a list of curve and line segments into an aggdraw Path object for drawing.
-	"""
-
-	path = "M{0},{1} ".format(segments[0][1][0][0], segments[0][1][0][1]) # start at first point
-	for curve, points in segments:
-		if curve:
-			start, end, ctrl = points
-			path += "Q{0},{1},{2},{3} ".format(ctrl[0], ctrl[1], end[0], end[1])
-		else:
-			start, end = points
-			path += "L{0},{1} ".format(end[0], end[1])
-
-	return aggdraw.Symbol(path)
-
+from drawingutils import (bezier_bounds, linear_intersection, segment_lengths, segments_bounds,
+	segments_to_frames, segments_to_frame_sets, mirror_segments)
+from figureio import read_figure
+from figurerender import texture_box, draw_segments, draw_frames, draw_trace
+from figurewriter import FigureSnapshot, write_snapshot
+from pathindex import PathIndex
+from compositor import Compositor
 
 
 class TraceLabFigure(EnvAgent):
@@ -97,11 +60,16 @@ class TraceLabFigure(EnvAgent):
 		self.points = []
 		self.raw_segments = []
 		self.a_frames = []  # interpolated frames tracing figure at given duration / fps
-		self.trial_a_frames = []  # a_frames plus frame onset times for previous animation
+		self.frame_sets = {}  # interpolated frames for each animation duration (reset with segments)
+		self.trial_a_frames = []  # frames shown plus their onset times for previous animation
+		self.skipped_frames = []  # indices (in a_frames) of frames skipped in previous animation
+		self.flip_times = []  # times of each screen flip for previous animation
 		self.screen_res = [P.screen_x, P.screen_y]
 		self.avg_velocity = None  # last call to animate only
 		self.animate_time = None  # last call to animate only
 		self.rendered = False
+		self.rendered_pos = (0, 0)  # screen position of top-left corner of last render
+		self.frames_duration = None  # animation duration of current a_frames
 
 		if import_path:
 			self.__import_figure(import_path)
@@ -109,6 +77,7 @@ class TraceLabFigure(EnvAgent):
 			self.points = manufacture['points']
 			self.seg_count = len(self.points)
 			self.raw_segments = manufacture['segments']
+			self.frame_sets.update(manufacture.get('frames', {}))
 		else:
 			self.__generate_null_points()
 			self.__gen_quad_intersects()
@@ -125,32 +94,16 @@ class TraceLabFigure(EnvAgent):
 
 	def __import_figure(self, path):
 
-		# Open the figure archive and find the .tlf file containing the figure data
-		fig_archive = zipfile.ZipFile(path + ".zip")
-		figure = os.path.split(path)[-1]
-		fig_file = figure + ".tlf"
-		if fig_file not in fig_archive.namelist():
-			fig_file = figure + "/" + fig_file
-
-		# Import figure attributes from .tlf and make attributes of current figure object
-		figure_res = [1920, 1080]
-		with fig_archive.open(fig_file) as tlf:
-			for l in io.TextIOWrapper(tlf, 'utf8'):
-				attr = l.split(" = ")
-				if len(attr) == 2:
-					if attr[0] in ['raw_segments', 'points']:
-						setattr(self, attr[0], eval(attr[1]))
-					elif attr[0] == 'screen_res':
-						figure_res = eval(attr[1])
+		# Import figure points and segments from the archive (using the binary .tlfb version
+		# of the figure if available, otherwise parsing the .tlf)
+		points, segments, figure_res = read_figure(path)
 
 		# Prepare figure segment data for re-interpolation, scaling pixel coordinates if necessary
-		self.seg_count = len(self.points)
-		self.points = [scale(p, figure_res) for p in self.points]
-		for i in range(len(self.raw_segments)):
-			points = self.raw_segments[i][1]
-			points = points[:-1] if isinstance(points[-1], int) else points  # fix for old .tlfs
-			self.raw_segments[i][0] = len(points) == 3  # fix line/curve id for old .tlfs
-			self.raw_segments[i][1] = tuple([scale(p, figure_res) for p in points])
+		self.seg_count = len(points)
+		self.points = [scale(p, figure_res) for p in points]
+		self.raw_segments = [
+			[curve, tuple([scale(p, figure_res) for p in pts])] for curve, pts in segments
+		]
 
 
 	def __generate_null_points(self):
@@ -438,6 +391,7 @@ class TraceLabFigure(EnvAgent):
 			'slope_magnitude', 'peak_shift', 'curve_sheer'
 		]
 		attrs = self.__dict__.copy()
+		attrs['raw_segments'] = self.raw_segments
 		attrs['path_length'] = round(self.path_length, 2)
 
 		out = []
@@ -465,18 +419,7 @@ class TraceLabFigure(EnvAgent):
 
 		pts = []
 		if mirror:
-			for curve, points in segments:
-				flip_pts = []
-				if curve:
-					for p in points:
-						flip_pts.append((P.screen_x-p[0],p[1]))
-					start, end, ctrl = flip_pts
-					pts.append([curve,(start, end, ctrl)])
-				else:
-					for p in points:
-						flip_pts.append((P.screen_x-p[0],p[1]))
-					start, end = flip_pts
-					pts.append([curve,(start, end)])
+			pts = mirror_segments(segments, P.screen_x)
 		else:
 			segments.reverse()
 			for curve, points in segments:
@@ -498,32 +441,12 @@ class TraceLabFigure(EnvAgent):
 			duration (float): The duration the tracing motion in milliseconds.
 			fps (float, optional): The frame rate at which to render the frames.
 		"""
-
-		total_frames = int(round(duration / (1000.0 / fps)))
-		dist_per_frame = self.path_length / total_frames
-
-		offset = 0
-		fig_frames = []
-		for curve, points in segments:
-
-			if curve:
-				start, end, ctrl = points
-				dist = bezier_length(start, ctrl, end)
-				transitions = bezier_transitions_by_dist(start, ctrl, end, dist_per_frame, offset)
-				fig_frames += bezier_interpolation(start, end, ctrl, transitions)
-			else:
-				start, end = points
-				dist = line_segment_len(start, end)
-				transitions = linear_transitions_by_dist(start, end, dist_per_frame, offset)
-				fig_frames += linear_interpolation(start, end, transitions)
-
-			frames = len(transitions) - 1
-			offset = (frames + 1) * dist_per_frame - (dist - offset)
-
-		return fig_frames
+		return segments_to_frames(
+			segments, duration, fps, path_len=self.path_length, tolerance=P.arc_length_tolerance
+		)
 
 
-	def render(self, trace=None, smooth=True):
+	def render(self, trace=None, smooth=True, crop=False):
 		"""Renders the figure (and optionally a provided participant tracing) to a numpy array
 		texture that can be drawn to the screen.
 
@@ -533,37 +456,76 @@ class TraceLabFigure(EnvAgent):
 			smooth (bool, optional): A flag indicating whether to draw the figure smoothly or by
 				drawing lines between the frames from the last prepare_animation call. Defaults to
 				True.
+			crop (bool, optional): If True, only the area of the screen containing the figure
+				(and trace, if provided) will be rendered, and the screen position of the
+				top-left corner of the texture will be stored in the 'rendered_pos' attribute.
+				Otherwise, the full screen will be rendered. Defaults to False.
+
+		Returns:
+			:obj:`numpy.ndarray`: The rendered figure. This may be shared with future calls
+			to render, so it should not be modified.
 		"""
 
-		# Initialize drawing surface
-		canvas = Image.new("RGBA", P.screen_x_y, (0, 0, 0, 255))
-		surf = aggdraw.Draw(canvas)
+		# Since the figure itself only changes if its segments, frames, or colour change, each
+		# rendered version of it is cached and reused
+		frames_duration = None if smooth else self.frames_duration
+		key = (smooth, frames_duration, crop, tuple(P.stimulus_feedback_color), tuple(P.screen_x_y))
+		if key not in self._textures:
+			if crop:
+				if smooth:
+					bounds = segments_bounds(self.raw_segments)
+				else:
+					bounds = (np.min(self.a_frames, axis=0), np.max(self.a_frames, axis=0))
+				box = texture_box(bounds, P.screen_x_y)
+			else:
+				box = (0, 0, P.screen_x, P.screen_y)
+
+			if smooth:
+				texture = draw_segments(self.raw_segments, box, P.stimulus_feedback_color)
+			else:
+				texture = draw_frames(self.a_frames, box, P.stimulus_feedback_color)
+			self._textures[key] = (texture, box)
 
-		# Draw figure to surface
-		if smooth:
-			s = segments_to_symbol(self.raw_segments)
-			surf.symbol((0, 0), s, aggdraw.Pen(P.stimulus_feedback_color, 1, 255))
-		else:
-			path = frames_to_path(self.a_frames, unique=True)
-			surf.path(path, aggdraw.Pen(P.stimulus_feedback_color, 1, 255))
+		texture, box = self._textures[key]
 
-		# If tracing, draw trace to surface too
+		# If tracing, draw trace on top of a copy of the rendered figure, expanding the
+		# texture to fit the trace if needed
 		if trace:
-			path = frames_to_path(trace, unique=True)
-			surf.path(path, aggdraw.Pen(P.response_feedback_color, 1, 255))
+			texture, box = draw_trace(
+				texture, box, trace, P.response_feedback_color, P.screen_x_y,
+				P.trace_render_tolerance
+			)
 
-		# Render to numpy array and return
-		surf.flush()
-		self.rendered = np.asarray(canvas)
+		self.rendered = texture
+		self.rendered_pos = (box[0], box[1])
 		return self.rendered
 
 
+	def blit_rendered(self):
+		"""Draws the texture from the last render call to the screen in its proper location,
+		mirroring it horizontally if P.flip_x is True.
+		"""
+		blit(self.rendered, 7, self.rendered_location, flip_x=P.flip_x)
+
+
+	@property
+	def rendered_location(self):
+		"""tuple: The screen location at which to draw the top-left corner of the texture
+		from the last render call (with registration 7), accounting for P.flip_x.
+		"""
+		x, y = self.rendered_pos
+		if P.flip_x:
+			x = P.screen_x - (x + self.rendered.shape[1])
+		return (x, y)
+
+
 	def draw(self, dots=True):
 
 		path_len = round(self.path_length, 1)
 		msg = message("Path Length: {0} pixels".format(path_len), blit_txt=False)
 
-		blit(self.render(smooth=True), flip_x=P.flip_x)
+		self.render(smooth=True, crop=True)
+		self.blit_rendered()
 		blit(msg, 1, (30, P.screen_y - 25))
 		if dots:
 			for p in self.points:
@@ -572,108 +534,267 @@ class TraceLabFigure(EnvAgent):
 
 
 	def prepare_animation(self, duration=None):
+		"""Sets the animation frames of the figure to the ones for a given duration.
 
+		Frames are looked up in the figure's per-duration frame table, and are only
+		interpolated if no frames for the duration have been prepared yet.
+
+		Args:
+			duration (float, optional): The duration of the animation in milliseconds.
+				Defaults to the figure's current animation target time.
+		"""
 		if duration is None:
 			duration = self.animate_target_time
 
-		self.a_frames = self.segments_to_frames(self.raw_segments, duration, fps=P.refresh_rate)
+		# Only interpolate frames for a given duration once, since they never change
+		duration = float(duration)
+		if duration not in self.frame_sets:
+			self.interpolate_frames([duration])
+		self.a_frames = self.frame_sets[duration]
+		self.frames_duration = duration
+
+
+	def interpolate_frames(self, durations, refresh_rates=None):
+		"""Interpolates the animation frames of the figure for multiple durations and/or
+		refresh rates at once.
+
+		Since the segment lengths and distance maps are shared between all requested frame
+		sets, this is much faster than interpolating each frame set individually. Frame
+		sets for the current refresh rate are also added to the figure's frame table,
+		and any already in the table are reused.
+
+		Args:
+			durations (list): The animation durations (in ms) to interpolate frames for.
+			refresh_rates (list, optional): The refresh rates to interpolate frames for.
+				Defaults to the refresh rate of the current screen.
+
+		Returns:
+			dict: The interpolated frames in the format {(duration, refresh_rate): frames}.
+		"""
+		if refresh_rates is None:
+			refresh_rates = [P.refresh_rate]
+		current_rate = float(P.refresh_rate)
+
+		frame_sets = {}
+		needed = []
+		for fps in refresh_rates:
+			for duration in durations:
+				key = (float(duration), float(fps))
+				if key in frame_sets or key in needed:
+					continue
+				if key[1] == current_rate and key[0] in self.frame_sets:
+					frame_sets[key] = self.frame_sets[key[0]]
+				else:
+					needed.append(key)
+
+		if needed:
+			new_sets = segments_to_frame_sets(
+				self.raw_segments, needed, self.path_length, P.arc_length_tolerance
+			)
+			for key, frames in zip(needed, new_sets):
+				frame_sets[key] = frames
+				if key[1] == current_rate:
+					self.frame_sets[key[0]] = frames
+
+		return frame_sets
 
 
 	def animate(self):
+		"""Animates the tracker dot along the figure's path using the frames from the last
+		prepare_animation call, recording the onset time of each frame (relative to the
+		first) in trial_a_frames.
+
+		If P.time_driven_animation is True, the frame shown on each refresh is chosen
+		based on the time elapsed since the start of the animation, skipping any frames
+		that would be late if a refresh is missed so that the dot always moves at the
+		intended velocity. Skipped frames are left out of trial_a_frames, and their indices
+		within a_frames are recorded in skipped_frames instead. Otherwise, every frame is
+		shown for exactly one refresh.
+
+		The time of every screen flip during the animation is recorded in flip_times.
+		"""
+		frame_interval = 1.0 / P.refresh_rate
+		last_frame = len(self.a_frames) - 1
+
+		# In demo mode, keep the rendered figure in video memory for the whole animation
+		layers = Compositor()
+		if P.demo_mode:
+			layers.set_layer("figure", self.rendered, 7, self.rendered_location)
 
 		start = None
 		updated_a_frames = []
-		for f in self.a_frames:
+		skipped_frames = []
+		flip_times = []
+		i = 0
+		while i <= last_frame:
 
+			f = self.a_frames[i]
 			ui_request()
-			fill()
-			if P.demo_mode:
-				blit(self.rendered, 5, P.screen_c, flip_x=P.flip_x)
-			blit(self.exp.tracker_dot, 5, f, flip_x=P.flip_x)
+			layers.draw([(self.exp.tracker_dot, 5, f)])
 			flip()
 
+			flip_times.append(time())
 			if start is None:
 				timestamp = 0.0
-				start = time()
+				start = flip_times[0]
 			else:
-				timestamp = time() - start
+				timestamp = flip_times[-1] - start
 			updated_a_frames.append((f[0], f[1], timestamp))
 
+			# Determine the next frame to show, skipping (and logging) any frames that
+			# would be shown late if the animation has fallen behind schedule
+			next_i = i + 1
+			if P.time_driven_animation and next_i < last_frame:
+				scheduled = int(round(timestamp / frame_interval)) + 1
+				next_i = min(max(next_i, scheduled), last_frame)
+				skipped_frames.extend(range(i + 1, next_i))
+			i = next_i
+
+		layers.clear()
 		self.trial_a_frames = updated_a_frames
+		self.skipped_frames = skipped_frames
+		self.flip_times = flip_times
 
 
-	def write_out(self, file_name, trial_data=None):
+	def snapshot(self, file_name, trial_data=None):
+		"""Gathers everything needed to write out the figure (or a tracing of it) into an
+		immutable snapshot, so that it can be written out later (e.g. on a background
+		thread) without accessing the figure.
+
+		Args:
+			file_name (str): The name of the .tlf (or .tlt, if writing a tracing) file to
+				write, which also determines the name of its archive.
+			trial_data (list, optional): The tracing to write out. Defaults to None, in
+				which case the figure's frames from the last animation are written out.
 
+		Returns:
+			:obj:`figurewriter.FigureSnapshot`: The snapshot of the figure.
+		"""
 		writing_tracing = trial_data is not None
 		if not trial_data:
 			trial_data = self.trial_a_frames
 
-		points_file_name = file_name[:-4] + ".tlfp"
-		segments_file_name = file_name[:-4] + ".tlfs"
-		ext_interp_file_name = file_name[:-4] + ".tlfx"
-		thumb_file_name = file_name[:-4] + "_preview.png"
-		thumbx_file_name = file_name[:-4] + "_ext_preview.png"
-
-		fig_path = os.path.join(self.exp.fig_dir, file_name)
-		points_path = os.path.join(self.exp.fig_dir, points_file_name)
-		segments_path = os.path.join(self.exp.fig_dir, segments_file_name)
-		ext_interpolation_path = os.path.join(self.exp.fig_dir, ext_interp_file_name)
-		thumb_path = os.path.join(self.exp.fig_dir, thumb_file_name)
-		thumbx_path = os.path.join(self.exp.fig_dir, thumbx_file_name)
-
-		with zipfile.ZipFile(fig_path[:-3] + "zip", "a", zipfile.ZIP_DEFLATED) as fig_zip:
-
-			with io.open(fig_path, "w+", encoding='utf-8') as f:
-				if P.capture_figures_mode:
-					captured = self.__capture_figure_out()
-					f.write(captured)
-				else:
-					f.write(utf8(trial_data))
+		if P.capture_figures_mode:
+			data = self.__capture_figure_out()
+		else:
+			data = tuple(trial_data) if isinstance(trial_data, list) else trial_data
+
+		# When capturing figures, also save a binary copy of the figure for fast loading
+		outputs = [".tlfb"] if P.capture_figures_mode else []
+		ext_frames, ext_timing = (None, None)
+		if not writing_tracing:
+			if P.gen_tlfx:
+				outputs.append(".tlfx")
+				# Reuse the extended frames if already interpolated, otherwise leave them
+				# for the writer to interpolate so that it doesn't delay the next trial
+				ext_timing = (
+					5000.0, float(P.refresh_rate), self.path_length, P.arc_length_tolerance
+				)
+				if 5000.0 in self.frame_sets:
+					ext_frames = tuple(self.frame_sets[5000.0])
+			if P.gen_tlfp:
+				outputs.append(".tlfp")
+			if P.gen_tlfs:
+				outputs.append(".tlfs")
+			if P.gen_png:
+				outputs.append("_preview.png")
+			if P.gen_ext_png:
+				outputs.append("_ext_preview.png")
+
+		return FigureSnapshot(
+			fig_dir=self.exp.fig_dir,
+			file_name=file_name,
+			data=data,
+			outputs=tuple(outputs),
+			points=tuple(self.points),
+			segments=tuple(tuple(s) for s in self.raw_segments),
+			screen_res=tuple(self.screen_res),
+			ext_frames=ext_frames,
+			ext_timing=ext_timing,
+			color=tuple(P.stimulus_feedback_color),
+			store=P.use_figure_store and not P.capture_figures_mode,
+			binary=P.binary_traces,
+		)
+
+
+	def write_out(self, file_name, trial_data=None):
+		"""Writes out the figure (or a tracing of it) to its zip archive in the current
+		figure folder. See :meth:`snapshot` for details.
+		"""
+		write_snapshot(self.snapshot(file_name, trial_data))
+
+
+	@property
+	def raw_segments(self):
+		"""list: The [curve, points] segments making up the figure.
+
+		Replacing the segments clears the figure's cached segment lengths, path index, and
+		interpolated animation frames. Segments should always be replaced rather than modified
+		in place.
+		"""
+		return self._raw_segments
+
+	@raw_segments.setter
+	def raw_segments(self, segments):
+		self._raw_segments = segments
+		self._segment_lengths = None
+		self._cumulative_lengths = None
+		self._path_index = None
+		self._textures = {}
+		self.frame_sets = {}
 
-			if P.gen_tlfx and not writing_tracing:
-				with io.open(ext_interpolation_path, "w+", encoding='utf-8') as f:
-					ext = self.segments_to_frames(self.raw_segments, 5000.0, fps=P.refresh_rate)
-					f.write(utf8(ext))
-				fig_zip.write(ext_interpolation_path, ext_interp_file_name)
-				os.remove(ext_interpolation_path)
 
-			if P.gen_tlfp and not writing_tracing:
-				with io.open(points_path, "w+", encoding='utf-8') as f:
-					f.write(utf8(self.points))
-				fig_zip.write(points_path, points_file_name)
-				os.remove(points_path)
+	@property
+	def segment_lengths(self):
+		""":obj:`numpy.ndarray`: The length (in pixels) of each segment of the figure.
+		"""
+		if self._segment_lengths is None:
+			self._segment_lengths = np.array(segment_lengths(self.raw_segments), dtype=np.float64)
+		return self._segment_lengths
 
-			if P.gen_tlfs and not writing_tracing:
-				with io.open(segments_path, "w+", encoding='utf-8') as f:
-					f.write(u",".join(utf8(s[1]) for s in self.raw_segments))
-				fig_zip.write(segments_path, segments_file_name)
-				os.remove(segments_path)
 
-			if P.gen_png and not writing_tracing:
-				Image.fromarray(self.render()).save(thumb_path, 'PNG')
-				fig_zip.write(thumb_path, thumb_file_name)
-				os.remove(thumb_path)
+	@property
+	def cumulative_lengths(self):
+		""":obj:`numpy.ndarray`: The distance (in pixels) along the figure's path at the start
+		of each segment, followed by the full length of the figure. Segment 'i' covers the
+		part of the path from cumulative_lengths[i] to cumulative_lengths[i + 1].
+		"""
+		if self._cumulative_lengths is None:
+			cumulative = np.cumsum(self.segment_lengths)
+			self._cumulative_lengths = np.concatenate(([0.0], cumulative))
+		return self._cumulative_lengths
 
-			if P.gen_ext_png and not writing_tracing:
-				Image.fromarray(self.render(smooth=True)).save(thumbx_path, 'PNG')
-				fig_zip.write(thumbx_path, thumbx_file_name)
-				os.remove(thumbx_path)
 
-			fig_zip.write(fig_path, file_name)
-			os.remove(fig_path)
+	@property
+	def path_index(self):
+		""":obj:`pathindex.PathIndex`: A spatial index of the figure's path, for quickly
+		finding the closest point on the figure to any number of points (e.g. the samples
+		of a tracing). The index is built the first time it's used.
+		"""
+		if self._path_index is None:
+			self._path_index = PathIndex.from_segments(self.raw_segments)
+		return self._path_index
 
 
 	@property
 	def path_length(self):
 		"""float: The full length of the figure in pixels.
 		"""
-		length = 0
-		for curve, points in self.raw_segments:
-			if curve:
-				p1, p2, ctrl = points
-				length += bezier_length(p1, ctrl, p2)
-			else:
-				p1, p2 = points
-				length += line_segment_len(p1, p2)
+		return float(self.cumulative_lengths[-1])
 
-		return length
+
+	def segment_at(self, dist):
+		"""Finds the segment of the figure at a given distance along its path.
+
+		Args:
+			dist (float): The distance (in pixels) along the figure's path from its origin.
+
+		Returns:
+			tuple: The index of the segment containing the given distance, and the distance
+			(in pixels) from the start of that segment. Distances past either end of the
+			path are clamped to the first or last segment.
+		"""
+		cum = self.cumulative_lengths
+		i = int(np.searchsorted(cum, dist, side='right')) - 1
+		i = min(max(i, 0), len(cum) - 2)
+		return (i, dist - cum[i])
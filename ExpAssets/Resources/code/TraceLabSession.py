@@ -420,9 +420,8 @@ class TraceLabSession(EnvAgent):
 
 		# Verify that all figures listed in figure set exist, raising error if it doesn't
 		figure_set = self.exp.figure_sets[self.exp.figure_set_name]
-		for f in figure_set.names:
-			f_path = os.path.join(P.resources_dir, "figures", f)
-			if not os.path.exists(f_path + ".zip") and f != "random":
+		for f in self.exp.figure_index.missing(figure_set.names):
+			if f != "random":
 				fill()
 				e_msg = (
 					"The figure '{0}' listed in the figure set '{1}' wasn't found.\n"
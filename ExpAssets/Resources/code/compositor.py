@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""A simple layered compositor for drawing animations.
+
+KLibs' blit() uploads its source to the graphics card as a new texture every time it's
+called, which is fine for small stimuli but gets expensive for large textures (e.g. a
+rendered figure) that get redrawn on every refresh of an animation. A Compositor keeps
+textures that don't change between refreshes (e.g. the figure outline or the origin
+marker) in video memory as static layers, only uploading them once, so that each refresh
+only needs to upload the moving parts of the display.
+
+If PyOpenGL isn't available, static layers are drawn with regular blit() calls instead.
+
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import klibs.KLParams as P
+from klibs.KLGraphics import blit, fill
+
+try:
+	from OpenGL import GL
+except ImportError:
+	GL = None
+
+
+def registration_offset(registration, width, height):
+	"""Gets the offset from a texture's registration point to its top-left corner.
+
+	Args:
+		registration (int): The registration of the texture, using the same numbering
+			(i.e. numeric keypad layout) as :func:`klibs.KLGraphics.blit`.
+		width (int): The width of the texture in pixels.
+		height (int): The height of the texture in pixels.
+
+	Returns:
+		tuple: The (x, y) offset from the registration point to the top-left corner.
+	"""
+	x_offsets = {1: 0, 4: 0, 7: 0, 2: -0.5, 5: -0.5, 8: -0.5, 3: -1, 6: -1, 9: -1}
+	y_offsets = {7: 0, 8: 0, 9: 0, 4: -0.5, 5: -0.5, 6: -0.5, 1: -1, 2: -1, 3: -1}
+	return (int(x_offsets[registration] * width), int(y_offsets[registration] * height))
+
+
+class StaticLayer(object):
+	"""A texture that's uploaded to video memory once and then drawn to the same place on
+	the screen as many times as needed.
+
+	Args:
+		texture (:obj:`numpy.ndarray`): The RGBA texture for the layer.
+		registration (int): The registration of the texture (see :func:`blit`).
+		location (tuple): The (x, y) screen location to draw the layer at.
+
+	"""
+	def __init__(self, texture, registration, location):
+		self.texture = texture
+		self.registration = registration
+		self.location = tuple(location)
+		self._tex_id = None
+
+	def _upload(self):
+		data = np.ascontiguousarray(self.texture, dtype=np.uint8)
+		height, width = data.shape[:2]
+		self._tex_id = GL.glGenTextures(1)
+		GL.glBindTexture(GL.GL_TEXTURE_2D, self._tex_id)
+		GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+		GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+		GL.glTexImage2D(
+			GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, width, height, 0, GL.GL_RGBA,
+			GL.GL_UNSIGNED_BYTE, data
+		)
+
+	def draw(self, flip_x=False):
+		"""Draws the layer to the screen buffer.
+
+		Args:
+			flip_x (bool, optional): Whether to flip the layer horizontally, as with the
+				'flip_x' argument of :func:`blit`. Defaults to False.
+		"""
+		if GL is None:
+			blit(self.texture, self.registration, self.location, flip_x=flip_x)
+			return
+
+		if self._tex_id is None:
+			self._upload()
+		height, width = self.texture.shape[:2]
+		x_offset, y_offset = registration_offset(self.registration, width, height)
+		x1, y1 = (self.location[0] + x_offset, self.location[1] + y_offset)
+		x2, y2 = (x1 + width, y1 + height)
+		u1, u2 = (1, 0) if flip_x else (0, 1)
+
+		# Save the enable flags, blending, and texture state changed below so that the
+		# layer doesn't affect anything drawn after it (e.g. by blit())
+		GL.glPushAttrib(GL.GL_ENABLE_BIT | GL.GL_COLOR_BUFFER_BIT | GL.GL_TEXTURE_BIT)
+		GL.glEnable(GL.GL_TEXTURE_2D)
+		GL.glBindTexture(GL.GL_TEXTURE_2D, self._tex_id)
+		GL.glTexEnvi(GL.GL_TEXTURE_ENV, GL.GL_TEXTURE_ENV_MODE, GL.GL_REPLACE)
+		GL.glEnable(GL.GL_BLEND)
+		GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+		GL.glBegin(GL.GL_QUADS)
+		GL.glTexCoord2f(u1, 0)
+		GL.glVertex2f(x1, y1)
+		GL.glTexCoord2f(u2, 0)
+		GL.glVertex2f(x2, y1)
+		GL.glTexCoord2f(u2, 1)
+		GL.glVertex2f(x2, y2)
+		GL.glTexCoord2f(u1, 1)
+		GL.glVertex2f(x1, y2)
+		GL.glEnd()
+		GL.glPopAttrib()
+
+	def release(self):
+		"""Frees the layer's texture from video memory.
+		"""
+		if self._tex_id is not None:
+			GL.glDeleteTextures([self._tex_id])
+			self._tex_id = None
+
+
+class Compositor(object):
+	"""Draws a set of static layers plus any moving elements to the screen each refresh.
+
+	Static layers are drawn in the order they were added, with moving elements drawn on
+	top of them.
+
+	"""
+	def __init__(self):
+		self.layers = OrderedDict()
+
+	def set_layer(self, name, texture, registration, location):
+		"""Adds or updates a static layer. If the layer already exists with the same texture
+		and location, nothing is changed (and the texture isn't re-uploaded).
+
+		Args:
+			name (str): The name of the layer.
+			texture (:obj:`numpy.ndarray`): The RGBA texture for the layer.
+			registration (int): The registration of the texture (see :func:`blit`).
+			location (tuple): The (x, y) screen location to draw the layer at.
+		"""
+		layer = self.layers.get(name)
+		if layer:
+			unchanged = (
+				layer.texture is texture and layer.registration == registration and
+				layer.location == tuple(location)
+			)
+			if unchanged:
+				return
+			layer.release()
+		self.layers[name] = StaticLayer(texture, registration, location)
+
+	def remove_layer(self, name):
+		"""Removes a static layer, freeing its texture from video memory.
+
+		Args:
+			name (str): The name of the layer to remove.
+		"""
+		layer = self.layers.pop(name, None)
+		if layer:
+			layer.release()
+
+	def clear(self):
+		"""Removes all static layers, freeing their textures from video memory.
+		"""
+		for name in list(self.layers.keys()):
+			self.remove_layer(name)
+
+	def draw(self, moving=()):
+		"""Clears the screen buffer and draws all static layers to it, followed by any
+		moving elements.
+
+		Args:
+			moving (list, optional): A list of (texture, registration, location) tuples
+				to draw on top of the static layers with :func:`blit`.
+		"""
+		fill()
+		for layer in self.layers.values():
+			layer.draw(P.flip_x)
+		for texture, registration, location in moving:
+			blit(texture, registration, location, flip_x=P.flip_x)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Shared setup for the tests in this folder.
+
+Most of TraceLab's utility modules only use a few simple helpers from KLibs, so if KLibs
+isn't installed, minimal stand-ins for the parts of it that they import are registered
+here so that the tests can be run with plain pytest. Stand-ins for anything that needs a
+window or display raise NotImplementedError if called.
+
+"""
+
+import sys
+import math
+import time
+import types
+
+
+def _unavailable(*args, **kwargs):
+	raise NotImplementedError("Requires KLibs.")
+
+
+def _line_segment_len(a, b):
+	dy = b[1] - a[1]
+	dx = b[0] - a[0]
+	return math.sqrt(dx ** 2 + dy ** 2)
+
+
+def _clip(value, minimum, maximum):
+	if value > maximum:
+		value = maximum
+	elif value < minimum:
+		value = minimum
+	return value
+
+
+def _iterable(obj, exclude_strings=True):
+	if exclude_strings and isinstance(obj, str):
+		return False
+	try:
+		iter(obj)
+		return True
+	except TypeError:
+		return False
+
+
+def _utf8(x):
+	return x.decode('utf-8') if isinstance(x, bytes) else str(x)
+
+
+def _stand_in(name, **attrs):
+	module = types.ModuleType(name)
+	module.__dict__.update(attrs)
+	sys.modules[name] = module
+	parent, _, child = name.rpartition(".")
+	if parent:
+		setattr(sys.modules[parent], child, module)
+	return module
+
+
+try:
+	import klibs
+except ImportError:
+	klibs = _stand_in("klibs")
+	klibs.P = _stand_in("klibs.KLParams")
+	_stand_in("klibs.KLUtilities",
+		line_segment_len=_line_segment_len, clip=_clip, iterable=_iterable, utf8=_utf8,
+		point_pos=_unavailable, angle_between=_unavailable, acute_angle=_unavailable,
+		scale=_unavailable,
+	)
+	_stand_in("klibs.KLExceptions", TrialException=type("TrialException", (Exception,), {}))
+	_stand_in("klibs.KLEnvironment", EnvAgent=object)
+	_stand_in("klibs.KLBoundary", RectangleBoundary=_unavailable)
+	_stand_in("klibs.KLTime", precise_time=time.perf_counter)
+	_stand_in("klibs.KLUserInterface", ui_request=_unavailable)
+	_stand_in("klibs.KLGraphics", blit=_unavailable, flip=_unavailable, fill=_unavailable)
+	_stand_in("klibs.KLGraphics.KLDraw", Ellipse=_unavailable)
+	_stand_in("klibs.KLCommunication", message=_unavailable)
@@ -2,6 +2,7 @@
 __author__ = "Austin Hurst"
 
 import math
+import numpy as np
 from klibs.KLUtilities import iterable, point_pos, clip, line_segment_len
 
 
@@ -47,7 +48,7 @@ def linear_transitions(start, end, velocity, fps=60):
 
 	duration = line_segment_len(start, end) / float(velocity)
 	steps = int(duration / (1000.0 / fps))
-	transitions = [t / float(steps - 1) for t in range(steps)]
+	transitions = np.arange(steps) / float(steps - 1)
 
 	return transitions
 
@@ -64,7 +65,7 @@ def linear_transitions_by_dist(start, end, dist_per_frame, offset=0):
 
 	dist = float(line_segment_len(start, end))
 	frames = int(round((dist - offset) / float(dist_per_frame), 8))
-	transitions = [(offset + f * dist_per_frame) / dist for f in range(frames + 1)]
+	transitions = (offset + np.arange(frames + 1) * dist_per_frame) / dist
 
 	return transitions
 
@@ -85,10 +86,11 @@ def linear_interpolation(start, end, transitions):
 		list: A list of (x, y) integer pixel coordinates
 	"""
 
-	x = [int(start[0] + t * (end[0] - start[0])) for t in transitions]
-	y = [int(start[1] + t * (end[1] - start[1])) for t in transitions]
+	t = np.asarray(transitions, dtype=np.float64)
+	x = (start[0] + t * (end[0] - start[0])).astype(np.int64)
+	y = (start[1] + t * (end[1] - start[1])).astype(np.int64)
 
-	return list(zip(x, y))
+	return list(zip(x.tolist(), y.tolist()))
 
 
 def bezier_length(start, ctrl, end):
@@ -120,6 +122,107 @@ def bezier_length(start, ctrl, end):
 	return (n1 + n2) / float(d)
 
 
+def _bezier_speed_coeffs(start, ctrl, end):
+	# Gets the coefficients of the squared speed of a quadratic bezier curve, such that
+	# |B'(t)|^2 = A*t^2 + B*t + C (same coefficients as used by bezier_length)
+	ax = start[0] - 2 * ctrl[0] + end[0]
+	ay = start[1] - 2 * ctrl[1] + end[1]
+	bx = 2 * ctrl[0] - 2 * start[0]
+	by = 2 * ctrl[1] - 2 * start[1]
+	A = 4.0 * (ax ** 2 + ay ** 2)
+	B = 4.0 * (ax * bx + ay * by)
+	C = float(bx ** 2 + by ** 2)
+	return (A, B, C)
+
+
+def bezier_arc_length(start, ctrl, end, t):
+	"""Calculates the exact length along a quadratic bezier curve from its start point to
+	one or more transition values, using the closed-form integral of the curve's speed.
+
+	Unlike bezier_length, this remains accurate for curves whose control point is collinear
+	with their start and end points (including ones that double back on themselves).
+
+	Args:
+		start (tuple): The (x, y) coordinates of the bezier start point.
+		ctrl (tuple): The (x, y) coordinates of the bezier control point.
+		end (tuple): The (x, y) coordinates of the bezier end point.
+		t (float or :obj:`numpy.ndarray`): The transition value(s) between 0.0 (start point)
+			and 1.0 (end point) to calculate the arc length(s) for.
+
+	Returns:
+		float or :obj:`numpy.ndarray`: The length(s) along the curve in pixels.
+	"""
+	A, B, C = _bezier_speed_coeffs(start, ctrl, end)
+	t = np.asarray(t, dtype=np.float64)
+	if A <= 1e-12 * C:
+		# If control point is (almost) exactly between start & end, curve is a straight line
+		# traversed at constant speed
+		return np.sqrt(C) * t
+
+	# Substituting x = t + B/2A, the speed becomes sqrt(A) * sqrt(x^2 + k), which has the
+	# antiderivative (sqrt(A) / 2) * (x * sqrt(x^2 + k) + k * asinh(x / sqrt(k)))
+	h = B / (2.0 * A)
+	k = max((4.0 * A * C - B ** 2) / (4.0 * A ** 2), 0.0)
+
+	def antiderivative(x):
+		if k == 0:
+			return x * np.abs(x)
+		return x * np.sqrt(x ** 2 + k) + k * np.arcsinh(x / math.sqrt(k))
+
+	return (math.sqrt(A) / 2.0) * (antiderivative(t + h) - antiderivative(h))
+
+
+def bezier_arc_transitions(start, ctrl, end, dists, tolerance=0.001, max_iter=50):
+	"""Finds the transition values at which a quadratic bezier curve reaches a given set
+	of distances along its length, by numerically inverting its exact arc length.
+
+	Each transition is solved with Newton's method, falling back to bisection whenever
+	a Newton step would leave the range known to contain the solution, so the search
+	always converges (even on curves where the speed drops to zero). Distances past the
+	end of the curve are clamped to the end of the curve (transition = 1.0).
+
+	Args:
+		start (tuple): The (x, y) coordinates of the bezier start point.
+		ctrl (tuple): The (x, y) coordinates of the bezier control point.
+		end (tuple): The (x, y) coordinates of the bezier end point.
+		dists (:obj:`numpy.ndarray`): The distances along the curve (in pixels) to find
+			transition values for.
+		tolerance (float, optional): The maximum allowable error (in pixels) between the
+			arc length at each returned transition and its requested distance. Defaults
+			to 0.001 pixels.
+		max_iter (int, optional): The maximum number of solver iterations to perform.
+			Defaults to 50.
+
+	Returns:
+		:obj:`numpy.ndarray`: The transition values (between 0.0 and 1.0) for each distance.
+	"""
+	A, B, C = _bezier_speed_coeffs(start, ctrl, end)
+	total = float(bezier_arc_length(start, ctrl, end, 1.0))
+	target = np.clip(np.asarray(dists, dtype=np.float64), 0.0, total)
+	if total <= 0:
+		return np.zeros(len(target))
+
+	# Start from the transitions for a curve traversed at constant speed and iterate,
+	# narrowing the bracket known to contain each solution as we go
+	t = target / total
+	lo = np.zeros(len(target))
+	hi = np.ones(len(target))
+	for i in range(max_iter):
+		err = bezier_arc_length(start, ctrl, end, t) - target
+		done = np.abs(err) <= tolerance
+		if done.all():
+			break
+		lo = np.where(err < 0, t, lo)
+		hi = np.where(err > 0, t, hi)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			t_new = t - err / np.sqrt(A * t ** 2 + B * t + C)
+		bisect = ~np.isfinite(t_new) | (t_new <= lo) | (t_new >= hi)
+		t_new = np.where(bisect, (lo + hi) / 2.0, t_new)
+		t = np.where(done, t, t_new)
+
+	return t
+
+
 def bezier_bounds(start, ctrl, end):
 	"""Calculate and return the top-left and bottom-right coordinates of the
 	rectangle bounding a bezier.
@@ -143,15 +246,20 @@ def bezier_bounds(start, ctrl, end):
 	return [(min_x, min_y), (max_x, max_y)]
 
 
-def bezier_points(start, ctrl, end, points=100):
-	transitions = [i / float(points) for i in range(0, points + 1)]
+def _bezier_xy(start, ctrl, end, t):
+	# Evaluates a quadratic bezier curve at an array of transition values
 	ax, ay = (start[0] - ctrl[0], start[1] - ctrl[1])
 	bx, by = (end[0] - ctrl[0], end[1] - ctrl[1])
-	x = [ctrl[0] + ax * (1 - t) ** 2 + bx * t ** 2 for t in transitions]
-	y = [ctrl[1] + ay * (1 - t) ** 2 + by * t ** 2 for t in transitions]
+	x = ctrl[0] + ax * (1 - t) ** 2 + bx * t ** 2
+	y = ctrl[1] + ay * (1 - t) ** 2 + by * t ** 2
 	return (x, y)
 
 
+def bezier_points(start, ctrl, end, points=100):
+	transitions = np.arange(points + 1) / float(points)
+	return _bezier_xy(start, ctrl, end, transitions)
+
+
 def bezier_distmap(start, ctrl, end, res=200):
 	"""Creates a transition value to distance map for a given bezier curve, allowing for
 	the generation of transitions corresponding to appromixately equidistant points along
@@ -163,21 +271,37 @@ def bezier_distmap(start, ctrl, end, res=200):
 		ctrl (tuple): The (x, y) coordinates of the bezier control point.
 		res (int, optional): The resolution (in number of samples) of the distance map.
 			Defaults to 200 samples.
+
+	Returns:
+		:obj:`numpy.ndarray`: The cumulative distance along the curve at each sample.
 	"""
 
 	# Create t-to-distance map for approximating constant velocity
+	# NOTE: only the first 'res' of the 'res + 1' sampled points are used, which is a
+	# long-standing quirk kept for consistency with older versions of TraceLab
 	x, y = bezier_points(start, ctrl, end, points=res)
-	dist_map = [0.0]
-	total_dist = 0 # cumulative length of full curve
-	for i in range(0, res - 1):
-		dx = x[i + 1] - x[i]
-		dy = y[i + 1] - y[i]
-		total_dist += math.sqrt(dx ** 2 + dy ** 2)
-		dist_map.append(total_dist)
+	dx = np.diff(x[:res])
+	dy = np.diff(y[:res])
+	dist_map = np.zeros(res)
+	dist_map[1:] = np.cumsum(np.sqrt(dx ** 2 + dy ** 2))
 
 	return dist_map
 
 
+def _distmap_transitions(dist_map, seg_lens):
+	# Converts an array of distances along a bezier curve into their corresponding
+	# transition values, linearly interpolating between the samples of the distance map.
+	# Distances past the end of the map are clamped to the end of the map.
+	res = len(dist_map)
+	i = np.searchsorted(dist_map[1:], seg_lens, side='left')
+	found = i < (res - 1)
+	i = np.minimum(i, res - 2)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		t_diff = (seg_lens - dist_map[i]) / (dist_map[i + 1] - dist_map[i])
+	t = np.where(found, i + t_diff, res - 1)
+	return t / float(res - 1)
+
+
 def bezier_transitions(start, ctrl, end, velocity, fps=60):
 	"""Generates transition points along a given bezier curve for animating at a
 	constant velocity.
@@ -196,23 +320,12 @@ def bezier_transitions(start, ctrl, end, velocity, fps=60):
 	duration = total_dist / velocity
 	steps = int(round(duration / (1000.0 / fps)))
 	stepsize = total_dist / steps
-	transitions = []
-	for s in range(steps + 1):
-		seg_len = stepsize * s
-		for i in range(res):
-			if i == (res - 1):
-				t = i
-				break
-			elif dist_map[i + 1] >= seg_len:
-				t_diff = (seg_len - dist_map[i]) / (dist_map[i + 1] - dist_map[i])
-				t = i + t_diff
-				break
-		transitions.append(t / float(res - 1))
+	transitions = _distmap_transitions(dist_map, stepsize * np.arange(steps + 1))
 
 	return transitions
 
 
-def bezier_transitions_by_dist(start, ctrl, end, dist_per_frame, offset=0):
+def bezier_transitions_by_dist(start, ctrl, end, dist_per_frame, offset=0, tolerance=None):
 	"""Generates transition points along a given bezier curve for animating at a
 	constant velocity, moving at a constant distance (in pixels) per frame.
 
@@ -220,26 +333,28 @@ def bezier_transitions_by_dist(start, ctrl, end, dist_per_frame, offset=0):
 	of the curve (transition = 1.0) is included in the returned list, opting instead to match
 	the provided speed (dist_per_frame) as closely as possible. Additionally, a starting offset
 	can be specified defining the distance along the curve that the first transition should be.
+
+	If a tolerance (in pixels) is provided, transitions are found by inverting the exact arc
+	length of the curve (see :func:`bezier_arc_transitions`). Otherwise, they are approximated
+	using a 200-sample distance map as in older versions of TraceLab.
 	"""
+	dist = bezier_length(start, ctrl, end)
+	frames = int(round((dist - offset) / float(dist_per_frame), 8))
+	seg_lens = offset + np.arange(frames + 1) * dist_per_frame
+
+	return _bezier_dist_transitions(start, ctrl, end, seg_lens, tolerance)
+
+
+def _bezier_dist_transitions(start, ctrl, end, seg_lens, tolerance=None):
+	# Converts an array of distances along a bezier curve into transition values, either
+	# by inverting the curve's exact arc length or using the legacy distance map
+	if tolerance is not None:
+		return bezier_arc_transitions(start, ctrl, end, seg_lens, tolerance)
 
 	# Create t-to-distance map for approximating constant velocity
 	res = 200
 	dist_map = bezier_distmap(start, ctrl, end, res)
-
-	dist = bezier_length(start, ctrl, end)
-	frames = int(round((dist - offset) / float(dist_per_frame), 8))
-	transitions = []
-	for f in range(frames + 1):
-		seg_len = offset + f * dist_per_frame
-		for i in range(res):
-			if i == (res - 1):
-				t = i
-				break
-			elif dist_map[i + 1] >= seg_len:
-				t_diff = (seg_len - dist_map[i]) / (dist_map[i + 1] - dist_map[i])
-				t = i + t_diff
-				break
-		transitions.append(t / float(res - 1))
+	transitions = _distmap_transitions(dist_map, seg_lens)
 
 	return transitions
 
@@ -261,9 +376,175 @@ def bezier_interpolation(start, end, ctrl, transitions):
 	"""
 
 	# Actually compute points along bezier curve for given points
-	ax, ay = (start[0] - ctrl[0], start[1] - ctrl[1])
-	bx, by = (end[0] - ctrl[0], end[1] - ctrl[1])
-	x = [int(ctrl[0] + ax * (1 - t) ** 2 + bx * t ** 2) for t in transitions]
-	y = [int(ctrl[1] + ay * (1 - t) ** 2 + by * t ** 2) for t in transitions]
+	t = np.asarray(transitions, dtype=np.float64)
+	x, y = _bezier_xy(start, ctrl, end, t)
+
+	return list(zip(x.astype(np.int64).tolist(), y.astype(np.int64).tolist()))
+
+
+def segments_bounds(segments):
+	"""Calculates the top-left and bottom-right coordinates of the rectangle bounding a
+	list of linear and/or bezier figure segments.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments.
+
+	Returns:
+		tuple: The ((min_x, min_y), (max_x, max_y)) bounds of the segments.
+	"""
+	xs, ys = ([], [])
+	for curve, points in segments:
+		if curve:
+			start, end, ctrl = points
+			(x1, y1), (x2, y2) = bezier_bounds(start, ctrl, end)
+		else:
+			start, end = points
+			x1, x2 = sorted([start[0], end[0]])
+			y1, y2 = sorted([start[1], end[1]])
+		xs += [x1, x2]
+		ys += [y1, y2]
+
+	return ((min(xs), min(ys)), (max(xs), max(ys)))
+
+
+def segment_lengths(segments):
+	"""Calculates the length (in pixels) of each segment in a list of linear and/or bezier
+	figure segments.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments, where 'points' is a
+			(start, end) tuple for lines and a (start, end, ctrl) tuple for curves.
+
+	Returns:
+		list: The length of each segment in pixels.
+	"""
+	lengths = []
+	for curve, points in segments:
+		if curve:
+			start, end, ctrl = points
+			lengths.append(bezier_length(start, ctrl, end))
+		else:
+			start, end = points
+			lengths.append(line_segment_len(start, end))
+
+	return lengths
+
+
+def segments_length(segments):
+	"""Calculates the total length (in pixels) of a figure made up of a list of linear and/or
+	bezier segments.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments, where 'points' is a
+			(start, end) tuple for lines and a (start, end, ctrl) tuple for curves.
+
+	Returns:
+		float: The full length of the figure in pixels.
+	"""
+	length = 0
+	for seg_len in segment_lengths(segments):
+		length += seg_len
 
-	return list(zip(x, y))
+	return length
+
+
+def mirror_segments(segments, screen_x):
+	"""Mirrors a list of linear and/or bezier figure segments horizontally across the
+	vertical midline of the screen.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments.
+		screen_x (int): The width of the screen in pixels.
+
+	Returns:
+		list: A list of the mirrored [curve, points] figure segments.
+	"""
+	mirrored = []
+	for curve, points in segments:
+		mirrored.append([curve, tuple((screen_x - p[0], p[1]) for p in points)])
+
+	return mirrored
+
+
+def segments_to_frames(segments, duration, fps=60, path_len=None, tolerance=None):
+	"""Converts linear/bezier segments comprising a shape into a list of (x, y) pixel
+	coordinates representing the frames of the shape animation at a constant velocity.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments.
+		duration (float): The duration the tracing motion in milliseconds.
+		fps (float, optional): The frame rate at which to render the frames.
+		path_len (float, optional): The total length of the segments in pixels. Will be
+			calculated from the segments if not provided.
+		tolerance (float, optional): The maximum spacing error (in pixels) allowed for
+			frames on curved segments. If None (the default), frame positions on curves
+			are approximated using the legacy 200-sample distance map.
+
+	Returns:
+		list: A list of (x, y) integer pixel coordinates
+	"""
+	return segments_to_frame_sets(segments, [(duration, fps)], path_len, tolerance)[0]
+
+
+def segments_to_frame_sets(segments, timings, path_len=None, tolerance=None):
+	"""Converts linear/bezier segments comprising a shape into multiple sets of animation
+	frames at once, one for each of a given list of durations and frame rates.
+
+	The results are identical to calling :func:`segments_to_frames` separately for each
+	duration and frame rate, but the length, distance map, and interpolation of each
+	segment are only computed once for all frame sets, making this much faster than
+	interpolating each frame set individually.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments.
+		timings (list): A list of (duration, fps) tuples, each specifying the duration
+			(in milliseconds) and frame rate of a set of frames to interpolate.
+		path_len (float, optional): The total length of the segments in pixels. Will be
+			calculated from the segments if not provided.
+		tolerance (float, optional): The maximum spacing error (in pixels) allowed for
+			frames on curved segments. If None (the default), frame positions on curves
+			are approximated using the legacy 200-sample distance map.
+
+	Returns:
+		list: A list of frame sets (each a list of (x, y) integer pixel coordinates), in
+		the same order as the provided timings.
+	"""
+	if path_len is None:
+		path_len = segments_length(segments)
+
+	dists_per_frame = []
+	for duration, fps in timings:
+		total_frames = int(round(duration / (1000.0 / fps)))
+		dists_per_frame.append(path_len / total_frames)
+
+	offsets = [0] * len(timings)
+	frame_sets = [[] for t in timings]
+	for curve, points in segments:
+
+		if curve:
+			start, end, ctrl = points
+			dist = bezier_length(start, ctrl, end)
+		else:
+			start, end = points
+			dist = float(line_segment_len(start, end))
+
+		# Get the distances along the segment for the frames of every frame set
+		seg_lens = []
+		for i, dist_per_frame in enumerate(dists_per_frame):
+			frames = int(round((dist - offsets[i]) / float(dist_per_frame), 8))
+			seg_lens.append(offsets[i] + np.arange(frames + 1) * dist_per_frame)
+			offsets[i] = (frames + 1) * dist_per_frame - (dist - offsets[i])
+
+		# Interpolate the frames for all frame sets together, then split them up again
+		all_lens = np.concatenate(seg_lens)
+		if curve:
+			transitions = _bezier_dist_transitions(start, ctrl, end, all_lens, tolerance)
+			seg_frames = bezier_interpolation(start, end, ctrl, transitions)
+		else:
+			seg_frames = linear_interpolation(start, end, all_lens / dist)
+		i = 0
+		for frames, lens in zip(frame_sets, seg_lens):
+			frames += seg_frames[i:(i + len(lens))]
+			i += len(lens)
+
+	return frame_sets
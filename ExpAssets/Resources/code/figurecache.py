@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""A persistent on-disk cache for pre-generated figures.
+
+Loading a pre-generated figure involves reading it from its archive, scaling it to the
+current screen resolution, mirroring it for left-handed participants, and interpolating
+its animation frames for every animation duration used in the session. Since the result
+of all this only depends on the figure archive itself and a handful of runtime settings,
+the scaled segments and interpolated frames are cached in the project's Local folder so
+that subsequent launches on the same machine can skip straight to the finished figure.
+
+Each cache file is keyed by a hash of the source archive's contents, the screen
+resolution, the participant's handedness, the screen refresh rate, the frame spacing
+tolerance, and the cache format version, so modifying a figure archive or running on a
+different display automatically invalidates any cached copies of it. Cached copies made
+from outdated versions of a figure archive are deleted the next time the figure is cached.
+
+"""
+
+import os
+import io
+import json
+import hashlib
+
+import numpy as np
+
+from figureio import figure_to_tlfb, tlfb_to_figure, archive_hash
+
+
+CACHE_VERSION = 2  # increment whenever figure scaling or interpolation changes
+
+
+def cache_key(path, screen_res, handedness, fps, tolerance=None):
+	"""Generates the key for the cached copy of a figure under a given set of runtime
+	parameters.
+
+	Keys are in the format '[archive]-[params]', where 'archive' is derived from the
+	contents of the figure archive and 'params' is derived from the runtime parameters
+	and cache version.
+
+	Args:
+		path (str): The path of the figure archive, with or without the '.zip' extension.
+		screen_res (tuple): The (width, height) of the screen in pixels.
+		handedness (str): The handedness of the participant ('l' or 'r'), or None.
+		fps (float): The refresh rate of the screen.
+		tolerance (float, optional): The spacing tolerance (in pixels) used when
+			interpolating frames for curved segments, or None if using the legacy method.
+
+	Returns:
+		str: The cache key for the figure.
+	"""
+	params = [
+		CACHE_VERSION, int(screen_res[0]), int(screen_res[1]), handedness == "l",
+		round(float(fps), 3), tolerance
+	]
+	params_hash = hashlib.sha1(json.dumps(params).encode('utf-8')).hexdigest()
+	return "{0}-{1}".format(archive_hash(path)[:12], params_hash[:8])
+
+
+class FigureCache(object):
+	"""An on-disk cache of scaled and interpolated pre-generated figures.
+
+	Args:
+		cache_dir (str): The folder in which to store cached figures. Will be created
+			if it doesn't already exist.
+
+	"""
+	def __init__(self, cache_dir):
+		self.cache_dir = cache_dir
+		if not os.path.exists(cache_dir):
+			os.makedirs(cache_dir)
+
+	def _cache_path(self, figure, key):
+		return os.path.join(self.cache_dir, "{0}_{1}.npz".format(figure, key))
+
+	def load(self, figure, key):
+		"""Loads a cached figure, if a valid one exists.
+
+		Args:
+			figure (str): The name of the figure.
+			key (str): The cache key for the figure (see :func:`cache_key`).
+
+		Returns:
+			dict or None: A dict containing the scaled 'points' and 'segments' of the
+			figure and a dict of its interpolated 'frames' for each cached animation
+			duration, or None if no valid cached copy was found.
+		"""
+		path = self._cache_path(figure, key)
+		if not os.path.exists(path):
+			return None
+
+		try:
+			with np.load(path, allow_pickle=False) as cached:
+				meta = json.loads(cached['meta'].tobytes().decode('utf-8'))
+				if meta['version'] != CACHE_VERSION or meta['key'] != key:
+					return None
+				points, segments, _ = tlfb_to_figure(cached['figure'].tobytes())
+				frames = {}
+				for i, duration in enumerate(meta['durations']):
+					arr = cached['frames_{0}'.format(i)]
+					frames[duration] = [tuple(f) for f in arr.tolist()]
+		except (IOError, ValueError, KeyError):
+			# If cache file is corrupt or incomplete, just treat it as missing
+			return None
+
+		return {'points': points, 'segments': segments, 'frames': frames}
+
+	def save(self, figure, key, points, segments, frames, screen_res):
+		"""Writes a scaled and interpolated figure to the cache, replacing any stale
+		cached copies of the same figure.
+
+		Args:
+			figure (str): The name of the figure.
+			key (str): The cache key for the figure (see :func:`cache_key`).
+			points (list): The scaled (x, y) points of the figure.
+			segments (list): The scaled [curve, points] segments of the figure.
+			frames (dict): The interpolated animation frames of the figure, in the format
+				{duration: frames}.
+			screen_res (tuple): The (width, height) of the screen in pixels.
+		"""
+		durations = sorted(frames.keys())
+		meta = {'version': CACHE_VERSION, 'key': key, 'durations': durations}
+		arrays = {
+			'meta': np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+			'figure': np.frombuffer(figure_to_tlfb(points, segments, screen_res), np.uint8),
+		}
+		for i, duration in enumerate(durations):
+			arrays['frames_{0}'.format(i)] = np.asarray(frames[duration], dtype=np.int32)
+
+		# Write to a temporary file first so an interrupted write can't leave a corrupt file
+		path = self._cache_path(figure, key)
+		tmp_path = path + ".tmp"
+		with io.open(tmp_path, 'wb') as f:
+			np.savez(f, **arrays)
+		os.replace(tmp_path, path)
+
+		# Remove any cached copies of the figure made from older versions of its archive
+		prefix = figure + "_"
+		archive_id = key.split("-")[0]
+		for f in os.listdir(self.cache_dir):
+			if not (f.startswith(prefix) and f.endswith(".npz")):
+				continue
+			old_key = f[len(prefix):-4]
+			if "-" in old_key and "_" not in old_key and old_key.split("-")[0] != archive_id:
+				os.remove(os.path.join(self.cache_dir, f))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""A manifest index of the pre-generated figures in a figure library.
+
+Checking which figures exist in a figure folder (and what they look like) normally
+means opening every archive in it, which is slow for large figure libraries on
+networked drives. Instead, a FigureIndex keeps a small JSON manifest in the figure
+folder that records the basic properties of each figure archive, and on refresh only
+re-reads archives that were added or modified since the manifest was last updated.
+
+To print the index for a figure folder (building or updating it if needed), run:
+
+	python figureindex.py ExpAssets/Resources/figures
+
+"""
+
+import os
+import io
+import json
+import zipfile
+
+from figureio import read_figure, archive_hash
+from drawingutils import segments_length, segments_bounds
+
+
+INDEX_FILE = "figure_index.json"
+INDEX_VERSION = 1
+
+
+def figure_info(path):
+	"""Reads a figure archive and summarizes its basic properties for the figure index.
+
+	All coordinates and lengths are in the figure's source resolution.
+
+	Args:
+		path (str): The path of the figure archive, including the '.zip' extension.
+
+	Returns:
+		dict: The 'name', 'segments' (segment count), 'path_length', 'bounds' (as
+		[[min_x, min_y], [max_x, max_y]]), 'screen_res', and 'checksum' (SHA-1 of the
+		archive) of the figure.
+	"""
+	points, segments, figure_res = read_figure(path)
+	(min_x, min_y), (max_x, max_y) = segments_bounds(segments)
+
+	return {
+		'name': os.path.basename(path)[:-4],
+		'segments': len(segments),
+		'path_length': round(segments_length(segments), 2),
+		'bounds': [[min_x, min_y], [max_x, max_y]],
+		'screen_res': list(figure_res),
+		'checksum': archive_hash(path),
+	}
+
+
+class FigureIndex(object):
+	"""An incrementally-updated manifest of the figure archives in a figure folder.
+
+	Figures are indexed by name (i.e. their archive's file name without the '.zip'),
+	and each entry contains the information returned by :func:`figure_info` along with
+	the size and modification time of the archive when it was indexed.
+
+	Args:
+		fig_dir (str): The path of the folder containing the figure archives.
+		refresh (bool, optional): Whether to update the index for any added, modified,
+			or removed figures on creation. Defaults to True.
+
+	"""
+	def __init__(self, fig_dir, refresh=True):
+		self.fig_dir = fig_dir
+		self.index_path = os.path.join(fig_dir, INDEX_FILE)
+		self.figures = {}
+		self._load()
+		if refresh:
+			self.refresh()
+
+	def __contains__(self, name):
+		return name in self.figures
+
+	def __getitem__(self, name):
+		return self.figures[name]
+
+	def _load(self):
+		try:
+			with io.open(self.index_path, 'r', encoding='utf-8') as f:
+				index = json.load(f)
+			if index.get('version') == INDEX_VERSION:
+				self.figures = index['figures']
+		except (IOError, ValueError, KeyError):
+			# If no index or index unreadable, start from scratch
+			self.figures = {}
+
+	def _save(self):
+		# Write to a temporary file first so an interrupted write can't leave a corrupt file
+		tmp_path = self.index_path + ".tmp"
+		with io.open(tmp_path, 'w', encoding='utf-8') as f:
+			json.dump({'version': INDEX_VERSION, 'figures': self.figures}, f, indent=1)
+		os.replace(tmp_path, self.index_path)
+
+	def refresh(self):
+		"""Updates the index for any figure archives that have been added, modified, or
+		removed since the index was last updated, saving the index if anything changed.
+
+		Returns:
+			list: The names of any figures that were added or re-indexed.
+		"""
+		updated = []
+		found = set()
+		for entry in os.scandir(self.fig_dir):
+			if not (entry.is_file() and entry.name.endswith(".zip")):
+				continue
+			name = entry.name[:-4]
+			found.add(name)
+			stat = entry.stat()
+			info = self.figures.get(name)
+			if info and info['mtime'] == stat.st_mtime and info['size'] == stat.st_size:
+				continue
+			try:
+				info = figure_info(entry.path)
+			except (IOError, KeyError, ValueError, SyntaxError, zipfile.BadZipFile):
+				# Skip archives that aren't valid figures
+				continue
+			info['mtime'] = stat.st_mtime
+			info['size'] = stat.st_size
+			self.figures[name] = info
+			updated.append(name)
+
+		removed = [name for name in self.figures if name not in found]
+		for name in removed:
+			del self.figures[name]
+
+		if updated or removed:
+			self._save()
+
+		return updated
+
+	def missing(self, names):
+		"""Checks a list of figure names against the index.
+
+		Args:
+			names (list): The names of the figures to look for.
+
+		Returns:
+			list: The names of any figures not found in the index.
+		"""
+		return [name for name in names if name not in self.figures]
+
+	@property
+	def names(self):
+		"""list: The names of all figures in the index, in alphabetical order.
+		"""
+		return sorted(self.figures.keys())
+
+
+if __name__ == "__main__":
+
+	import sys
+
+	fig_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join("ExpAssets", "Resources", "figures")
+	index = FigureIndex(fig_dir)
+	row = "{0:<28} {1:>8} {2:>12} {3:>24} {4:>11}"
+	print(row.format("figure", "segments", "path length", "bounds", "resolution"))
+	for name in index.names:
+		f = index[name]
+		bounds = "({0}, {1})-({2}, {3})".format(*[int(v) for v in f['bounds'][0] + f['bounds'][1]])
+		res = "{0}x{1}".format(*f['screen_res'])
+		print(row.format(name, f['segments'], f['path_length'], bounds, res))
@@ -0,0 +1,698 @@
+# -*- coding: utf-8 -*-
+
+"""Readers and writers for TraceLab figure files.
+
+Pre-generated figures are stored as .zip archives containing a text .tlf file (a
+Python repr of every attribute of the figure at the time it was captured) along with
+a few preview files. Since the only things actually needed to reconstruct a figure
+are its points, its raw segments, and the screen resolution it was generated at, this
+module also defines a compact binary figure format (.tlfb) holding just those as typed
+arrays, which can be added to existing archives using the converter at the bottom of
+this file:
+
+	python figureio.py ExpAssets/Resources/figures
+
+Running the same command with the '--bench' flag compares the load times and memory
+use of the different figure formats for every archive in the folder instead.
+
+Similarly, participants' tracings and the animation frames shown on each trial can be
+saved in a compact delta-encoded binary format (.tltb for tracings and .tlfab for
+frames) instead of as text. Text copies of these can be added to every trial archive in
+a data folder for use with older analysis tools by running:
+
+	python figureio.py path/to/data --export-traces
+
+This module intentionally has no dependencies on KLibs so that it can be used by
+standalone tools and analysis scripts.
+
+"""
+
+import os
+import io
+import ast
+import struct
+import hashlib
+import zipfile
+
+import numpy as np
+
+
+DEFAULT_RES = (1920, 1080)  # resolution assumed for .tlf files without a 'screen_res'
+TLF_KEYS = ('raw_segments', 'points', 'screen_res')
+_CHUNK_SIZE = 64 * 1024
+
+FIGURE_STORE = "figure_store"  # folder of content-addressed figure files in a data folder
+FIGURE_REF_EXT = ".tlfr"  # trial archive file referencing a figure in the figure store
+
+TLFB_MAGIC = b"TLFB"
+TLFB_VERSION = 1
+
+# magic, version, reserved, res_x, res_y, num_points, num_segments
+_TLFB_HEADER = struct.Struct("<4sHHIIII")
+
+TLTB_MAGIC = b"TLTB"
+TLTB_VERSION = 1
+TLTB_TICKS = 1000000  # timestamps are stored in whole microseconds
+TLTB_EXTS = {".tlt": ".tltb", ".tlf": ".tlfab"}  # binary versions of trial sample files
+
+# magic, version, flags, num_samples, ticks per second, first x, first y, first time,
+# coordinate delta type, time delta type
+_TLTB_HEADER = struct.Struct("<4sHHIIiiqBB2x")
+_TLTB_TIMES = 1  # flag: samples have timestamps
+_TLTB_GAPS = 2  # flag: some samples have no timestamp
+_DELTA_TYPES = ['<i1', '<i2', '<i4', '<i8']
+
+
+def _as_number(n):
+	# Restores integer values from float64 storage so that decoded figures compare
+	# equal to (and scale identically to) figures parsed from legacy .tlf text
+	n = float(n)
+	return int(n) if n.is_integer() else n
+
+
+def normalize_segments(segments):
+	"""Cleans up raw segments read from a figure file, handling the quirks of figures
+	generated by older versions of TraceLab.
+
+	Very old .tlf files have an extra integer at the end of each segment's list of
+	points and mark every segment as a curve, so here we drop any trailing integers and
+	re-identify segments as lines or curves based on their number of points.
+
+	Args:
+		segments (list): A list of [curve, points] segments read from a figure file.
+
+	Returns:
+		list: A list of [curve, (start, end[, ctrl])] segments.
+	"""
+	normalized = []
+	for curve, points in segments:
+		points = points[:-1] if isinstance(points[-1], int) else points
+		normalized.append([len(points) == 3, tuple(tuple(p) for p in points)])
+
+	return normalized
+
+
+def figure_to_tlfb(points, segments, screen_res=DEFAULT_RES):
+	"""Encodes the points and segments of a figure into the binary .tlfb format.
+
+	The format consists of a fixed-size little-endian header followed by three
+	contiguous arrays: the figure points (int32, N x 2), the segment coordinates
+	(float64, M x 3 x 2, with the control point zeroed for linear segments), and the
+	segment types (uint8, M, 1 for curves and 0 for lines).
+
+	Args:
+		points (list): A list of (x, y) figure points.
+		segments (list): A list of normalized [curve, points] figure segments.
+		screen_res (tuple, optional): The (width, height) resolution of the screen the
+			figure was generated at.
+
+	Returns:
+		bytes: The encoded figure.
+	"""
+	pts = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+	seg_pts = np.zeros((len(segments), 3, 2), dtype=np.float64)
+	seg_types = np.zeros(len(segments), dtype=np.uint8)
+	for i, (curve, s) in enumerate(segments):
+		seg_pts[i, :len(s)] = s
+		seg_types[i] = 1 if curve else 0
+
+	header = _TLFB_HEADER.pack(
+		TLFB_MAGIC, TLFB_VERSION, 0, int(screen_res[0]), int(screen_res[1]),
+		len(pts), len(segments)
+	)
+	out = [header, pts.astype('<i4').tobytes(), seg_pts.astype('<f8').tobytes()]
+	out.append(seg_types.tobytes())
+
+	return b"".join(out)
+
+
+def tlfb_arrays(buf):
+	"""Maps the contents of an encoded .tlfb figure to numpy arrays without copying.
+
+	Args:
+		buf (bytes): The contents of a .tlfb file.
+
+	Returns:
+		tuple: The figure's points (int32, N x 2), segment coordinates (float64, M x 3 x
+		2), segment types (uint8, M), and (width, height) source resolution.
+	"""
+	magic, version, _, res_x, res_y, n_pts, n_segs = _TLFB_HEADER.unpack_from(buf, 0)
+	if magic != TLFB_MAGIC:
+		raise ValueError("Not a valid .tlfb figure file.")
+	if version > TLFB_VERSION:
+		e = "Unsupported .tlfb version ({0}); please update TraceLab to load this figure."
+		raise ValueError(e.format(version))
+
+	offset = _TLFB_HEADER.size
+	pts = np.frombuffer(buf, dtype='<i4', count=n_pts * 2, offset=offset)
+	offset += pts.nbytes
+	seg_pts = np.frombuffer(buf, dtype='<f8', count=n_segs * 6, offset=offset)
+	offset += seg_pts.nbytes
+	seg_types = np.frombuffer(buf, dtype=np.uint8, count=n_segs, offset=offset)
+
+	return (pts.reshape(-1, 2), seg_pts.reshape(-1, 3, 2), seg_types, (res_x, res_y))
+
+
+def tlfb_to_figure(buf):
+	"""Decodes an encoded .tlfb figure into the same Python structures that would be
+	read from an equivalent .tlf file.
+
+	Args:
+		buf (bytes): The contents of a .tlfb file.
+
+	Returns:
+		tuple: The figure's points, raw segments, and [width, height] source resolution.
+	"""
+	pts, seg_pts, seg_types, res = tlfb_arrays(buf)
+
+	points = [tuple(p) for p in pts.tolist()]
+	segments = []
+	for curve, s in zip(seg_types.tolist(), seg_pts.tolist()):
+		s = s if curve else s[:2]
+		segments.append([bool(curve), tuple((_as_number(x), _as_number(y)) for x, y in s)])
+
+	return (points, segments, list(res))
+
+
+def _pack_deltas(values):
+	# Delta-encodes an integer array using the smallest integer type that fits
+	deltas = np.diff(values, axis=0)
+	for code, dtype in enumerate(_DELTA_TYPES):
+		info = np.iinfo(dtype)
+		if deltas.size == 0 or (deltas.min() >= info.min and deltas.max() <= info.max):
+			return (code, deltas.astype(dtype).tobytes())
+
+
+def trace_to_tltb(samples):
+	"""Encodes a list of (x, y) or (x, y, time) samples (e.g. a participant's tracing or
+	the frames of a figure animation) into the compact binary .tltb format.
+
+	The format consists of a fixed-size little-endian header (containing the first
+	sample) followed by the differences between consecutive x/y coordinates and
+	timestamps, each stored using the smallest integer type that fits them, and a
+	bitmask of which samples have timestamps if any are None. Coordinates must be whole
+	pixels, and timestamps (in seconds) are rounded to the nearest microsecond.
+
+	Args:
+		samples (list): The (x, y) or (x, y, time) samples to encode.
+
+	Returns:
+		bytes: The encoded samples.
+
+	Raises:
+		ValueError: If any of the coordinates aren't whole numbers.
+	"""
+	n = len(samples)
+	dims = len(samples[0]) if n else 2
+	xy = np.array([s[:2] for s in samples], dtype=np.float64).reshape(-1, 2)
+	if not np.array_equal(xy, np.round(xy)):
+		raise ValueError("Sample coordinates must be whole pixels.")
+	xy = xy.astype(np.int64)
+
+	flags = 0
+	mask = b""
+	ticks = np.zeros(n, dtype=np.int64)
+	if dims > 2:
+		flags |= _TLTB_TIMES
+		has_time = np.array([s[2] is not None for s in samples], dtype=bool)
+		times = np.array([s[2] if s[2] is not None else np.nan for s in samples])
+		ticks = np.round(times * TLTB_TICKS)
+		# Missing timestamps take the value of the one before so they don't affect deltas
+		if not has_time.all():
+			flags |= _TLTB_GAPS
+			mask = np.packbits(has_time).tobytes()
+			idx = np.where(has_time, np.arange(n), 0)
+			np.maximum.accumulate(idx, out=idx)
+			ticks = np.where(has_time[idx], ticks[idx], 0)
+		ticks = ticks.astype(np.int64)
+
+	xy_type, xy_deltas = _pack_deltas(xy)
+	t_type, t_deltas = _pack_deltas(ticks)
+	x0, y0 = xy[0] if n else (0, 0)
+	header = _TLTB_HEADER.pack(
+		TLTB_MAGIC, TLTB_VERSION, flags, n, TLTB_TICKS, int(x0), int(y0),
+		int(ticks[0]) if n else 0, xy_type, t_type
+	)
+	return b"".join([header, xy_deltas, t_deltas, mask])
+
+
+def tltb_arrays(buf):
+	"""Decodes an encoded .tltb file into numpy arrays.
+
+	Args:
+		buf (bytes): The contents of a .tltb file.
+
+	Returns:
+		tuple: The (x, y) coordinates of the samples (int64, N x 2), and their
+		timestamps in seconds (float64, N, with NaN for missing timestamps) or None if
+		the samples don't have timestamps.
+	"""
+	header = _TLTB_HEADER.unpack_from(buf, 0)
+	magic, version, flags, n, ticks_per_sec, x0, y0, t0, xy_type, t_type = header
+	if magic != TLTB_MAGIC:
+		raise ValueError("Not a valid .tltb file.")
+	if version > TLTB_VERSION:
+		e = "Unsupported .tltb version ({0}); please update TraceLab to load this file."
+		raise ValueError(e.format(version))
+
+	offset = _TLTB_HEADER.size
+	count = max(n - 1, 0)
+	xy_deltas = np.frombuffer(buf, _DELTA_TYPES[xy_type], count * 2, offset)
+	offset += xy_deltas.nbytes
+	t_deltas = np.frombuffer(buf, _DELTA_TYPES[t_type], count, offset)
+	offset += t_deltas.nbytes
+
+	xy = np.zeros((n, 2), dtype=np.int64)
+	if n:
+		xy[0] = (x0, y0)
+		np.cumsum(xy_deltas.reshape(-1, 2), axis=0, out=xy[1:])
+		xy[1:] += xy[0]
+
+	if not flags & _TLTB_TIMES:
+		return (xy, None)
+	ticks = np.zeros(n, dtype=np.int64)
+	if n:
+		ticks[0] = t0
+		np.cumsum(t_deltas, out=ticks[1:])
+		ticks[1:] += t0
+	times = ticks / float(ticks_per_sec)
+	if flags & _TLTB_GAPS:
+		mask = np.frombuffer(buf, np.uint8, (n + 7) // 8, offset)
+		has_time = np.unpackbits(mask)[:n].astype(bool)
+		times[~has_time] = np.nan
+
+	return (xy, times)
+
+
+def tltb_to_trace(buf):
+	"""Decodes an encoded .tltb file into the same list of samples that would be read from
+	the equivalent text file.
+
+	Args:
+		buf (bytes): The contents of a .tltb file.
+
+	Returns:
+		list: The decoded (x, y) or (x, y, time) samples, with None for any missing
+		timestamps.
+	"""
+	xy, times = tltb_arrays(buf)
+	if times is None:
+		return [tuple(p) for p in xy.tolist()]
+	times = [None if t != t else t for t in times.tolist()]
+	return [(x, y, t) for (x, y), t in zip(xy.tolist(), times)]
+
+
+def scan_tlf(f, keys=TLF_KEYS, chunk_size=_CHUNK_SIZE):
+	"""Scans an open legacy .tlf file for the lines defining a given set of attributes,
+	yielding the raw (undecoded) value of each one as it is found.
+
+	Since the .tlf lines for attributes like 'frames' and 'segments' can be several
+	megabytes long, only the key prefix of each line is checked and the remainder of
+	any unwanted lines is skipped over chunk by chunk without being decoded or split.
+	Scanning stops as soon as all requested keys have been found.
+
+	Args:
+		f (file): A binary file object for a .tlf file.
+		keys (iterable, optional): The names of the attributes to read. Defaults to the
+			attributes needed to reconstruct a figure.
+		chunk_size (int, optional): The number of bytes to read from the file at a time.
+
+	Yields:
+		tuple: The name of each requested attribute found and its value as bytes.
+	"""
+	prefixes = [(k.encode('utf-8') + b" = ", k) for k in keys]
+	prefix_len = max(len(p) for p, k in prefixes)
+	remaining = set(keys)
+
+	buf = b""
+	pos = 0
+	eof = False
+	while remaining:
+		# Make sure enough of the next line is buffered to identify its key
+		if len(buf) - pos < prefix_len and not eof:
+			chunk = f.read(chunk_size)
+			eof = len(chunk) == 0
+			buf = buf[pos:] + chunk
+			pos = 0
+			continue
+		if pos >= len(buf):
+			break
+
+		key, start = (None, pos)
+		for prefix, k in prefixes:
+			if buf.startswith(prefix, pos):
+				key, start = (k, pos + len(prefix))
+				break
+
+		# Find the end of the line, keeping the chunks in between only if the key is wanted
+		parts = []
+		end = buf.find(b"\n", pos)
+		while end < 0:
+			if key:
+				parts.append(buf[start:])
+			buf = f.read(chunk_size)
+			start = 0
+			if not buf:
+				eof = True
+				break
+			end = buf.find(b"\n")
+
+		if key:
+			parts.append(buf[start:end] if end >= 0 else b"")
+			remaining.discard(key)
+			yield (key, b"".join(parts))
+		pos = end + 1 if end >= 0 else len(buf)
+
+
+def read_tlf(f):
+	"""Reads the points, raw segments, and screen resolution of a figure from an open
+	legacy .tlf file.
+
+	Args:
+		f (file): A binary file object for a .tlf file.
+
+	Returns:
+		tuple: The figure's points, raw segments, and [width, height] source resolution.
+	"""
+	attrs = {}
+	for key, value in scan_tlf(f, TLF_KEYS):
+		attrs[key] = ast.literal_eval(value.decode('utf-8').strip())
+
+	segments = normalize_segments(attrs['raw_segments'])
+	figure_res = attrs.get('screen_res', list(DEFAULT_RES))
+
+	return (attrs['points'], segments, figure_res)
+
+
+def find_archive_member(archive, figure, ext):
+	"""Finds the name of a given figure file within an open figure archive.
+
+	Figure files can be either at the root of the archive or in a folder with the same
+	name as the figure.
+
+	Args:
+		archive (:obj:`zipfile.ZipFile`): The open figure archive.
+		figure (str): The name of the figure.
+		ext (str): The extension (or suffix) of the file to find, e.g. '.tlf'.
+
+	Returns:
+		str or None: The name of the file within the archive, or None if not found.
+	"""
+	f = figure + ext
+	names = archive.namelist()
+	if f in names:
+		return f
+	elif figure + "/" + f in names:
+		return figure + "/" + f
+	return None
+
+
+def read_figure(path):
+	"""Reads the points, raw segments, and source resolution of a figure from a figure
+	archive, using the binary .tlfb version of the figure if the archive contains one.
+
+	Note that the returned coordinates are in the figure's source resolution and need to
+	be scaled to the current screen resolution before use.
+
+	Args:
+		path (str): The path of the figure archive, with or without the '.zip' extension.
+
+	Returns:
+		tuple: The figure's points, raw segments, and [width, height] source resolution.
+	"""
+	path = path[:-4] if path.endswith(".zip") else path
+	figure = os.path.split(path)[-1]
+
+	with zipfile.ZipFile(path + ".zip") as fig_archive:
+		tlfb = find_archive_member(fig_archive, figure, ".tlfb")
+		if tlfb:
+			return tlfb_to_figure(fig_archive.read(tlfb))
+		tlf = find_archive_member(fig_archive, figure, ".tlf")
+		if not tlf:
+			raise IOError("No figure file found in '{0}.zip'.".format(path))
+		with fig_archive.open(tlf) as f:
+			return read_tlf(f)
+
+
+def archive_hash(path):
+	"""Computes the SHA-1 hash of the contents of a figure archive.
+
+	Args:
+		path (str): The path of the figure archive, with or without the '.zip' extension.
+
+	Returns:
+		str: The hex digest of the archive's contents.
+	"""
+	path = path if path.endswith(".zip") else path + ".zip"
+	sha = hashlib.sha1()
+	with io.open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b""):
+			sha.update(chunk)
+
+	return sha.hexdigest()
+
+
+def read_trial_file(path, ext):
+	"""Reads a file from a trial archive, following the archive's reference to the figure
+	store if the file was saved there instead of in the archive itself.
+
+	Trial archives written with the figure store enabled only contain the trial-specific
+	files (e.g. the .tlf and .tlt), along with a .tlfr file containing the hash of the
+	figure in the 'figure_store' folder next to them that holds the figure's static
+	files (e.g. its .tlfp, .tlfs, .tlfx, and preview images).
+
+	Args:
+		path (str): The path of the trial archive, with or without the '.zip' extension.
+		ext (str): The extension (or suffix) of the file to read, e.g. '.tlfs'.
+
+	Returns:
+		bytes: The contents of the file.
+	"""
+	path = path[:-4] if path.endswith(".zip") else path
+	figure = os.path.split(path)[-1]
+
+	with zipfile.ZipFile(path + ".zip") as archive:
+		member = find_archive_member(archive, figure, ext)
+		if member:
+			return archive.read(member)
+		ref = find_archive_member(archive, figure, FIGURE_REF_EXT)
+		if not ref:
+			raise KeyError("No '{0}' file found in '{1}.zip'.".format(ext, path))
+		key = archive.read(ref).decode('utf-8').strip()
+
+	store_path = os.path.join(os.path.dirname(path), FIGURE_STORE, key + ".zip")
+	with zipfile.ZipFile(store_path) as store:
+		return store.read(key + ext)
+
+
+def read_trial_samples(path, ext):
+	"""Reads the samples of a participant's tracing (.tlt) or of a figure's animation
+	frames (.tlf) from a trial archive, using the binary version of the file if present.
+
+	Args:
+		path (str): The path of the trial archive, with or without the '.zip' extension.
+		ext (str): The extension of the text version of the file ('.tlt' or '.tlf').
+
+	Returns:
+		list or None: The (x, y, time) samples in the file, or None if there are no
+		samples (e.g. a trial without a tracing).
+	"""
+	try:
+		return tltb_to_trace(read_trial_file(path, TLTB_EXTS[ext]))
+	except KeyError:
+		text = read_trial_file(path, ext).decode('utf-8').strip()
+	return None if text == "NA" else ast.literal_eval(text)
+
+
+def write_archive_member(path, member, data, compress_type=zipfile.ZIP_DEFLATED):
+	"""Writes a file to a figure archive, replacing any existing file with the same name.
+
+	Args:
+		path (str): The path of the figure archive, with or without the '.zip' extension.
+		member (str): The name of the file within the archive.
+		data (bytes): The contents of the file.
+		compress_type (int, optional): The zipfile compression method to use for the
+			file. Defaults to ZIP_DEFLATED.
+	"""
+	path = path if path.endswith(".zip") else path + ".zip"
+	with zipfile.ZipFile(path) as archive:
+		exists = member in archive.namelist()
+
+	if exists:
+		# zipfile can't replace members in place, so rebuild the archive without it
+		tmp_path = path + ".tmp"
+		with zipfile.ZipFile(path) as src:
+			with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as dst:
+				for item in src.infolist():
+					if item.filename != member:
+						dst.writestr(item, src.read(item.filename))
+				dst.writestr(member, data, compress_type)
+		os.replace(tmp_path, path)
+	else:
+		with zipfile.ZipFile(path, "a") as archive:
+			archive.writestr(member, data, compress_type)
+
+
+def convert_archive(path, overwrite=False):
+	"""Adds a binary .tlfb version of a figure to an existing figure archive.
+
+	The .tlfb is stored uncompressed next to the original .tlf (in the same folder of
+	the archive, if any), so older versions of TraceLab can still read the converted
+	archive.
+
+	Args:
+		path (str): The path of the figure archive, with or without the '.zip' extension.
+		overwrite (bool, optional): Whether to re-convert archives that already contain a
+			.tlfb file. Defaults to False.
+
+	Returns:
+		bool: True if the archive was converted, otherwise False.
+	"""
+	path = path[:-4] if path.endswith(".zip") else path
+	figure = os.path.split(path)[-1]
+
+	with zipfile.ZipFile(path + ".zip") as fig_archive:
+		existing = find_archive_member(fig_archive, figure, ".tlfb")
+		tlf = find_archive_member(fig_archive, figure, ".tlf")
+		if (existing and not overwrite) or not tlf:
+			return False
+		with fig_archive.open(tlf) as f:
+			points, segments, figure_res = read_tlf(f)
+
+	# Store the .tlfb at the same path as the .tlf, so that both are found by their
+	# member paths (e.g. 'heart/heart.tlf' and 'heart/heart.tlfb')
+	tlfb = figure_to_tlfb(points, segments, figure_res)
+	member = existing or tlf[:-len(".tlf")] + ".tlfb"
+	write_archive_member(path, member, tlfb, zipfile.ZIP_STORED)
+
+	return True
+
+
+def convert_figures(fig_dir, overwrite=False):
+	"""Adds binary .tlfb figures to all figure archives in a given folder.
+
+	Args:
+		fig_dir (str): The path of the folder containing the figure archives.
+		overwrite (bool, optional): Whether to re-convert archives that already contain a
+			.tlfb file. Defaults to False.
+
+	Returns:
+		list: The names of the figures that were converted.
+	"""
+	converted = []
+	for f in sorted(os.listdir(fig_dir)):
+		if f.endswith(".zip") and convert_archive(os.path.join(fig_dir, f), overwrite):
+			converted.append(f[:-4])
+
+	return converted
+
+
+def export_text_traces(path):
+	"""Adds text versions of any binary tracings or animation frames in a trial archive,
+	for use with analysis tools that only understand the original text formats.
+
+	Args:
+		path (str): The path of the trial archive, with or without the '.zip' extension.
+
+	Returns:
+		list: The names of the text files added to the archive.
+	"""
+	path = path[:-4] if path.endswith(".zip") else path
+	figure = os.path.split(path)[-1]
+
+	to_export = []
+	with zipfile.ZipFile(path + ".zip") as archive:
+		for ext, bin_ext in TLTB_EXTS.items():
+			member = find_archive_member(archive, figure, bin_ext)
+			if member and not find_archive_member(archive, figure, ext):
+				to_export.append((member[:-len(bin_ext)] + ext, archive.read(member)))
+
+	for name, buf in to_export:
+		write_archive_member(path, name, repr(tltb_to_trace(buf)))
+
+	return [name for name, buf in to_export]
+
+
+def _read_tlf_textio(f):
+	# The original .tlf import path, kept here as a baseline for benchmark_figure
+	attrs = {}
+	for l in io.TextIOWrapper(f, 'utf8'):
+		attr = l.split(" = ")
+		if len(attr) == 2 and attr[0] in TLF_KEYS:
+			attrs[attr[0]] = ast.literal_eval(attr[1])
+	return attrs
+
+
+def benchmark_figure(path, repeats=5):
+	"""Compares the time and peak memory needed to load a figure from its archive using
+	the original line-by-line .tlf parser, the streaming .tlf scanner, and the binary
+	.tlfb figure (if the archive has one).
+
+	Args:
+		path (str): The path of the figure archive, with or without the '.zip' extension.
+		repeats (int, optional): The number of times to load the figure with each method.
+			The fastest time for each method is reported. Defaults to 5.
+
+	Returns:
+		dict: The best time (in seconds) and peak memory use (in bytes) for each method,
+		in the format {method: (time, peak_memory)}.
+	"""
+	import timeit
+	import tracemalloc
+
+	path = path[:-4] if path.endswith(".zip") else path
+	figure = os.path.split(path)[-1]
+	with zipfile.ZipFile(path + ".zip") as fig_archive:
+		tlf = find_archive_member(fig_archive, figure, ".tlf")
+		tlfb = find_archive_member(fig_archive, figure, ".tlfb")
+
+	def _load(reader, member):
+		def _run():
+			with zipfile.ZipFile(path + ".zip") as fig_archive:
+				with fig_archive.open(member) as f:
+					return reader(f)
+		return _run
+
+	methods = {}
+	if tlf:
+		methods['tlf_textio'] = _load(_read_tlf_textio, tlf)
+		methods['tlf_scan'] = _load(read_tlf, tlf)
+	if tlfb:
+		methods['tlfb'] = _load(lambda f: tlfb_to_figure(f.read()), tlfb)
+
+	results = {}
+	for method, run in methods.items():
+		best = min(timeit.repeat(run, number=1, repeat=repeats))
+		tracemalloc.start()
+		run()
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		results[method] = (best, peak)
+
+	return results
+
+
+if __name__ == "__main__":
+
+	import sys
+
+	args = [a for a in sys.argv[1:] if not a.startswith("--")]
+	fig_dir = args[0] if len(args) else os.path.join("ExpAssets", "Resources", "figures")
+
+	if "--export-traces" in sys.argv:
+		for root, dirs, files in os.walk(fig_dir):
+			for f in sorted(files):
+				if f.endswith(".zip"):
+					for name in export_text_traces(os.path.join(root, f)):
+						print("Exported '{0}'".format(name))
+	elif "--bench" in sys.argv:
+		row = "{0:<28} {1:<12} {2:>10} {3:>12}"
+		print(row.format("figure", "method", "time (ms)", "peak (KiB)"))
+		for f in sorted(os.listdir(fig_dir)):
+			if not f.endswith(".zip"):
+				continue
+			for method, (t, peak) in benchmark_figure(os.path.join(fig_dir, f)).items():
+				print(row.format(f[:-4], method, round(t * 1000, 2), peak // 1024))
+	else:
+		for name in convert_figures(fig_dir, overwrite="--overwrite" in sys.argv):
+			print("Converted '{0}'".format(name))
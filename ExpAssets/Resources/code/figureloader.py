@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""Parallel loading of pre-generated figures.
+
+Importing a pre-generated figure (reading it from its archive, scaling it to the
+screen, mirroring it for left-handed participants, and interpolating its animation
+frames) doesn't depend on any experiment state, so when a session needs several
+figures the work can be spread over a pool of worker processes. Each worker returns
+the finished figure as plain data (lists of points, segments, and frames) that can be
+passed to TraceLabFigure using its 'manufacture' argument.
+
+"""
+
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from klibs.KLUtilities import scale
+
+from figureio import read_figure
+from drawingutils import segments_length, segments_to_frame_sets, mirror_segments
+
+
+def load_figure_data(path, screen_res, handedness, durations, fps, tolerance=None):
+	"""Imports a pre-generated figure and interpolates its frames for a given set of
+	animation durations, returning the results as plain data.
+
+	The returned figure is identical to one imported directly by TraceLabFigure, and
+	can be passed to it as the 'manufacture' argument to create a figure object.
+
+	Args:
+		path (str): The path of the figure archive, without the '.zip' extension.
+		screen_res (tuple): The (width, height) of the screen in pixels.
+		handedness (str): The handedness of the participant ('l' or 'r'), or None.
+		durations (list): The animation durations (in ms) to interpolate frames for.
+		fps (float): The refresh rate of the screen.
+		tolerance (float, optional): The maximum spacing error (in pixels) for frames on
+			curved segments (see :func:`drawingutils.segments_to_frames`).
+
+	Returns:
+		dict: The scaled 'points' and 'segments' of the figure, along with its
+		interpolated 'frames' for each duration in the format {duration: frames}.
+	"""
+	points, segments, figure_res = read_figure(path)
+
+	# Scale figure to the screen, mirroring it if participant is left-handed
+	points = [scale(p, figure_res, screen_res) for p in points]
+	segments = [
+		[curve, tuple([scale(p, figure_res, screen_res) for p in pts])] for curve, pts in segments
+	]
+	if handedness == "l":
+		segments = mirror_segments(segments, screen_res[0])
+		points.reverse()
+		points.insert(0, points.pop())
+
+	# Interpolate the frames for all durations in a single pass
+	durations = [float(d) for d in durations]
+	path_len = segments_length(segments)
+	timings = [(duration, fps) for duration in durations]
+	frame_sets = segments_to_frame_sets(segments, timings, path_len, tolerance)
+	frames = dict(zip(durations, frame_sets))
+
+	return {'points': points, 'segments': segments, 'frames': frames}
+
+
+def iter_figure_data(jobs, max_workers=None, poll_interval=0.05):
+	"""Loads a set of pre-generated figures in parallel using a pool of worker processes,
+	yielding each figure as soon as it's ready.
+
+	To allow the caller to keep the experiment window responsive while figures load,
+	this also yields None every 'poll_interval' seconds while waiting for results.
+
+	Args:
+		jobs (dict): The figures to load, in the format {name: args}, where 'args' is a
+			tuple of arguments for :func:`load_figure_data`.
+		max_workers (int, optional): The maximum number of worker processes to use.
+			Defaults to the number of CPU cores.
+		poll_interval (float, optional): The maximum time (in seconds) to wait between
+			yields. Defaults to 0.05.
+
+	Yields:
+		tuple or None: The (name, data) of each loaded figure, or None if no figures
+		finished loading within the last poll interval.
+	"""
+	if not max_workers:
+		max_workers = os.cpu_count() or 1
+	max_workers = min(max_workers, len(jobs))
+	if max_workers < 1:
+		return
+
+	# Worker processes are spawned rather than forked so that they don't inherit any of the
+	# experiment's open window, audio, or hardware handles
+	context = mp.get_context("spawn")
+	with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+		pending = {pool.submit(load_figure_data, *args): name for name, args in jobs.items()}
+		while pending:
+			done, _ = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+			if not done:
+				yield None
+			for future in done:
+				name = pending.pop(future)
+				yield (name, future.result())
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""Headless batch rendering of figure preview images.
+
+Figure preview images ('_preview.png') are normally only created by write_out when a
+figure is saved during a session, so changing the figure colour or screen resolution
+used to mean re-running a session to update them. This tool re-renders the previews for
+every archive in a figure folder or participant data folder (searched recursively) using
+a pool of worker processes, without needing an experiment window or display:
+
+	python figurepreview.py ExpAssets/Resources/figures --res 1920x1080
+
+By default, previews are written back into each archive (replacing any existing ones).
+Use '--out' to write them to a separate folder instead, or '--help' for all options.
+
+Pre-generated figures are scaled from their source resolution to the requested one.
+Trial archives from participant data folders are drawn as recorded, since they're
+already in the screen coordinates of the session that created them.
+
+Like figureio.py and figurerender.py, this module has no dependencies on KLibs, so it can
+be run without it installed (including in its worker processes, which import it anew).
+
+"""
+
+import os
+import io
+import ast
+import zipfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from figureio import read_figure, normalize_segments, find_archive_member, write_archive_member
+from figureio import read_trial_samples, FIGURE_REF_EXT
+from figurerender import texture_box, draw_segments, draw_frames, draw_trace, points_to_array
+
+
+PREVIEW_SUFFIX = "_preview.png"
+FIGURE_COLOR = (211, 211, 211)  # default for P.stimulus_feedback_color
+TRACE_COLOR = (0, 255, 255)  # default for P.response_feedback_color
+
+
+def _scale(point, canvas_size, target_size):
+	# Scales a point from one resolution to another, truncating to whole pixels in the
+	# same way as klibs.KLUtilities.scale
+	x_scale = target_size[0] / float(canvas_size[0])
+	y_scale = target_size[1] / float(canvas_size[1])
+	return (int(point[0] * x_scale), int(point[1] * y_scale))
+
+
+def _segments_bounds(segments):
+	# Gets the ((min_x, min_y), (max_x, max_y)) bounds of a figure's segments, as with
+	# drawingutils.segments_bounds (which requires KLibs). Each curve's extrema along
+	# each axis are found from where the derivative of that axis is zero.
+	points = []
+	for curve, pts in segments:
+		points += [pts[0], pts[1]]
+		if curve:
+			start, end, ctrl = (np.asarray(p, dtype=np.float64) for p in pts)
+			denom = start - 2 * ctrl + end
+			t = np.divide(start - ctrl, denom, out=np.zeros(2), where=denom != 0)
+			t = np.clip(t, 0.0, 1.0)
+			points.append((1 - t) ** 2 * start + 2 * (1 - t) * t * ctrl + t ** 2 * end)
+	xy = np.asarray(points, dtype=np.float64)
+	return (tuple(xy.min(axis=0).tolist()), tuple(xy.max(axis=0).tolist()))
+
+
+def _read_literal(archive, member):
+	return ast.literal_eval(archive.read(member).decode('utf-8').strip())
+
+
+def _read_samples(path, ext):
+	# Reads the tracing or frames from a trial archive, if it has them
+	try:
+		return read_trial_samples(path, ext)
+	except KeyError:
+		return None
+
+
+def read_preview_data(path, screen_res):
+	"""Reads the data needed to draw the preview of a figure or trial archive.
+
+	For pre-generated figures, the figure's segments are read and scaled to the given
+	screen resolution. For trial archives, the figure's segments are read from its .tlfs
+	file if present, otherwise the figure's recorded animation frames are used instead.
+
+	Args:
+		path (str): The path of the archive, including the '.zip' extension.
+		screen_res (tuple): The (width, height) to scale pre-generated figures to.
+
+	Returns:
+		tuple: The figure's segments (or None), the figure's animation frames (or None),
+		and the participant's tracing (or None if the archive doesn't contain one).
+	"""
+	figure = os.path.basename(path)[:-4]
+	segments, frames = (None, None)
+
+	try:
+		points, segments, figure_res = read_figure(path)
+		segments = [
+			[curve, tuple([_scale(p, figure_res, screen_res) for p in pts])]
+			for curve, pts in segments
+		]
+	except (IOError, KeyError):
+		# Not a pre-generated figure, so try reading it as a trial archive
+		segments = None
+
+	if segments is None:
+		with zipfile.ZipFile(path) as archive:
+			tlfs = find_archive_member(archive, figure, ".tlfs")
+			if tlfs:
+				segments = normalize_segments([[None, s] for s in _read_literal(archive, tlfs)])
+			elif find_archive_member(archive, figure, FIGURE_REF_EXT):
+				# The preview for the trial's figure is saved in the figure store instead
+				raise ValueError("Trial figure is saved in the figure store.")
+		if segments is None:
+			# Recorded frames are (x, y, onset) samples
+			frames = _read_samples(path, ".tlf")
+			frames = [(f[0], f[1]) for f in frames] if frames else None
+
+	return (segments, frames, _read_samples(path, ".tlt") or None)
+
+
+def render_preview(path, screen_res, crop=False, trace=False, out_dir=None,
+		color=FIGURE_COLOR, trace_color=TRACE_COLOR):
+	"""Renders the preview image for a figure or trial archive and saves it.
+
+	Archives that only contain a tracing (e.g. learned figures) are previewed by drawing
+	the tracing on its own.
+
+	Args:
+		path (str): The path of the archive, including the '.zip' extension.
+		screen_res (tuple): The (width, height) of the screen to render the preview for.
+		crop (bool, optional): Whether to crop the preview to the area containing the
+			figure. Defaults to False.
+		trace (bool, optional): Whether to draw the archive's tracing (if any) on top of
+			the figure. Defaults to False.
+		out_dir (str, optional): The folder to save the preview to. Defaults to None,
+			in which case the preview is saved inside the archive.
+		color (tuple, optional): The RGB colour of the figure.
+		trace_color (tuple, optional): The RGB colour of the tracing.
+
+	Returns:
+		str: The path of the saved preview, or of the archive it was saved to.
+	"""
+	segments, frames, tracing = read_preview_data(path, screen_res)
+	if segments is None and frames is None:
+		if tracing is None:
+			raise ValueError("No figure or tracing found in '{0}'.".format(path))
+		frames, color, tracing = (tracing, trace_color, None)
+
+	if crop:
+		if segments:
+			bounds = _segments_bounds(segments)
+		else:
+			xy = points_to_array(frames)
+			bounds = (xy.min(axis=0), xy.max(axis=0))
+		box = texture_box(bounds, screen_res)
+	else:
+		box = (0, 0, screen_res[0], screen_res[1])
+
+	if segments:
+		texture = draw_segments(segments, box, color)
+	else:
+		texture = draw_frames(frames, box, color)
+	if trace and tracing:
+		texture, box = draw_trace(texture, box, tracing, trace_color, screen_res)
+
+	png = io.BytesIO()
+	Image.fromarray(texture).save(png, 'PNG')
+
+	preview_name = os.path.basename(path)[:-4] + PREVIEW_SUFFIX
+	if out_dir:
+		out_path = os.path.join(out_dir, preview_name)
+		with io.open(out_path, 'wb') as f:
+			f.write(png.getvalue())
+		return out_path
+
+	# Replace the existing preview in the archive (wherever it is), if there is one
+	with zipfile.ZipFile(path) as archive:
+		member = find_archive_member(archive, preview_name[:-len(PREVIEW_SUFFIX)], PREVIEW_SUFFIX)
+	write_archive_member(path, member or preview_name, png.getvalue())
+	return path
+
+
+def find_archives(root):
+	"""Finds all .zip archives within a folder and its subfolders.
+
+	Args:
+		root (str): The path of the folder to search.
+
+	Returns:
+		list: The paths of all archives found, in sorted order.
+	"""
+	archives = []
+	for dirpath, dirnames, filenames in os.walk(root):
+		dirnames[:] = [d for d in dirnames if d != "__MACOSX"]
+		archives += [os.path.join(dirpath, f) for f in filenames if f.endswith(".zip")]
+
+	return sorted(archives)
+
+
+def render_previews(paths, screen_res, max_workers=None, **kwargs):
+	"""Renders the preview images for a set of archives in parallel using a pool of
+	worker processes, yielding the result for each archive as soon as it's done.
+
+	Args:
+		paths (list): The paths of the archives to render previews for.
+		screen_res (tuple): The (width, height) of the screen to render the previews for.
+		max_workers (int, optional): The maximum number of worker processes to use.
+			Defaults to the number of CPU cores.
+		**kwargs: Any additional keyword arguments for :func:`render_preview`.
+
+	Yields:
+		tuple: The path of each archive, the path its preview was saved to, and the
+		exception raised while rendering it (the last two are None on failure and on
+		success, respectively).
+	"""
+	if not max_workers:
+		max_workers = os.cpu_count() or 1
+	max_workers = min(max_workers, len(paths))
+	if max_workers < 1:
+		return
+
+	# As in figureloader, worker processes are spawned rather than forked so that they
+	# don't inherit any window or hardware handles if used from within an experiment
+	context = mp.get_context("spawn")
+	with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+		pending = {pool.submit(render_preview, p, screen_res, **kwargs): p for p in paths}
+		for future in as_completed(pending):
+			try:
+				yield (pending[future], future.result(), None)
+			except Exception as e:
+				yield (pending[future], None, e)
+
+
+if __name__ == "__main__":
+
+	import argparse
+
+	def _ints(s, sep):
+		return tuple(int(v) for v in s.split(sep))
+
+	parser = argparse.ArgumentParser(description="Render preview images for figure archives.")
+	parser.add_argument('path', help="a figure folder or participant data folder")
+	parser.add_argument('--res', default="1920x1080", help="screen resolution (default 1920x1080)")
+	parser.add_argument('--color', default=None, help="figure colour as R,G,B")
+	parser.add_argument('--trace-color', default=None, help="tracing colour as R,G,B")
+	parser.add_argument('--trace', action='store_true', help="draw tracings over figures")
+	parser.add_argument('--crop', action='store_true', help="crop previews to the figure")
+	parser.add_argument('--out', default=None, help="save previews to this folder instead")
+	parser.add_argument('--workers', type=int, default=None, help="number of processes")
+	args = parser.parse_args()
+
+	kwargs = {'crop': args.crop, 'trace': args.trace, 'out_dir': args.out}
+	if args.color:
+		kwargs['color'] = _ints(args.color, ",")
+	if args.trace_color:
+		kwargs['trace_color'] = _ints(args.trace_color, ",")
+	if args.out and not os.path.exists(args.out):
+		os.makedirs(args.out)
+
+	paths = find_archives(args.path)
+	failed = 0
+	results = render_previews(paths, _ints(args.res, "x"), args.workers, **kwargs)
+	for path, out, err in results:
+		if err:
+			failed += 1
+			print("Skipped '{0}': {1}".format(path, err))
+		else:
+			print("Rendered '{0}'".format(out))
+	print("Rendered {0} of {1} previews.".format(len(paths) - failed, len(paths)))
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Display-independent rendering of figures and tracings.
+
+Rendering a figure (or a participant's tracing of one) only requires its segments or
+frames, a colour, and the area of the screen to draw, so the drawing code used by
+TraceLabFigure.render lives here where it can also be used without an experiment
+window, e.g. by the batch preview renderer in figurepreview.py.
+
+Like figureio.py, this module intentionally has no dependencies on KLibs.
+
+"""
+
+import math
+from itertools import chain
+
+import aggdraw
+import numpy as np
+from PIL import Image
+
+
+def points_to_array(points):
+	"""Converts a list of (x, y) or (x, y, time) tuples into an N x 2 array of (x, y)
+	coordinates.
+	"""
+	if isinstance(points, np.ndarray):
+		return points[:, :2].astype(np.float64)
+
+	# np.fromiter is much faster than np.asarray for long lists of tuples
+	dims = len(points[0])
+	flat = np.fromiter(chain.from_iterable(points), np.float64, len(points) * dims)
+	return flat.reshape(-1, dims)[:, :2]
+
+
+def frames_to_path(frames, unique=False, tolerance=None):
+	"""Renders a list of (x, y) tuples representing the frames of a figure (or the samples
+	of a tracing) into an aggdraw Path object for drawing.
+
+	Args:
+		frames (list): A list of (x, y) or (x, y, time) tuples (or an N x 2 array of (x, y)
+			coordinates) to draw a path between.
+		unique (bool, optional): If True, consecutive duplicate points will be discarded.
+			Defaults to False.
+		tolerance (float, optional): If provided, runs of consecutive points that fall
+			within the same square pixel grid cell of this size will be reduced to their
+			first point. Defaults to None (no decimation).
+
+	Returns:
+		:obj:`aggdraw.Path`: The path connecting the given points.
+	"""
+	xy = points_to_array(frames)
+
+	# Discard points in the same place (or grid cell) as the point before them
+	if unique or tolerance:
+		cells = np.floor(xy / tolerance) if tolerance else xy
+		keep = np.ones(len(xy), dtype=bool)
+		keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+		xy = xy[keep]
+
+	path = aggdraw.Path(xy.ravel().tolist())
+	path.close()
+	return path
+
+
+def segments_to_symbol(segments):
+	"""Renders a list of curve and line segments into an aggdraw Path object for drawing.
+	"""
+
+	path = "M{0},{1} ".format(segments[0][1][0][0], segments[0][1][0][1]) # start at first point
+	for curve, points in segments:
+		if curve:
+			start, end, ctrl = points
+			path += "Q{0},{1},{2},{3} ".format(ctrl[0], ctrl[1], end[0], end[1])
+		else:
+			start, end = points
+			path += "L{0},{1} ".format(end[0], end[1])
+
+	return aggdraw.Symbol(path)
+
+
+def texture_box(bounds, screen_res, padding=2):
+	"""Converts the bounds of a shape into the area of the screen a texture containing it
+	should cover, padded to make room for the line width and anti-aliasing.
+
+	Args:
+		bounds (tuple): The ((min_x, min_y), (max_x, max_y)) bounds of the shape.
+		screen_res (tuple): The (width, height) of the screen in pixels.
+		padding (int, optional): The number of pixels to pad the bounds by on each side.
+			Defaults to 2.
+
+	Returns:
+		tuple: The (x1, y1, x2, y2) screen area of the texture, clipped to the screen.
+	"""
+	(min_x, min_y), (max_x, max_y) = bounds
+	x1 = max(int(math.floor(min_x)) - padding, 0)
+	y1 = max(int(math.floor(min_y)) - padding, 0)
+	x2 = min(int(math.ceil(max_x)) + padding + 1, screen_res[0])
+	y2 = min(int(math.ceil(max_y)) + padding + 1, screen_res[1])
+	return (x1, y1, max(x2, x1 + 1), max(y2, y1 + 1))
+
+
+def _canvas(box, base=None):
+	# Creates an RGBA canvas for a given screen area (optionally starting from a copy of
+	# an existing (texture, box) render), offsetting everything drawn to it by the position
+	# of its top-left corner on the screen
+	canvas = Image.new("RGBA", (box[2] - box[0], box[3] - box[1]), (0, 0, 0, 255))
+	if base is not None:
+		texture, base_box = base
+		canvas.paste(Image.fromarray(texture), (base_box[0] - box[0], base_box[1] - box[1]))
+	surf = aggdraw.Draw(canvas)
+	surf.settransform((-box[0], -box[1]))
+	return (canvas, surf)
+
+
+def draw_segments(segments, box, color):
+	"""Draws a figure smoothly from its segments.
+
+	Args:
+		segments (list): The [curve, points] segments of the figure.
+		box (tuple): The (x1, y1, x2, y2) area of the screen to render.
+		color (tuple): The RGB colour of the figure.
+
+	Returns:
+		:obj:`numpy.ndarray`: The rendered RGBA texture.
+	"""
+	canvas, surf = _canvas(box)
+	surf.symbol((0, 0), segments_to_symbol(segments), aggdraw.Pen(color, 1, 255))
+	surf.flush()
+	return np.asarray(canvas)
+
+
+def draw_frames(frames, box, color):
+	"""Draws a figure by connecting its animation frames with straight lines.
+
+	Args:
+		frames (list): The (x, y) frames of the figure.
+		box (tuple): The (x1, y1, x2, y2) area of the screen to render.
+		color (tuple): The RGB colour of the figure.
+
+	Returns:
+		:obj:`numpy.ndarray`: The rendered RGBA texture.
+	"""
+	canvas, surf = _canvas(box)
+	surf.path(frames_to_path(frames, unique=True), aggdraw.Pen(color, 1, 255))
+	surf.flush()
+	return np.asarray(canvas)
+
+
+def draw_trace(texture, box, trace, color, screen_res, tolerance=None):
+	"""Draws a tracing on top of a copy of a rendered figure, expanding the texture to fit
+	the tracing if needed.
+
+	Args:
+		texture (:obj:`numpy.ndarray`): The rendered figure to draw the tracing on.
+		box (tuple): The (x1, y1, x2, y2) area of the screen covered by the texture.
+		trace (list): A list of (x, y) or (x, y, time) tuples (or an N x 2 array of (x, y)
+			coordinates) containing the tracing.
+		color (tuple): The RGB colour of the tracing.
+		screen_res (tuple): The (width, height) of the screen in pixels.
+		tolerance (float, optional): If provided, the tracing is decimated to one point
+			per tolerance-sized pixel cell before drawing (see :func:`frames_to_path`).
+			Defaults to None (all unique points are drawn).
+
+	Returns:
+		tuple: The rendered RGBA texture and the (x1, y1, x2, y2) screen area it covers.
+	"""
+	trace_xy = points_to_array(trace)
+	trace_box = texture_box((trace_xy.min(axis=0), trace_xy.max(axis=0)), screen_res)
+	new_box = (
+		min(box[0], trace_box[0]), min(box[1], trace_box[1]),
+		max(box[2], trace_box[2]), max(box[3], trace_box[3])
+	)
+	canvas, surf = _canvas(new_box, base=(texture, box))
+	surf.path(frames_to_path(trace_xy, True, tolerance), aggdraw.Pen(color, 1, 255))
+	surf.flush()
+	return (np.asarray(canvas), new_box)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+"""Background writing of figure and tracing data.
+
+Writing out a trial's figure and tracing involves appending several files to a zip
+archive (including re-compressing the extended frames and encoding a full-screen PNG
+preview), which can take long enough on slow disks to noticeably stretch the interval
+between trials. To keep trial pacing independent of disk speed, TraceLabFigure.snapshot
+copies everything needed to write a figure into an immutable FigureSnapshot, which can
+then be written out later by :func:`write_snapshot` on a FigureWriter's background
+thread while the experiment moves on to the next trial. This includes interpolating
+the figure's extended frames for its .tlfx file, which is also done by the writer.
+
+"""
+
+import os
+import io
+import queue
+import hashlib
+import zipfile
+import threading
+from collections import namedtuple
+
+from PIL import Image
+
+from klibs.KLUtilities import utf8
+
+from figureio import figure_to_tlfb, trace_to_tltb, TLTB_EXTS, FIGURE_STORE, FIGURE_REF_EXT
+from figurerender import draw_segments
+from drawingutils import segments_to_frame_sets
+
+
+FigureSnapshot = namedtuple('FigureSnapshot', [
+	'fig_dir',  # the folder to write the figure archive to
+	'file_name',  # the name of the .tlf or .tlt file to write
+	'data',  # the contents of the .tlf/.tlt, as either text or a tuple of samples
+	'outputs',  # the extra files to write, e.g. '.tlfp' or '_preview.png'
+	'points',  # the figure's points
+	'segments',  # the figure's [curve, points] segments
+	'screen_res',  # the resolution of the screen the figure was generated at
+	'ext_frames',  # the figure's extended (5 s) animation frames, or None if not yet interpolated
+	'ext_timing',  # the (duration, fps, path_len, tolerance) to interpolate them with, or None
+	'color',  # the RGB colour to render the figure's previews in
+	'store',  # whether to write the figure's static files to the figure store
+	'binary',  # whether to write .tlf/.tlt samples in the binary .tlfab/.tltb format
+])
+
+# Extra files that only depend on the figure itself, and not the trial it was shown on
+STATIC_OUTPUTS = (".tlfx", ".tlfp", ".tlfs", "_preview.png", "_ext_preview.png")
+
+
+def _interpolate_ext_frames(snapshot):
+	# Fills in the extended frames of a snapshot that needs them, interpolating them from
+	# the figure's segments if they weren't provided when the snapshot was taken
+	if snapshot.ext_frames is not None or snapshot.ext_timing is None:
+		return snapshot
+	if ".tlfx" not in snapshot.outputs:
+		return snapshot
+	duration, fps, path_len, tolerance = snapshot.ext_timing
+	frame_sets = segments_to_frame_sets(snapshot.segments, [(duration, fps)], path_len, tolerance)
+	return snapshot._replace(ext_frames=tuple(frame_sets[0]))
+
+
+def _encode_output(snapshot, ext):
+	# Encodes one of the extra files for a snapshot, returning its contents
+	if ext == ".tlfb":
+		return figure_to_tlfb(snapshot.points, snapshot.segments, snapshot.screen_res)
+	elif ext.endswith(".png"):
+		box = (0, 0, snapshot.screen_res[0], snapshot.screen_res[1])
+		preview = draw_segments(snapshot.segments, box, snapshot.color)
+		out = io.BytesIO()
+		Image.fromarray(preview).save(out, 'PNG')
+		return out.getvalue()
+	elif ext == ".tlfx":
+		return utf8(list(snapshot.ext_frames))
+	elif ext == ".tlfp":
+		return utf8(list(snapshot.points))
+	elif ext == ".tlfs":
+		return u",".join(utf8(s[1]) for s in snapshot.segments)
+	raise ValueError("Unknown figure file type '{0}'.".format(ext))
+
+
+def figure_key(snapshot):
+	"""Computes the content hash identifying a figure's static files in the figure store.
+
+	The hash covers everything the static files are generated from (the figure's points,
+	segments, resolution, extended frames, and preview colour) as well as which static
+	files are written, so two figures only share a key if all their static files would
+	be identical.
+
+	Args:
+		snapshot (:obj:`FigureSnapshot`): The snapshot of the figure.
+
+	Returns:
+		str: The hex digest identifying the figure.
+	"""
+	static = [ext for ext in snapshot.outputs if ext in STATIC_OUTPUTS]
+	figure = (list(snapshot.points), list(snapshot.segments), snapshot.screen_res)
+	sha = hashlib.sha1()
+	sha.update(utf8((figure, static, snapshot.color)).encode('utf-8'))
+	if snapshot.ext_frames is not None and ".tlfx" in static:
+		sha.update(utf8(list(snapshot.ext_frames)).encode('utf-8'))
+
+	return sha.hexdigest()
+
+
+def _write_to_store(snapshot, key, outputs):
+	# Writes a figure's static files to the figure store, unless they're already there.
+	# The archive is written to a temporary file first so that an interrupted write
+	# can't leave an incomplete figure in the store.
+	store_dir = os.path.join(snapshot.fig_dir, FIGURE_STORE)
+	store_path = os.path.join(store_dir, key + ".zip")
+	if os.path.exists(store_path):
+		return
+	if not os.path.exists(store_dir):
+		os.makedirs(store_dir)
+
+	tmp_path = store_path + ".tmp"
+	with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as store_zip:
+		for ext in outputs:
+			store_zip.writestr(key + ext, _encode_output(snapshot, ext))
+	os.replace(tmp_path, store_path)
+
+
+def snapshot_files(snapshot):
+	"""Encodes all the files to write out for a snapshot.
+
+	If the snapshot uses the figure store, the figure's static files (see
+	STATIC_OUTPUTS) are written once to a content-addressed archive in the 'figure_store'
+	folder of the figure folder instead, and replaced with a .tlfr file containing the
+	figure's key (see :func:`figureio.read_trial_file`).
+
+	If the snapshot's extended frames haven't been interpolated yet, they're interpolated
+	here (i.e. on the writer thread) before any files are encoded.
+
+	Args:
+		snapshot (:obj:`FigureSnapshot`): The snapshot of the figure to write out.
+
+	Returns:
+		list: The (name, data, compress) of each file to write, in order.
+	"""
+	snapshot = _interpolate_ext_frames(snapshot)
+	file_name = snapshot.file_name
+	data = snapshot.data
+
+	outputs = snapshot.outputs
+	files = []
+	if snapshot.store:
+		static = [ext for ext in outputs if ext in STATIC_OUTPUTS]
+		if static:
+			key = figure_key(snapshot)
+			_write_to_store(snapshot, key, static)
+			outputs = [ext for ext in outputs if ext not in static]
+			files.append((file_name[:-4] + FIGURE_REF_EXT, key, True))
+
+	for ext in outputs:
+		# Binary copies of captured figures are stored uncompressed for fast loading
+		files.append((file_name[:-4] + ext, _encode_output(snapshot, ext), ext != ".tlfb"))
+
+	# Write samples in binary if requested, falling back to text if they can't be encoded
+	bin_ext = TLTB_EXTS.get(file_name[-4:])
+	if snapshot.binary and bin_ext and isinstance(data, tuple):
+		try:
+			files.append((file_name[:-4] + bin_ext, trace_to_tltb(data), True))
+			return files
+		except ValueError:
+			pass
+	text = utf8(list(data)) if isinstance(data, tuple) else utf8(data)
+	files.append((file_name, text, True))
+
+	return files
+
+
+def write_snapshot(snapshot, archive=None):
+	"""Writes out a figure (or a tracing of it) from a snapshot.
+
+	Each file is encoded in memory and written straight into the figure's zip archive,
+	so no temporary files are created in the figure folder.
+
+	Args:
+		snapshot (:obj:`FigureSnapshot`): The snapshot of the figure to write out.
+		archive (:obj:`sessionarchive.SessionArchive`, optional): If provided, the files
+			are appended to this session archive instead of the figure's zip archive.
+	"""
+	files = snapshot_files(snapshot)
+	if archive is not None:
+		trial = snapshot.file_name[:-4]
+		archive.append([(trial, name, data, compress) for name, data, compress in files])
+		return
+
+	fig_path = os.path.join(snapshot.fig_dir, snapshot.file_name)
+	with zipfile.ZipFile(fig_path[:-3] + "zip", "a", zipfile.ZIP_DEFLATED) as fig_zip:
+		for name, data, compress in files:
+			compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+			fig_zip.writestr(name, data, compression)
+
+
+class FigureWriter(object):
+	"""Writes figure snapshots to disk in the order received using a background thread.
+
+	Snapshots are passed to the thread through a bounded queue, so if the writer falls
+	too far behind, :meth:`submit` blocks until there's room in the queue. Any error
+	raised while writing a snapshot is stored and re-raised by the next call to
+	:meth:`check`, and no further snapshots are written after an error.
+
+	Since multiple snapshots (e.g. a trial's figure and tracing) can be written to the
+	same archive, a single thread is used to make sure writes never overlap.
+
+	Args:
+		archive (:obj:`sessionarchive.SessionArchive`, optional): A session archive to
+			write all snapshots to instead of separate zip archives. It will be closed
+			when the writer is closed. Defaults to None.
+		max_pending (int, optional): The maximum number of snapshots waiting to be
+			written before :meth:`submit` blocks. Defaults to 8.
+
+	"""
+	def __init__(self, archive=None, max_pending=8):
+		self.error = None
+		self.archive = archive
+		self._queue = queue.Queue(maxsize=max_pending)
+		self._thread = threading.Thread(target=self._run, name="FigureWriter")
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _run(self):
+		while True:
+			snapshot = self._queue.get()
+			try:
+				if snapshot is None:
+					return
+				if self.error is None:
+					write_snapshot(snapshot, self.archive)
+			except Exception as e:
+				self.error = e
+			finally:
+				self._queue.task_done()
+
+	def submit(self, snapshot):
+		"""Adds a figure snapshot to the queue of snapshots to write out.
+
+		Args:
+			snapshot (:obj:`FigureSnapshot`): The snapshot of the figure to write out.
+		"""
+		if not self._thread.is_alive():
+			raise RuntimeError("Cannot submit snapshots to a closed FigureWriter.")
+		self._queue.put(snapshot)
+
+	def check(self):
+		"""Re-raises the error from the last failed write, if any.
+		"""
+		if self.error is not None:
+			raise self.error
+
+	def close(self):
+		"""Writes out any remaining snapshots and stops the background thread.
+		"""
+		if self._thread.is_alive():
+			self._queue.put(None)
+			self._thread.join()
+			if self.archive is not None:
+				self.archive.close()
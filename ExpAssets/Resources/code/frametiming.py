@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""Summaries of screen flip timing for animations.
+
+Every animation in TraceLab assumes that each flip of the screen takes exactly one
+refresh. When the computer running the experiment can't keep up, refreshes get missed and
+the animation runs slow or has to skip frames. To make these problems easy to spot after
+the fact, the flip times of each animation are summarized with :func:`summarize_flips` and
+logged to the 'frame_timing' table of the database.
+
+"""
+
+import json
+
+import numpy as np
+
+
+# Upper bounds for the inter-flip interval histogram bins, in refreshes
+HIST_BINS = [("<1", 0.5), ("1", 1.5), ("2", 2.5), ("3", 3.5), ("4+", np.inf)]
+
+
+def summarize_flips(runs, refresh_rate):
+	"""Summarizes the timing of the screen flips during an animation.
+
+	Flip times are provided as a list of runs (e.g. one per keyframe) so that any pauses
+	between separate runs of flips aren't counted as dropped frames.
+
+	Args:
+		runs (list): A list of lists containing the time (in seconds) of each flip.
+		refresh_rate (float): The refresh rate of the screen.
+
+	Returns:
+		dict: The total number of 'flips', the 'mean_interval' and maximum deviation
+		from the expected interval ('max_jitter') between flips (both in ms), the number
+		of refreshes missed between flips ('dropped_frames'), and a JSON histogram of
+		inter-flip intervals in refreshes ('interval_hist').
+	"""
+	expected = 1000.0 / refresh_rate
+	flips = sum(len(r) for r in runs)
+	intervals = [np.diff(np.asarray(r, dtype=np.float64)) * 1000 for r in runs if len(r) > 1]
+	intervals = np.concatenate(intervals) if intervals else np.zeros(0)
+
+	hist = {}
+	refreshes = intervals / expected
+	lower = -np.inf
+	for label, upper in HIST_BINS:
+		hist[label] = int(np.sum((refreshes >= lower) & (refreshes < upper)))
+		lower = upper
+
+	if len(intervals):
+		mean_interval = float(np.mean(intervals))
+		max_jitter = float(np.max(np.abs(intervals - expected)))
+		dropped = int(np.sum(np.maximum(np.round(refreshes) - 1, 0)))
+	else:
+		mean_interval, max_jitter, dropped = (0.0, 0.0, 0)
+
+	return {
+		'flips': flips,
+		'mean_interval': round(mean_interval, 3),
+		'max_jitter': round(max_jitter, 3),
+		'dropped_frames': dropped,
+		'interval_hist': json.dumps(hist),
+	}
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+"""A spatial index for finding the closest points on a figure's path.
+
+Finding the closest point on a figure to a tracing sample normally means measuring the
+distance from the sample to every line along the figure's (densely interpolated) path,
+so scoring a long tracing against a large figure takes time proportional to the product
+of their lengths. A PathIndex avoids this by dividing the area around the figure into a
+uniform grid, and working out in advance which parts of the path could possibly be the
+closest to any point in each cell. Each query then only needs to check the few
+candidates for its cell, taking roughly constant time regardless of the figure's size.
+
+Indexes are built from a figure's raw segments (see TraceLabFigure.path_index, which
+caches the index for the figure) or from any path of points (e.g. a figure's animation
+frames), and can be used by traceerror.py in place of a path. Points on curved segments
+are refined against the exact bezier curve rather than its interpolated path.
+
+Like figureio.py, this module intentionally has no dependencies on KLibs.
+
+"""
+
+import math
+
+import numpy as np
+
+
+_MAX_PAIRS = 65536  # the number of point/line pairs to compare at once (sized to fit in cache)
+_NEWTON_STEPS = 4  # the number of iterations used to refine points on bezier curves
+
+
+def flatten_segments(segments, spacing=1.0):
+	"""Converts a figure's linear and/or bezier segments into a path of (x, y) points,
+	along with the segment and bezier transition value of each point.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments, where 'points' is a
+			(start, end) tuple for lines and a (start, end, ctrl) tuple for curves.
+		spacing (float, optional): The approximate distance (in pixels) between points
+			on curved segments. Defaults to 1.0.
+
+	Returns:
+		tuple: The N x 2 array of points along the figure's path, the index of the
+		segment each point is the end of (0 for the first point), and the transition
+		value of each point along its segment (from 0 to 1).
+	"""
+	parts = [np.array([segments[0][1][0]], dtype=np.float64)]
+	seg_ids = [np.zeros(1, dtype=np.int64)]
+	params = [np.zeros(1)]
+	for i, (curve, points) in enumerate(segments):
+		if curve:
+			start, end, ctrl = [np.array(p, dtype=np.float64) for p in points]
+			# The control polygon's length is an upper bound for the length of the curve
+			bound = np.hypot(*(ctrl - start)) + np.hypot(*(end - ctrl))
+			t = np.linspace(0, 1, max(int(math.ceil(bound / spacing)), 1) + 1)[1:]
+			parts.append(_bezier_xy(start, ctrl, end, t[:, None]))
+		else:
+			t = np.ones(1)
+			parts.append(np.array([points[1]], dtype=np.float64))
+		seg_ids.append(np.full(len(t), i, dtype=np.int64))
+		params.append(t)
+
+	return (np.concatenate(parts), np.concatenate(seg_ids), np.concatenate(params))
+
+
+def _bezier_xy(start, ctrl, end, t):
+	# Evaluates quadratic bezier curves at the given transition values (as in drawingutils)
+	return ctrl + (start - ctrl) * (1 - t) ** 2 + (end - ctrl) * t ** 2
+
+
+def _nearest_pieces(points, x1, y1, dx, dy, lens_sq, pieces=None):
+	# Finds the closest line of a path to each point, comparing each point either against
+	# every line or against the lines in its row of 'pieces' (padded with -1). Returns the
+	# index of the closest line, the transition value of the closest point along it, and
+	# the squared distance to it.
+	n = len(points)
+	width = len(x1) if pieces is None else pieces.shape[1]
+	out_idx = np.empty(n, dtype=np.int64)
+	out_t = np.empty(n)
+	out_dist_sq = np.empty(n)
+	chunk = max(_MAX_PAIRS // max(width, 1), 1)
+	for i in range(0, n, chunk):
+		if pieces is None:
+			idx = np.arange(len(x1))[None, :]
+			padding = None
+		else:
+			idx = pieces[i:i + chunk]
+			padding = idx < 0
+		px = points[i:i + chunk, 0, None] - x1[idx]
+		py = points[i:i + chunk, 1, None] - y1[idx]
+		t = np.clip((px * dx[idx] + py * dy[idx]) / lens_sq[idx], 0, 1)
+		px -= t * dx[idx]
+		py -= t * dy[idx]
+		dist_sq = px * px + py * py
+		if padding is not None:
+			dist_sq[padding] = np.inf
+		closest = np.argmin(dist_sq, axis=1)
+		rows = np.arange(len(closest))
+		out_idx[i:i + chunk] = np.broadcast_to(idx, dist_sq.shape)[rows, closest]
+		out_t[i:i + chunk] = t[rows, closest]
+		out_dist_sq[i:i + chunk] = dist_sq[rows, closest]
+
+	return (out_idx, out_t, out_dist_sq)
+
+
+class PathIndex(object):
+	"""A uniform grid index of the lines making up a path, for quickly finding the closest
+	point on the path to any number of points.
+
+	Each cell of the grid lists every line that could be the closest to any point within
+	the cell (i.e. every line no further from the cell's centre than the closest line,
+	plus the width of the cell), so queries are exact and take roughly constant time per
+	point. Points outside the grid are compared against every line of the path.
+
+	The points the index was built from are available as 'path' (None for indexes
+	built from segments), and the (x, y) coordinates of the points along the indexed
+	path as 'points'.
+
+	Args:
+		path (:obj:`numpy.ndarray`): The N x 2 (or N x 3, with times) array of points
+			along the path.
+		cell_size (float, optional): The width and height (in pixels) of each grid cell.
+			Defaults to 16.
+		padding (float, optional): The distance (in pixels) the grid extends beyond the
+			bounds of the path on each side. Defaults to 64.
+
+	"""
+	def __init__(self, path, cell_size=16.0, padding=64.0):
+		self.path = np.asarray(path, dtype=np.float64)
+		self.points = self.path[:, :2]
+		self.cell_size = float(cell_size)
+		self._curves = None
+
+		pts = self.points
+		if len(pts) == 1:
+			pts = np.concatenate([pts, pts])  # a single point is a zero-length line
+		self._x1, self._y1 = (pts[:-1, 0], pts[:-1, 1])
+		self._dx, self._dy = (np.diff(pts[:, 0]), np.diff(pts[:, 1]))
+		self._lens_sq = self._dx ** 2 + self._dy ** 2
+		self._lens_sq[self._lens_sq == 0] = 1.0  # zero-length lines are treated as points
+		self._lens = np.hypot(self._dx, self._dy)
+		self.arc_lengths = np.concatenate([[0.0], np.cumsum(self._lens)])[:len(self.points)]
+
+		self.origin = pts.min(axis=0) - padding
+		span = pts.max(axis=0) + padding - self.origin
+		self.shape = tuple(np.maximum(np.ceil(span / self.cell_size), 1).astype(int))
+		self._build()
+
+	@classmethod
+	def from_segments(cls, segments, spacing=4.0, **kwargs):
+		"""Creates an index for the path of a figure from its raw segments.
+
+		Closest points on curved segments are refined against the exact bezier curve, so
+		curves only need to be coarsely interpolated to find the right part of the figure.
+
+		Args:
+			segments (list): A list of [curve, points] figure segments.
+			spacing (float, optional): The approximate distance (in pixels) between the
+				interpolated points of curved segments. Defaults to 4.0.
+			**kwargs: Any additional keyword arguments for :class:`PathIndex`.
+
+		Returns:
+			:obj:`PathIndex`: The index of the figure's path.
+		"""
+		path, seg_ids, params = flatten_segments(segments, spacing)
+		index = cls(path, **kwargs)
+
+		# Store the bezier curve (if any) of each line, along with a key for each point
+		# that increases along the path (segment index plus transition value) for mapping
+		# points on curves back to distances along the path
+		curves = np.full((len(segments), 3, 2), np.nan)
+		for i, (curve, points) in enumerate(segments):
+			if curve:
+				start, end, ctrl = points
+				curves[i] = (start, ctrl, end)
+		keys = seg_ids + params
+		keys[0] = 0.0
+		index._curves = (curves, seg_ids[1:], keys)
+		index.path = None
+		return index
+
+	def _build(self):
+		# Lists the candidate lines for each grid cell: a line can only be the closest to a
+		# point in the cell if it's no further from the cell's centre than the closest line
+		# to the centre plus the distance from the centre to the cell's corners
+		nx, ny = self.shape
+		ix, iy = np.meshgrid(np.arange(nx), np.arange(ny), indexing='ij')
+		centres = self.origin + (np.column_stack([ix.ravel(), iy.ravel()]) + 0.5) * self.cell_size
+		reach = self.cell_size * math.sqrt(2)
+
+		cells, pieces = ([], [])
+		chunk = max(_MAX_PAIRS // len(self._x1), 1)
+		for i in range(0, len(centres), chunk):
+			px = centres[i:i + chunk, 0, None] - self._x1
+			py = centres[i:i + chunk, 1, None] - self._y1
+			t = np.clip((px * self._dx + py * self._dy) / self._lens_sq, 0, 1)
+			px -= t * self._dx
+			py -= t * self._dy
+			dist = np.sqrt(px * px + py * py)
+			c, p = np.nonzero(dist <= dist.min(axis=1, keepdims=True) + reach)
+			cells.append(c + i)
+			pieces.append(p)
+		cells, pieces = (np.concatenate(cells), np.concatenate(pieces))
+
+		# Candidates are found in order of cell, so each cell's are stored contiguously
+		self._pieces = pieces
+		self._counts = np.bincount(cells, minlength=len(centres))
+		self._starts = np.cumsum(self._counts) - self._counts
+
+	def _cell_pieces(self, cells):
+		# Gets the candidate lines for each of a set of grid cells, as the rows of an array
+		# padded with -1
+		counts = self._counts[cells]
+		cols = np.arange(counts.max())
+		pos = np.minimum(self._starts[cells, None] + cols, len(self._pieces) - 1)
+		return np.where(cols < counts[:, None], self._pieces[pos], -1)
+
+	def _cells(self, points):
+		# Gets the grid cell of each point, or -1 for points outside the grid
+		cell = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+		inside = np.all((cell >= 0) & (cell < self.shape), axis=1)
+		return np.where(inside, cell[:, 0] * self.shape[1] + cell[:, 1], -1)
+
+	def _refine(self, points, idx, t, dist_sq):
+		# Moves closest points on curved segments to the closest point on the exact curve,
+		# starting from the closest point on the interpolated path, and returns the distance
+		# to each closest point along with its distance along the path
+		dist = np.sqrt(dist_sq)
+		pos = self.arc_lengths[idx] + t * self._lens[idx]
+		curves, piece_seg, keys = self._curves
+		seg = piece_seg[idx]
+		on_curve = np.flatnonzero(~np.isnan(curves[seg, 0, 0]))
+		if not len(on_curve):
+			return (dist, pos)
+
+		p, seg, i = (points[on_curve], seg[on_curve], idx[on_curve])
+		start, ctrl, end = (curves[seg, 0], curves[seg, 1], curves[seg, 2])
+		a, b = (start - ctrl, end - ctrl)
+		lo, hi = (keys[i] - seg, keys[i + 1] - seg)
+		u = lo + t[on_curve] * (hi - lo)
+		for _ in range(_NEWTON_STEPS):
+			diff = _bezier_xy(start, ctrl, end, u[:, None]) - p
+			d1 = 2 * (b * u[:, None] - a * (1 - u[:, None]))
+			f = (diff * d1).sum(axis=1)
+			df = (d1 * d1).sum(axis=1) + (diff * 2 * (a + b)).sum(axis=1)
+			u = np.clip(u - f / np.where(df > 0, df, 1.0), 0, 1)
+
+		# Keep the estimate from the interpolated path if refining it didn't improve it
+		curve_dist = np.hypot(*(_bezier_xy(start, ctrl, end, u[:, None]) - p).T)
+		refined = curve_dist < dist[on_curve]
+		curve_pos = np.interp(seg + u, keys, self.arc_lengths)
+		dist[on_curve] = np.where(refined, curve_dist, dist[on_curve])
+		pos[on_curve] = np.where(refined, curve_pos, pos[on_curve])
+		return (dist, pos)
+
+	def nearest(self, points):
+		"""Finds the closest point on the path to each of a set of points.
+
+		Args:
+			points (:obj:`numpy.ndarray`): The N x 2 (or N x 3) array of points to find
+				the closest points on the path to.
+
+		Returns:
+			tuple: The distance from each point to the closest point on the path, and the
+			distance along the path (from its start) of that closest point.
+		"""
+		points = np.asarray(points, dtype=np.float64).reshape(len(points), -1)[:, :2]
+		cells = self._cells(points)
+		inside = cells >= 0
+		idx = np.empty(len(points), dtype=np.int64)
+		t = np.empty(len(points))
+		dist_sq = np.empty(len(points))
+		lines = (self._x1, self._y1, self._dx, self._dy, self._lens_sq)
+
+		# Group points by their number of candidates so most comparisons aren't padding
+		order = np.flatnonzero(inside)
+		order = order[np.argsort(self._counts[cells[order]], kind='stable')]
+		widths = self._counts[cells[order]]
+		bounds = np.flatnonzero(np.diff(np.ceil(np.log2(np.maximum(widths, 1))))) + 1
+		for group in np.split(order, bounds):
+			if not len(group):
+				continue
+			pieces = self._cell_pieces(cells[group])
+			idx[group], t[group], dist_sq[group] = _nearest_pieces(points[group], *lines, pieces)
+		outside = np.flatnonzero(~inside)
+		if len(outside):
+			idx[outside], t[outside], dist_sq[outside] = _nearest_pieces(points[outside], *lines)
+
+		if self._curves is not None:
+			return self._refine(points, idx, t, dist_sq)
+		return (np.sqrt(dist_sq), self.arc_lengths[idx] + t * self._lens[idx])
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""A single append-only archive for all the figure data written during a session.
+
+By default, each trial's figure and tracing are written to their own zip archive, which
+means opening (and rewriting the central directory of) an archive twice per trial and
+leaving hundreds of small files per participant. If 'use_session_archive' is enabled,
+all files for a session are instead appended to a single .tlsa file in the session's
+figure folder.
+
+A .tlsa file consists of a short header followed by a sequence of records, each holding
+one file along with the name of the trial archive it would normally have been written
+to. Records are only ever appended and each batch is flushed to disk before returning,
+so if the experiment crashes mid-write, at most the incomplete trailing record is lost
+(and discarded the next time the archive is opened). The archive is indexed by trial
+archive, file, block, and trial number in memory on opening, allowing quick random
+access to any file.
+
+To export a session archive back to the legacy layout of one zip per trial, run:
+
+	python sessionarchive.py path/to/session.tlsa [output_folder]
+
+Like figureio.py, this module intentionally has no dependencies on KLibs.
+
+"""
+
+import os
+import re
+import io
+import zlib
+import struct
+import zipfile
+from collections import OrderedDict
+
+
+SESSION_ARCHIVE = "session.tlsa"
+
+TLSA_MAGIC = b"TLSA"
+TLSA_VERSION = 1
+RECORD_MAGIC = b"TLSR"
+
+# magic, version, reserved
+_TLSA_HEADER = struct.Struct("<4sHH")
+# magic, compressed, archive name length, file name length, data length, crc32 of file
+_RECORD_HEADER = struct.Struct("<4sBHHII")
+
+_TRIAL_RE = re.compile(r"_b(\d+)_t(\d+)_")
+
+
+class SessionArchive(object):
+	"""An append-only archive of the figure files written during a session.
+
+	Files are grouped by the name of the trial archive they belong to (e.g.
+	'p1_s1_b1_t1_2020-01-01'), and writing a file with the same name to the same trial
+	archive more than once replaces the earlier copy (e.g. when a trial is redone after
+	resuming an incomplete session).
+
+	Args:
+		path (str): The path of the .tlsa file. It will be created if it doesn't exist.
+		read_only (bool, optional): Whether to open the archive for reading only, in which
+			case it must already exist and any incomplete record at the end is ignored
+			rather than removed from the file. Defaults to False.
+
+	"""
+	def __init__(self, path, read_only=False):
+		self.path = path
+		self.read_only = read_only
+		self.index = OrderedDict()
+		if not (read_only or os.path.exists(path)):
+			with io.open(path, 'wb') as f:
+				f.write(_TLSA_HEADER.pack(TLSA_MAGIC, TLSA_VERSION, 0))
+		self._f = io.open(path, 'rb' if read_only else 'r+b')
+		self._load()
+
+	def _load(self):
+		# Index all records in the archive, truncating any incomplete record at the end
+		# left by an interrupted write
+		header = self._f.read(_TLSA_HEADER.size)
+		magic, version = (None, None)
+		if len(header) == _TLSA_HEADER.size:
+			magic, version, _ = _TLSA_HEADER.unpack(header)
+		if magic != TLSA_MAGIC or version != TLSA_VERSION:
+			raise ValueError("'{0}' is not a valid session archive.".format(self.path))
+
+		end = self._f.seek(0, io.SEEK_END)
+		pos = _TLSA_HEADER.size
+		last = None  # the key, position, and replaced index entry of the last record
+		while pos + _RECORD_HEADER.size <= end:
+			self._f.seek(pos)
+			magic, compressed, a_len, n_len, size, crc = _RECORD_HEADER.unpack(
+				self._f.read(_RECORD_HEADER.size)
+			)
+			data_pos = pos + _RECORD_HEADER.size + a_len + n_len
+			if magic != RECORD_MAGIC or data_pos + size > end:
+				break
+			key = (self._f.read(a_len).decode('utf-8'), self._f.read(n_len).decode('utf-8'))
+			last = (key, pos, self.index.get(key))
+			self._add(key, (data_pos, size, bool(compressed), crc))
+			pos = data_pos + size
+
+		# Since records are only ever appended, only the last one can be incomplete
+		if last and not self._valid(last[0]):
+			key, pos, replaced = last
+			del self.index[key]
+			if replaced:
+				self.index[key] = replaced
+		if pos < end and not self.read_only:
+			self._f.truncate(pos)
+		self._f.seek(0, io.SEEK_END)
+
+	def _add(self, key, entry):
+		# Adds a record to the index, replacing any earlier record for the same file
+		self.index.pop(key, None)
+		self.index[key] = entry
+
+	def _valid(self, key):
+		try:
+			self.read(*key)
+			return True
+		except (ValueError, zlib.error):
+			return False
+
+	def append(self, files):
+		"""Appends a set of files to the archive, flushing them to disk before returning.
+
+		Args:
+			files (list): A list of (archive, name, data, compress) tuples, where 'archive'
+				is the name of the trial archive the file belongs to (without '.zip'),
+				'name' is the file's name, 'data' is its contents as bytes or text, and
+				'compress' is whether to compress it.
+		"""
+		self._f.seek(0, io.SEEK_END)
+		for archive, name, data, compress in files:
+			if not isinstance(data, bytes):
+				data = data.encode('utf-8')
+			crc = zlib.crc32(data) & 0xffffffff
+			if compress:
+				data = zlib.compress(data)
+			a, n = (archive.encode('utf-8'), name.encode('utf-8'))
+			header = _RECORD_HEADER.pack(RECORD_MAGIC, int(compress), len(a), len(n), len(data), crc)
+			pos = self._f.tell()
+			self._f.write(b"".join([header, a, n, data]))
+			data_pos = pos + len(header) + len(a) + len(n)
+			self._add((archive, name), (data_pos, len(data), bool(compress), crc))
+		self._f.flush()
+		os.fsync(self._f.fileno())
+
+	def read(self, archive, name):
+		"""Reads a file from the archive.
+
+		Args:
+			archive (str): The name of the trial archive the file belongs to.
+			name (str): The name of the file.
+
+		Returns:
+			bytes: The contents of the file.
+		"""
+		data_pos, size, compressed, crc = self.index[(archive, name)]
+		self._f.seek(data_pos)
+		data = self._f.read(size)
+		self._f.seek(0, io.SEEK_END)
+		if compressed:
+			data = zlib.decompress(data)
+		if zlib.crc32(data) & 0xffffffff != crc:
+			raise ValueError("'{0}' in '{1}' is corrupt.".format(name, self.path))
+		return data
+
+	def archives(self):
+		"""Gets the names of all trial archives in the session archive.
+
+		Returns:
+			list: The names of all trial archives, in the order they were first written.
+		"""
+		return list(OrderedDict.fromkeys(a for a, name in self.index.keys()))
+
+	def files(self, archive):
+		"""Gets the names of all files belonging to a given trial archive.
+
+		Args:
+			archive (str): The name of the trial archive.
+
+		Returns:
+			list: The names of the archive's files, in the order they were written.
+		"""
+		return [name for a, name in self.index.keys() if a == archive]
+
+	def find(self, block, trial):
+		"""Finds the trial archives for a given block and trial number.
+
+		Args:
+			block (int): The block number of the trial.
+			trial (int): The trial number of the trial within the block.
+
+		Returns:
+			list: The names of the matching trial archives.
+		"""
+		found = []
+		for archive in self.archives():
+			m = _TRIAL_RE.search(archive)
+			if m and (int(m.group(1)), int(m.group(2))) == (block, trial):
+				found.append(archive)
+		return found
+
+	def close(self):
+		"""Closes the archive file.
+		"""
+		self._f.close()
+
+
+def split_archive(path, out_dir=None):
+	"""Exports the contents of a session archive to separate zip archives for each trial,
+	as they would have been written without a session archive.
+
+	Args:
+		path (str): The path of the .tlsa file.
+		out_dir (str, optional): The folder to write the trial archives to. Defaults to
+			the folder containing the session archive.
+
+	Returns:
+		list: The paths of the trial archives written.
+	"""
+	if out_dir is None:
+		out_dir = os.path.dirname(path)
+	if not os.path.exists(out_dir):
+		os.makedirs(out_dir)
+
+	written = []
+	archive = SessionArchive(path, read_only=True)
+	try:
+		for name in archive.archives():
+			zip_path = os.path.join(out_dir, name + ".zip")
+			with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as trial_zip:
+				for f in archive.files(name):
+					compressed = archive.index[(name, f)][2]
+					compression = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+					trial_zip.writestr(f, archive.read(name, f), compression)
+			written.append(zip_path)
+	finally:
+		archive.close()
+
+	return written
+
+
+if __name__ == "__main__":
+
+	import sys
+
+	out_dir = sys.argv[2] if len(sys.argv) > 2 else None
+	for p in split_archive(sys.argv[1], out_dir):
+		print("Wrote '{0}'".format(p))
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the cached path data and animation logic of TraceLabFigure.
+
+Figures are created without calling their constructor (which needs a running KLibs
+experiment), with their segments set directly.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import pytest
+import numpy as np
+
+import TraceLabFigure as tlf
+from drawingutils import segments_length, bezier_length
+
+
+# Two lines of length 30 and 40, a curve, and a line of length 50
+SEGMENTS = [
+	[False, ((0, 0), (30, 0))],
+	[False, ((30, 0), (30, 40))],
+	[True, ((30, 40), (130, 40), (80, 140))],
+	[False, ((130, 40), (160, 0))],
+]
+CURVE_LEN = bezier_length((30, 40), (80, 140), (130, 40))
+
+
+def _figure(segments=SEGMENTS):
+	fig = tlf.TraceLabFigure.__new__(tlf.TraceLabFigure)
+	fig.raw_segments = segments
+	return fig
+
+
+def test_cumulative_lengths():
+	fig = _figure()
+	expected = [0, 30, 70, 70 + CURVE_LEN, 120 + CURVE_LEN]
+	assert np.allclose(fig.segment_lengths, [30, 40, CURVE_LEN, 50])
+	assert np.allclose(fig.cumulative_lengths, expected)
+	assert fig.path_length == pytest.approx(segments_length(SEGMENTS))
+
+
+@pytest.mark.parametrize("dist, segment, offset", [
+	(0, 0, 0),
+	(29.999, 0, 29.999),
+	(30, 1, 0),  # boundaries belong to the segment that starts there
+	(30.001, 1, 0.001),
+	(70, 2, 0),
+	(70 + CURVE_LEN, 3, 0),
+	(120 + CURVE_LEN, 3, 50),  # end of the path is in the last segment
+	(-5, 0, -5),  # distances before the start clamp to the first segment
+	(125 + CURVE_LEN, 3, 55),  # distances past the end clamp to the last segment
+])
+def test_segment_at(dist, segment, offset):
+	i, seg_dist = _figure().segment_at(dist)
+	assert i == segment
+	assert seg_dist == pytest.approx(offset)
+
+
+def test_segment_at_exact_boundaries():
+	# Every cumulative length should map to the start of its own segment
+	fig = _figure()
+	for i, dist in enumerate(fig.cumulative_lengths[:-1]):
+		assert fig.segment_at(dist) == (i, 0)
+
+
+def test_setting_segments_clears_caches():
+	fig = _figure()
+	fig.segment_lengths
+	fig.cumulative_lengths
+	fig.path_index
+	fig._textures[("key",)] = ("texture", (0, 0, 10, 10))
+	fig.frame_sets[5000.0] = [(0, 0)]
+
+	new_segments = [[False, ((0, 0), (0, 25))], [False, ((0, 25), (60, 25))]]
+	fig.raw_segments = new_segments
+	assert fig.raw_segments is new_segments
+	assert fig._textures == {}
+	assert fig.frame_sets == {}
+	assert fig._path_index is None
+	assert np.allclose(fig.segment_lengths, [25, 60])
+	assert np.allclose(fig.cumulative_lengths, [0, 25, 85])
+	assert fig.path_length == 85
+	assert fig.segment_at(25) == (1, 0)
+	assert fig.path_index is not None
+
+
+# Animation tests
+
+REFRESH_RATE = 60.0
+FRAMES = [(i * 10, 100 + i) for i in range(10)]
+
+
+class _FakeDisplay(object):
+	# A screen whose flips complete at given refresh counts, with a matching clock
+
+	def __init__(self, flip_refreshes, start=100.0):
+		self._flips = iter(flip_refreshes)
+		self.start = start
+		self.now = start
+		self.drawn = []
+
+	def flip(self):
+		self.now = self.start + next(self._flips) / REFRESH_RATE
+
+	def time(self):
+		return self.now
+
+
+class _FakeCompositor(object):
+
+	def __init__(self, display):
+		self.display = display
+
+	def set_layer(self, name, texture, registration, location):
+		pass
+
+	def draw(self, moving=()):
+		self.display.drawn.append(moving[0][2])
+
+	def clear(self):
+		pass
+
+
+def _animate(monkeypatch, flip_refreshes, time_driven=True):
+	display = _FakeDisplay(flip_refreshes)
+	monkeypatch.setattr(tlf, "flip", display.flip)
+	monkeypatch.setattr(tlf, "time", display.time)
+	monkeypatch.setattr(tlf, "ui_request", lambda: None)
+	monkeypatch.setattr(tlf, "Compositor", lambda: _FakeCompositor(display))
+	monkeypatch.setattr(tlf.P, "refresh_rate", REFRESH_RATE, raising=False)
+	monkeypatch.setattr(tlf.P, "demo_mode", False, raising=False)
+	monkeypatch.setattr(tlf.P, "time_driven_animation", time_driven, raising=False)
+
+	class _Figure(tlf.TraceLabFigure):
+		exp = type("Experiment", (object,), {'tracker_dot': "dot"})
+
+	fig = _Figure.__new__(_Figure)
+	fig.raw_segments = SEGMENTS
+	fig.a_frames = FRAMES
+	fig.animate()
+	return (fig, display)
+
+
+def _expected(shown, flip_refreshes):
+	return [
+		(FRAMES[i][0], FRAMES[i][1], pytest.approx(r / REFRESH_RATE))
+		for i, r in zip(shown, flip_refreshes)
+	]
+
+
+def test_animate_on_schedule(monkeypatch):
+	refreshes = list(range(10))
+	fig, display = _animate(monkeypatch, refreshes)
+	assert display.drawn == FRAMES
+	assert fig.trial_a_frames == _expected(range(10), refreshes)
+	assert fig.skipped_frames == []
+	assert fig.flip_times == pytest.approx([100 + r / REFRESH_RATE for r in refreshes])
+
+
+def test_animate_skips_after_missed_refreshes(monkeypatch):
+	# The flip showing frame 2 takes three refreshes, so frames 3 and 4 would be late and
+	# are skipped to show frame 5 on the next refresh
+	refreshes = [0, 1, 4, 5, 6, 7, 8, 9]
+	fig, display = _animate(monkeypatch, refreshes)
+	shown = [0, 1, 2, 5, 6, 7, 8, 9]
+	assert display.drawn == [FRAMES[i] for i in shown]
+	assert fig.trial_a_frames == _expected(shown, refreshes)
+	assert fig.skipped_frames == [3, 4]
+	# Recorded frames keep the legacy (x, y, onset) format with no placeholder entries
+	assert all(t is not None for x, y, t in fig.trial_a_frames)
+
+
+def test_animate_always_shows_last_frame(monkeypatch):
+	# Falling far behind near the end skips straight to the final frame, which is shown
+	refreshes = [0, 1, 2, 3, 4, 5, 12, 13]
+	fig, display = _animate(monkeypatch, refreshes)
+	shown = [0, 1, 2, 3, 4, 5, 6, 9]
+	assert display.drawn == [FRAMES[i] for i in shown]
+	assert fig.trial_a_frames == _expected(shown, refreshes)
+	assert fig.skipped_frames == [7, 8]
+
+
+def test_animate_frame_locked(monkeypatch):
+	# Without time-driven animation, every frame is shown regardless of missed refreshes
+	refreshes = [0, 1, 4, 5, 6, 7, 8, 9, 10, 11]
+	fig, display = _animate(monkeypatch, refreshes, time_driven=False)
+	assert display.drawn == FRAMES
+	assert fig.trial_a_frames == _expected(range(10), refreshes)
+	assert fig.skipped_frames == []
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the static layer drawing in compositor.
+
+OpenGL calls are recorded by a fake GL module rather than drawn, so these can be run
+without a display.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import pytest
+import numpy as np
+
+import compositor
+import TraceLabFigure as tlf
+from compositor import Compositor, StaticLayer, registration_offset
+
+
+SCREEN_RES = (1000, 800)
+
+
+class _FakeGL(object):
+	# Records every GL call made, with GL_* constants as distinct bit flags
+
+	def __init__(self):
+		self.calls = []
+		self._constants = {}
+
+	def __getattr__(self, name):
+		if name.startswith("GL_"):
+			return self._constants.setdefault(name, 2 ** len(self._constants))
+		def _call(*args):
+			self.calls.append((name,) + args)
+			return 1
+		return _call
+
+	def called(self, name):
+		return [c[1:] for c in self.calls if c[0] == name]
+
+
+@pytest.fixture
+def gl(monkeypatch):
+	fake = _FakeGL()
+	monkeypatch.setattr(compositor, "GL", fake)
+	return fake
+
+
+@pytest.fixture
+def blits(monkeypatch):
+	drawn = []
+	monkeypatch.setattr(compositor, "GL", None)
+	monkeypatch.setattr(compositor, "fill", lambda: None)
+	monkeypatch.setattr(compositor, "blit",
+		lambda texture, registration, location, flip_x: drawn.append((location, flip_x))
+	)
+	return drawn
+
+
+def _quad(gl):
+	# Returns the texture coordinates and vertices of the last quad drawn, in order
+	return list(zip(gl.called("glTexCoord2f"), gl.called("glVertex2f")))[-4:]
+
+
+def test_registration_offset():
+	assert registration_offset(7, 40, 20) == (0, 0)
+	assert registration_offset(5, 40, 20) == (-20, -10)
+	assert registration_offset(3, 40, 20) == (-40, -20)
+
+
+@pytest.mark.parametrize("flip_x, u", [(False, (0, 1)), (True, (1, 0))])
+def test_draw_quad(gl, flip_x, u):
+	layer = StaticLayer(np.zeros((20, 40, 4), dtype=np.uint8), 5, (100, 200))
+	layer.draw(flip_x)
+	assert _quad(gl) == [
+		((u[0], 0), (80, 190)), ((u[1], 0), (120, 190)),
+		((u[1], 1), (120, 210)), ((u[0], 1), (80, 210)),
+	]
+
+
+def test_draw_restores_gl_state(gl):
+	layer = StaticLayer(np.zeros((20, 40, 4), dtype=np.uint8), 7, (0, 0))
+	layer.draw()
+	layer.draw()
+	names = [c[0] for c in gl.calls]
+	# The texture is only uploaded once, and all state changes happen between a push
+	# and a pop of the attributes they belong to
+	assert names.count("glTexImage2D") == 1
+	assert names.count("glPushAttrib") == names.count("glPopAttrib") == 2
+	mask = gl.called("glPushAttrib")[0][0]
+	for bit in ("GL_ENABLE_BIT", "GL_COLOR_BUFFER_BIT", "GL_TEXTURE_BIT"):
+		assert mask & getattr(gl, bit)
+	last_draw = names[names.index("glPopAttrib") + 1:]
+	assert last_draw[0] == "glPushAttrib" and last_draw[-1] == "glPopAttrib"
+	assert "glDisable" not in names
+
+
+def test_set_layer_keeps_unchanged_texture(gl):
+	texture = np.zeros((20, 40, 4), dtype=np.uint8)
+	layers = Compositor()
+	layers.set_layer("figure", texture, 7, (10, 10))
+	layers.layers["figure"].draw()
+	layers.set_layer("figure", texture, 7, [10, 10])
+	layers.layers["figure"].draw()
+	assert len(gl.called("glTexImage2D")) == 1
+	layers.set_layer("figure", texture, 7, (20, 10))
+	assert len(gl.called("glDeleteTextures")) == 1
+	layers.clear()
+	assert layers.layers == {}
+
+
+# Flipped figure layers
+
+def _rendered_figure(monkeypatch, flip_x):
+	# A figure rendered to a cropped texture with a single marked column
+	monkeypatch.setattr(tlf.P, "flip_x", flip_x, raising=False)
+	monkeypatch.setattr(tlf.P, "screen_x", SCREEN_RES[0], raising=False)
+	fig = tlf.TraceLabFigure.__new__(tlf.TraceLabFigure)
+	fig.rendered = np.zeros((50, 80, 4), dtype=np.uint8)
+	fig.rendered[:, 10] = 255
+	fig.rendered_pos = (300, 400)
+	return fig
+
+
+@pytest.mark.parametrize("flip_x", [False, True])
+def test_flipped_figure_layer(gl, monkeypatch, flip_x):
+	fig = _rendered_figure(monkeypatch, flip_x)
+	layers = Compositor()
+	layers.set_layer("figure", fig.rendered, 7, fig.rendered_location)
+	monkeypatch.setattr(compositor, "fill", lambda: None)
+	layers.draw()
+
+	# The marked column is at x = 310.5 on the unflipped screen, so it should be drawn
+	# at 1000 - 310.5 = 689.5 when flipped (i.e. the layer's location shouldn't be
+	# mirrored a second time when it's drawn)
+	(u1, _), (x1, y1) = _quad(gl)[0]
+	(u2, _), (x2, _) = _quad(gl)[1]
+	u = (10 + 0.5) / fig.rendered.shape[1]
+	x = x1 + (u - u1) / (u2 - u1) * (x2 - x1)
+	assert (x2 - x1, y1) == (80, 400)
+	assert x == pytest.approx(689.5 if flip_x else 310.5)
+
+
+@pytest.mark.parametrize("flip_x", [False, True])
+def test_flipped_figure_blit_fallback(blits, monkeypatch, flip_x):
+	fig = _rendered_figure(monkeypatch, flip_x)
+	layers = Compositor()
+	layers.set_layer("figure", fig.rendered, 7, fig.rendered_location)
+	layers.draw([("dot", 5, (500, 500))])
+	# Without OpenGL, layers are drawn with blit() at the same location as blit_rendered()
+	expected = (620, 400) if flip_x else (300, 400)
+	assert blits == [(expected, flip_x), ((500, 500), flip_x)]
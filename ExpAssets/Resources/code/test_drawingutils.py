@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+"""Parity tests for the figure interpolation functions in drawingutils.
+
+Frames for pre-generated figures need to stay identical across versions of TraceLab so
+that the stimuli shown to participants don't change partway through a study, so these
+tests compare the vectorized interpolation functions against copies of the original
+loop-based implementations for every bundled figure.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+import math
+import runpy
+
+import pytest
+import numpy as np
+
+import drawingutils
+from drawingutils import line_segment_len
+from figureio import read_figure
+
+
+FIGURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "figures")
+FIGURES = sorted(f[:-4] for f in os.listdir(FIGURE_DIR) if f.endswith(".zip"))
+PARAMS_FILE = os.path.join(FIGURE_DIR, "..", "..", "Config", "TraceLab_params.py")
+DURATIONS = [1000.0, 1750.0, 2500.0, 5000.0]
+REFRESH_RATES = [60.0, 75.0, 120.0, 144.0]
+
+
+def _load_segments(figure):
+	points, segments, figure_res = read_figure(os.path.join(FIGURE_DIR, figure))
+	return segments
+
+
+def _curves(figure):
+	return [points for curve, points in _load_segments(figure) if curve]
+
+
+# Reference copies of the original loop-based interpolation functions
+
+def legacy_linear_transitions_by_dist(start, end, dist_per_frame, offset=0):
+	dist = float(line_segment_len(start, end))
+	frames = int(round((dist - offset) / float(dist_per_frame), 8))
+	transitions = [(offset + f * dist_per_frame) / dist for f in range(frames + 1)]
+	return transitions
+
+
+def legacy_linear_interpolation(start, end, transitions):
+	x = [int(start[0] + t * (end[0] - start[0])) for t in transitions]
+	y = [int(start[1] + t * (end[1] - start[1])) for t in transitions]
+	return list(zip(x, y))
+
+
+def legacy_bezier_length(start, ctrl, end):
+	ax = start[0] - 2 * ctrl[0] + end[0]
+	ay = start[1] - 2 * ctrl[1] + end[1]
+	bx = 2 * ctrl[0] - 2 * start[0]
+	by = 2 * ctrl[1] - 2 * start[1]
+
+	A = 4 * (ax ** 2 + ay ** 2)
+	B = 4 * (ax * bx + ay * by)
+	C = bx ** 2 + by ** 2
+
+	sqrtABC = 2 * math.sqrt(A + B + C)
+	A2 = math.sqrt(A)
+	A32 = 2 * A * A2
+	C2 = 2 * math.sqrt(C)
+	BA = B / float(A2)
+
+	n1 = A32 * sqrtABC + A2 * B * (sqrtABC - C2)
+	n2 = ((4 * C * A) - B ** 2) * math.log((2 * A2 + BA + sqrtABC) / (BA + C2))
+	d = 4 * A32
+
+	return (n1 + n2) / float(d)
+
+
+def legacy_bezier_points(start, ctrl, end, points=100):
+	transitions = [i / float(points) for i in range(0, points + 1)]
+	ax, ay = (start[0] - ctrl[0], start[1] - ctrl[1])
+	bx, by = (end[0] - ctrl[0], end[1] - ctrl[1])
+	x = [ctrl[0] + ax * (1 - t) ** 2 + bx * t ** 2 for t in transitions]
+	y = [ctrl[1] + ay * (1 - t) ** 2 + by * t ** 2 for t in transitions]
+	return (x, y)
+
+
+def legacy_bezier_distmap(start, ctrl, end, res=200):
+	x, y = legacy_bezier_points(start, ctrl, end, points=res)
+	dist_map = [0.0]
+	total_dist = 0
+	for i in range(0, res - 1):
+		dx = x[i + 1] - x[i]
+		dy = y[i + 1] - y[i]
+		total_dist += math.sqrt(dx ** 2 + dy ** 2)
+		dist_map.append(total_dist)
+	return dist_map
+
+
+def _legacy_distmap_transition(dist_map, seg_len, res):
+	for i in range(res):
+		if i == (res - 1):
+			t = i
+			break
+		elif dist_map[i + 1] >= seg_len:
+			t_diff = (seg_len - dist_map[i]) / (dist_map[i + 1] - dist_map[i])
+			t = i + t_diff
+			break
+	return t / float(res - 1)
+
+
+def legacy_bezier_transitions(start, ctrl, end, velocity, fps=60):
+	res = 200
+	dist_map = legacy_bezier_distmap(start, ctrl, end, res)
+	total_dist = dist_map[-1]
+	duration = total_dist / velocity
+	steps = int(round(duration / (1000.0 / fps)))
+	stepsize = total_dist / steps
+	return [_legacy_distmap_transition(dist_map, stepsize * s, res) for s in range(steps + 1)]
+
+
+def legacy_bezier_transitions_by_dist(start, ctrl, end, dist_per_frame, offset=0):
+	res = 200
+	dist_map = legacy_bezier_distmap(start, ctrl, end, res)
+	dist = legacy_bezier_length(start, ctrl, end)
+	frames = int(round((dist - offset) / float(dist_per_frame), 8))
+	return [
+		_legacy_distmap_transition(dist_map, offset + f * dist_per_frame, res)
+		for f in range(frames + 1)
+	]
+
+
+def legacy_bezier_interpolation(start, end, ctrl, transitions):
+	ax, ay = (start[0] - ctrl[0], start[1] - ctrl[1])
+	bx, by = (end[0] - ctrl[0], end[1] - ctrl[1])
+	x = [int(ctrl[0] + ax * (1 - t) ** 2 + bx * t ** 2) for t in transitions]
+	y = [int(ctrl[1] + ay * (1 - t) ** 2 + by * t ** 2) for t in transitions]
+	return list(zip(x, y))
+
+
+def legacy_segments_length(segments):
+	length = 0
+	for curve, points in segments:
+		if curve:
+			start, end, ctrl = points
+			length += legacy_bezier_length(start, ctrl, end)
+		else:
+			start, end = points
+			length += line_segment_len(start, end)
+	return length
+
+
+def legacy_segments_to_frames(segments, duration, fps=60):
+	path_len = legacy_segments_length(segments)
+	total_frames = int(round(duration / (1000.0 / fps)))
+	dist_per_frame = path_len / total_frames
+
+	offset = 0
+	fig_frames = []
+	for curve, points in segments:
+		if curve:
+			start, end, ctrl = points
+			dist = legacy_bezier_length(start, ctrl, end)
+			transitions = legacy_bezier_transitions_by_dist(start, ctrl, end, dist_per_frame, offset)
+			fig_frames += legacy_bezier_interpolation(start, end, ctrl, transitions)
+		else:
+			start, end = points
+			dist = line_segment_len(start, end)
+			transitions = legacy_linear_transitions_by_dist(start, end, dist_per_frame, offset)
+			fig_frames += legacy_linear_interpolation(start, end, transitions)
+		frames = len(transitions) - 1
+		offset = (frames + 1) * dist_per_frame - (dist - offset)
+
+	return fig_frames
+
+
+# Parity tests
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_segments_to_frames_matches_legacy(figure):
+	segments = _load_segments(figure)
+	for duration in DURATIONS:
+		for fps in REFRESH_RATES:
+			expected = legacy_segments_to_frames(segments, duration, fps)
+			frames = drawingutils.segments_to_frames(segments, duration, fps)
+			assert frames == expected, (duration, fps)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_segments_to_frame_sets_matches_legacy(figure):
+	segments = _load_segments(figure)
+	timings = [(d, fps) for d in DURATIONS for fps in REFRESH_RATES]
+	frame_sets = drawingutils.segments_to_frame_sets(segments, timings)
+	for (duration, fps), frames in zip(timings, frame_sets):
+		assert frames == legacy_segments_to_frames(segments, duration, fps), (duration, fps)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_bezier_distmap_matches_legacy(figure):
+	for start, end, ctrl in _curves(figure):
+		dist_map = drawingutils.bezier_distmap(start, ctrl, end)
+		expected = legacy_bezier_distmap(start, ctrl, end)
+		assert np.allclose(dist_map, expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_bezier_transitions_match_legacy(figure):
+	for start, end, ctrl in _curves(figure):
+		for velocity in (0.25, 0.5, 1.0):
+			for fps in REFRESH_RATES:
+				transitions = drawingutils.bezier_transitions(start, ctrl, end, velocity, fps)
+				expected = legacy_bezier_transitions(start, ctrl, end, velocity, fps)
+				assert len(transitions) == len(expected)
+				assert np.allclose(transitions, expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_bezier_transitions_by_dist_match_legacy(figure):
+	for start, end, ctrl in _curves(figure):
+		for dist_per_frame in (1.5, 4.0, 9.25):
+			for offset in (0, 0.75, 3.2):
+				transitions = drawingutils.bezier_transitions_by_dist(
+					start, ctrl, end, dist_per_frame, offset
+				)
+				expected = legacy_bezier_transitions_by_dist(
+					start, ctrl, end, dist_per_frame, offset
+				)
+				assert len(transitions) == len(expected)
+				assert np.allclose(transitions, expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_interpolation_matches_legacy(figure):
+	transitions = np.linspace(0, 1, 257)
+	for curve, points in _load_segments(figure):
+		if curve:
+			start, end, ctrl = points
+			frames = drawingutils.bezier_interpolation(start, end, ctrl, transitions)
+			expected = legacy_bezier_interpolation(start, end, ctrl, transitions.tolist())
+		else:
+			start, end = points
+			frames = drawingutils.linear_interpolation(start, end, transitions)
+			expected = legacy_linear_interpolation(start, end, transitions.tolist())
+		assert frames == expected
+
+
+# Arc-length transition tests
+
+SPECIAL_CURVES = [
+	((0, 0), (50, 0), (100, 0)),  # control point exactly between start & end (straight line)
+	((0, 0), (30, 30), (100, 100)),  # control point collinear but off-center
+	((0, 0), (200, 0), (50, 0)),  # control point beyond end (curve doubles back on itself)
+	((10, 10), (10, 10), (300, 120)),  # control point same as start point
+	((10, 10), (300, 120), (300, 120)),  # control point same as end point
+]
+TOLERANCES = [0.001, 0.1]
+
+
+def _dense_length(start, ctrl, end, t=1.0, samples=200000):
+	x, y = drawingutils._bezier_xy(start, ctrl, end, np.linspace(0, t, samples + 1))
+	return np.sum(np.sqrt(np.diff(x) ** 2 + np.diff(y) ** 2))
+
+
+def _all_curves():
+	curves = list(SPECIAL_CURVES)
+	for figure in FIGURES:
+		curves += [(start, ctrl, end) for start, end, ctrl in _curves(figure)]
+	return curves
+
+
+@pytest.mark.parametrize("curve", SPECIAL_CURVES + [c for f in FIGURES for c in _curves(f)[:2]])
+def test_bezier_arc_length_matches_polyline(curve):
+	start, ctrl, end = curve
+	for t in (0.25, 0.5, 0.8, 1.0):
+		expected = _dense_length(start, ctrl, end, t)
+		assert abs(float(drawingutils.bezier_arc_length(start, ctrl, end, t)) - expected) < 1e-3
+
+
+@pytest.mark.parametrize("tolerance", TOLERANCES)
+def test_bezier_arc_transitions_within_tolerance(tolerance):
+	for start, ctrl, end in _all_curves():
+		total = float(drawingutils.bezier_arc_length(start, ctrl, end, 1.0))
+		dists = np.linspace(0, total, 97)
+		transitions = drawingutils.bezier_arc_transitions(start, ctrl, end, dists, tolerance)
+		lengths = drawingutils.bezier_arc_length(start, ctrl, end, transitions)
+		assert np.all(np.abs(lengths - dists) <= tolerance)
+		assert np.all((transitions >= 0) & (transitions <= 1))
+		assert np.all(np.diff(transitions) >= 0)
+
+
+def test_bezier_arc_transitions_clamped_to_curve():
+	start, ctrl, end = SPECIAL_CURVES[2]
+	total = float(drawingutils.bezier_arc_length(start, ctrl, end, 1.0))
+	transitions = drawingutils.bezier_arc_transitions(start, ctrl, end, [-5.0, total + 5.0])
+	assert np.allclose(transitions, [0.0, 1.0])
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_no_tolerance_matches_legacy(figure):
+	segments = _load_segments(figure)
+	for duration in DURATIONS:
+		for fps in REFRESH_RATES:
+			expected = legacy_segments_to_frames(segments, duration, fps)
+			frames = drawingutils.segments_to_frames(segments, duration, fps, tolerance=None)
+			assert frames == expected, (duration, fps)
+	for start, end, ctrl in _curves(figure):
+		transitions = drawingutils.bezier_transitions_by_dist(
+			start, ctrl, end, 4.0, 0.75, tolerance=None
+		)
+		expected = legacy_bezier_transitions_by_dist(start, ctrl, end, 4.0, 0.75)
+		assert np.allclose(transitions, expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_tolerance_frame_count_matches_legacy(figure):
+	# Exact arc-length spacing should only move frames along the path, never add/drop any
+	segments = _load_segments(figure)
+	for duration in DURATIONS:
+		for fps in REFRESH_RATES:
+			frames = drawingutils.segments_to_frames(segments, duration, fps, tolerance=0.001)
+			legacy = legacy_segments_to_frames(segments, duration, fps)
+			assert len(frames) == len(legacy)
+
+
+def test_default_tolerance_keeps_legacy_frames():
+	# Exact arc-length spacing moves most frames on curves (by up to several pixels), so it
+	# needs to stay opt-in to keep the stimuli of ongoing studies unchanged
+	tolerance = runpy.run_path(PARAMS_FILE)['arc_length_tolerance']
+	assert tolerance is None
+	for figure in FIGURES:
+		segments = _load_segments(figure)
+		for duration in DURATIONS:
+			expected = legacy_segments_to_frames(segments, duration, 60.0)
+			frames = drawingutils.segments_to_frames(segments, duration, 60.0, tolerance=tolerance)
+			assert frames == expected, (figure, duration)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the on-disk figure cache in figurecache.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+import shutil
+
+import pytest
+
+import figurecache
+from figurecache import FigureCache, cache_key
+from figureio import read_figure, write_archive_member
+
+
+FIGURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "figures")
+PARAMS = ((1920, 1080), "r", 60.0, None)
+
+
+@pytest.fixture
+def archive(tmpdir):
+	path = str(tmpdir.join("heart.zip"))
+	shutil.copy(os.path.join(FIGURE_DIR, "heart.zip"), path)
+	return path
+
+
+def _figure_data(archive):
+	points, segments, figure_res = read_figure(archive)
+	frames = {
+		1000.0: [(x, y) for x in range(0, 50, 5) for y in (7, -3)],
+		2500.5: [(960, 780), (961, 779), (-1, 2 ** 20)],
+	}
+	return (points, segments, frames, figure_res)
+
+
+def test_cache_key_stable(archive):
+	assert cache_key(archive, *PARAMS) == cache_key(archive[:-4], *PARAMS)
+
+
+def test_cache_key_changes_with_archive(archive):
+	key = cache_key(archive, *PARAMS)
+	write_archive_member(archive, "heart/notes.txt", b"modified")
+	new_key = cache_key(archive, *PARAMS)
+	assert new_key != key
+	# Only the archive part of the key should change
+	assert new_key.split("-")[0] != key.split("-")[0]
+	assert new_key.split("-")[1] == key.split("-")[1]
+
+
+@pytest.mark.parametrize("changed", [
+	((2560, 1440), "r", 60.0, None),
+	((1920, 1080), "l", 60.0, None),
+	((1920, 1080), "r", 120.0, None),
+	((1920, 1080), "r", 60.0, 0.001),
+])
+def test_cache_key_changes_with_params(archive, changed):
+	key = cache_key(archive, *PARAMS)
+	new_key = cache_key(archive, *changed)
+	assert new_key != key
+	assert new_key.split("-")[0] == key.split("-")[0]
+
+
+def test_cache_key_changes_with_version(archive, monkeypatch):
+	key = cache_key(archive, *PARAMS)
+	monkeypatch.setattr(figurecache, "CACHE_VERSION", figurecache.CACHE_VERSION + 1)
+	assert cache_key(archive, *PARAMS) != key
+
+
+def test_save_then_load(archive, tmpdir):
+	cache = FigureCache(str(tmpdir.join("cache")))
+	key = cache_key(archive, *PARAMS)
+	points, segments, frames, figure_res = _figure_data(archive)
+	assert cache.load("heart", key) is None
+
+	cache.save("heart", key, points, segments, frames, figure_res)
+	cached = cache.load("heart", key)
+	assert cached['points'] == points
+	assert cached['segments'] == segments
+	assert cached['frames'] == frames
+	assert all(type(f) is tuple for f in cached['frames'][1000.0])
+	assert cache.load("heart", cache_key(archive, (800, 600), "r", 60.0)) is None
+
+
+def test_load_after_version_change(archive, tmpdir, monkeypatch):
+	cache = FigureCache(str(tmpdir.join("cache")))
+	key = cache_key(archive, *PARAMS)
+	cache.save("heart", key, *_figure_data(archive))
+	monkeypatch.setattr(figurecache, "CACHE_VERSION", figurecache.CACHE_VERSION + 1)
+	assert cache.load("heart", key) is None
+
+
+def test_load_corrupt_file(archive, tmpdir):
+	cache = FigureCache(str(tmpdir.join("cache")))
+	key = cache_key(archive, *PARAMS)
+	cache.save("heart", key, *_figure_data(archive))
+	with open(cache._cache_path("heart", key), "wb") as f:
+		f.write(b"not a cache file")
+	assert cache.load("heart", key) is None
+
+
+def test_stale_files_removed(archive, tmpdir):
+	cache_dir = str(tmpdir.join("cache"))
+	cache = FigureCache(cache_dir)
+	data = _figure_data(archive)
+
+	old_key = cache_key(archive, *PARAMS)
+	other_display = cache_key(archive, (2560, 1440), "r", 60.0)
+	cache.save("heart", old_key, *data)
+	cache.save("heart", other_display, *data)
+	cache.save("heart_2", cache_key(archive, *PARAMS), *data)
+	unrelated = os.path.join(cache_dir, "heart_notes.npz")
+	open(unrelated, "wb").close()
+
+	# Saving a copy made from a modified archive should remove the copies made from the
+	# old version of it (for any parameters), but leave other figures' files alone
+	write_archive_member(archive, "heart/notes.txt", b"modified")
+	new_key = cache_key(archive, *PARAMS)
+	cache.save("heart", new_key, *data)
+	files = sorted(os.listdir(cache_dir))
+	assert files == sorted([
+		"heart_{0}.npz".format(new_key),
+		"heart_2_{0}.npz".format(old_key),
+		"heart_notes.npz",
+	])
+	assert cache.load("heart", new_key)['frames'] == data[2]
+	assert cache.load("heart", old_key) is None
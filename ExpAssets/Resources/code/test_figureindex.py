@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the incrementally-refreshed figure library index in figureindex.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+import json
+import shutil
+
+import pytest
+
+import figureindex
+from figureindex import FigureIndex, INDEX_FILE
+from figureio import write_archive_member
+
+
+FIGURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "figures")
+FIGURES = sorted(f[:-4] for f in os.listdir(FIGURE_DIR) if f.endswith(".zip"))
+
+
+@pytest.fixture
+def fig_dir(tmpdir):
+	for figure in FIGURES[:3]:
+		shutil.copy(os.path.join(FIGURE_DIR, figure + ".zip"), str(tmpdir))
+	return str(tmpdir)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+	# Records the archives read by the index, to check that unchanged ones are skipped
+	read = []
+	figure_info = figureindex.figure_info
+	def _figure_info(path):
+		read.append(os.path.basename(path)[:-4])
+		return figure_info(path)
+	monkeypatch.setattr(figureindex, "figure_info", _figure_info)
+	return read
+
+
+def _saved(fig_dir):
+	with open(os.path.join(fig_dir, INDEX_FILE)) as f:
+		return json.load(f)['figures']
+
+
+def test_build_index(fig_dir, reads):
+	index = FigureIndex(fig_dir)
+	assert index.names == FIGURES[:3]
+	assert sorted(reads) == FIGURES[:3]
+	assert sorted(_saved(fig_dir).keys()) == FIGURES[:3]
+	info = index[FIGURES[0]]
+	assert info['name'] == FIGURES[0]
+	assert info['size'] == os.path.getsize(os.path.join(fig_dir, FIGURES[0] + ".zip"))
+
+	# Reopening the index shouldn't re-read any unchanged archives
+	del reads[:]
+	index = FigureIndex(fig_dir)
+	assert index.refresh() == []
+	assert reads == []
+	assert index.names == FIGURES[:3]
+
+
+def test_add_figure(fig_dir, reads):
+	index = FigureIndex(fig_dir)
+	del reads[:]
+	shutil.copy(os.path.join(FIGURE_DIR, FIGURES[3] + ".zip"), fig_dir)
+	assert index.missing([FIGURES[3], FIGURES[0]]) == [FIGURES[3]]
+
+	assert index.refresh() == [FIGURES[3]]
+	assert reads == [FIGURES[3]]
+	assert index.missing([FIGURES[3], FIGURES[0]]) == []
+	assert FIGURES[3] in _saved(fig_dir)
+
+
+def test_delete_figure(fig_dir, reads):
+	index = FigureIndex(fig_dir)
+	del reads[:]
+	os.remove(os.path.join(fig_dir, FIGURES[1] + ".zip"))
+
+	assert index.refresh() == []
+	assert reads == []
+	assert FIGURES[1] not in index
+	assert index.missing(FIGURES[:3]) == [FIGURES[1]]
+	assert sorted(_saved(fig_dir).keys()) == [FIGURES[0], FIGURES[2]]
+
+
+def test_modify_figure(fig_dir, reads):
+	index = FigureIndex(fig_dir)
+	del reads[:]
+	path = os.path.join(fig_dir, FIGURES[2] + ".zip")
+	old_checksum = index[FIGURES[2]]['checksum']
+	write_archive_member(path, "notes.txt", b"modified")
+
+	assert index.refresh() == [FIGURES[2]]
+	assert reads == [FIGURES[2]]
+	assert index[FIGURES[2]]['checksum'] != old_checksum
+	assert index[FIGURES[2]]['size'] == os.path.getsize(path)
+	assert _saved(fig_dir)[FIGURES[2]]['checksum'] == index[FIGURES[2]]['checksum']
+
+
+def test_touch_figure(fig_dir, reads):
+	# A changed modification time alone should also trigger a re-read
+	index = FigureIndex(fig_dir)
+	del reads[:]
+	path = os.path.join(fig_dir, FIGURES[0] + ".zip")
+	stat = os.stat(path)
+	os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+	assert index.refresh() == [FIGURES[0]]
+	assert index[FIGURES[0]]['mtime'] == os.stat(path).st_mtime
+
+
+def test_invalid_archives_skipped(fig_dir):
+	with open(os.path.join(fig_dir, "broken.zip"), "wb") as f:
+		f.write(b"not a zip file")
+	index = FigureIndex(fig_dir)
+	assert index.names == FIGURES[:3]
+	assert index.missing(["broken"]) == ["broken"]
+
+
+def test_corrupt_index_rebuilt(fig_dir):
+	with open(os.path.join(fig_dir, INDEX_FILE), "w") as f:
+		f.write("{not json")
+	assert FigureIndex(fig_dir).names == FIGURES[:3]
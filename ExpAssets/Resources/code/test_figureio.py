@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the figure and trace file formats in figureio.
+
+Figures and tracings loaded from the binary formats need to be identical to the ones
+parsed from the original text files, so these tests compare figures against the original
+line-by-line .tlf parser for every bundled figure, and check that tracings survive a
+round trip through the binary .tltb format unchanged.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import io
+import os
+import ast
+import zipfile
+
+import pytest
+import numpy as np
+
+import figureio
+from figureio import (find_archive_member, figure_to_tlfb, tlfb_to_figure, read_figure,
+	normalize_segments, convert_archive, trace_to_tltb, tltb_to_trace, tltb_arrays,
+	read_trial_file, read_trial_samples, export_text_traces, TLTB_TICKS, FIGURE_STORE)
+from figurewriter import FigureSnapshot, write_snapshot, figure_key
+
+
+FIGURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "figures")
+FIGURES = sorted(f[:-4] for f in os.listdir(FIGURE_DIR) if f.endswith(".zip"))
+
+
+def _legacy_figure(figure):
+	# Parses a bundled figure's .tlf the way TraceLab originally did
+	with zipfile.ZipFile(os.path.join(FIGURE_DIR, figure + ".zip")) as archive:
+		with archive.open(find_archive_member(archive, figure, ".tlf")) as f:
+			attrs = figureio._read_tlf_textio(f)
+	segments = normalize_segments(attrs['raw_segments'])
+	return (attrs['points'], segments, attrs.get('screen_res', list(figureio.DEFAULT_RES)))
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_bundled_tlfb_matches_tlf(figure):
+	with zipfile.ZipFile(os.path.join(FIGURE_DIR, figure + ".zip")) as archive:
+		tlf = find_archive_member(archive, figure, ".tlf")
+		tlfb = find_archive_member(archive, figure, ".tlfb")
+		assert tlfb == tlf + "b"
+		decoded = tlfb_to_figure(archive.read(tlfb))
+
+	assert decoded == _legacy_figure(figure)
+	assert read_figure(os.path.join(FIGURE_DIR, figure)) == decoded
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_tlfb_round_trip(figure):
+	points, segments, figure_res = _legacy_figure(figure)
+	decoded = tlfb_to_figure(figure_to_tlfb(points, segments, figure_res))
+	assert decoded == (points, segments, figure_res)
+
+
+def test_tlfb_round_trip_float_coords():
+	points = [(10, 20), (30, 40)]
+	segments = [[True, ((10, 20), (30, 40), (12.5, -3.25))], [False, ((30, 40), (10, 20))]]
+	decoded = tlfb_to_figure(figure_to_tlfb(points, segments, (2560, 1440)))
+	assert decoded == (points, segments, [2560, 1440])
+
+
+def test_convert_archive_next_to_tlf(tmpdir):
+	# Archives with the .tlf in a folder should get their .tlfb in the same folder
+	path = str(tmpdir.join("heart.zip"))
+	with zipfile.ZipFile(os.path.join(FIGURE_DIR, "heart.zip")) as src:
+		with zipfile.ZipFile(path, "w") as dst:
+			for item in src.infolist():
+				if not item.filename.endswith(".tlfb"):
+					dst.writestr(item, src.read(item.filename))
+
+	assert convert_archive(path)
+	assert not convert_archive(path)
+	with zipfile.ZipFile(path) as archive:
+		names = archive.namelist()
+		assert "heart/heart.tlfb" in names and "heart.tlfb" not in names
+		assert archive.getinfo("heart/heart.tlfb").compress_type == zipfile.ZIP_STORED
+	assert read_figure(path) == _legacy_figure("heart")
+
+
+def test_read_figure_without_tlfb(tmpdir):
+	figure = FIGURES[-1]
+	path = str(tmpdir.join(figure + ".zip"))
+	with zipfile.ZipFile(os.path.join(FIGURE_DIR, figure + ".zip")) as src:
+		with zipfile.ZipFile(path, "w") as dst:
+			for item in src.infolist():
+				if not item.filename.endswith(".tlfb"):
+					dst.writestr(item, src.read(item.filename))
+	assert read_figure(path) == _legacy_figure(figure)
+
+
+# Streaming .tlf scanner tests
+
+def _tlf_lines(figure):
+	# Splits a bundled figure's .tlf into its attribute lines the way the original parser did
+	with zipfile.ZipFile(os.path.join(FIGURE_DIR, figure + ".zip")) as archive:
+		data = archive.read(find_archive_member(archive, figure, ".tlf"))
+	attrs = {}
+	for l in data.decode('utf-8').split("\n"):
+		attr = l.split(" = ")
+		if len(attr) == 2:
+			attrs[attr[0]] = attr[1]
+	return (data, attrs)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_read_tlf_matches_legacy(figure):
+	with zipfile.ZipFile(os.path.join(FIGURE_DIR, figure + ".zip")) as archive:
+		with archive.open(find_archive_member(archive, figure, ".tlf")) as f:
+			assert figureio.read_tlf(f) == _legacy_figure(figure)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_scan_tlf_matches_legacy(figure):
+	data, expected = _tlf_lines(figure)
+	keys = list(expected.keys()) + ['not_a_key']
+	for chunk_size in (61, 4096, 1024 * 1024):
+		found = dict(figureio.scan_tlf(io.BytesIO(data), keys, chunk_size))
+		assert sorted(found.keys()) == sorted(expected.keys())
+		for key, value in found.items():
+			assert value.decode('utf-8') == expected[key], (key, chunk_size)
+
+
+def test_scan_tlf_stops_early():
+	f = io.BytesIO(b"points = [(1, 2)]\nraw_segments = []\n" + b"x" * 100000)
+	found = list(figureio.scan_tlf(f, ['points'], chunk_size=16))
+	assert found == [('points', b"[(1, 2)]")]
+	assert f.tell() < 100
+
+
+def test_scan_tlf_edge_cases():
+	# Keys sharing a prefix, a key mentioned mid-line, and no newline at the end of the file
+	data = b"points_extra = 1\nfoo = 'points = 2'\n\npoints = [(3, 4)]\nscreen_res = [800, 600]"
+	for chunk_size in (1, 3, 64):
+		found = dict(figureio.scan_tlf(io.BytesIO(data), ['points', 'screen_res'], chunk_size))
+		assert found == {'points': b"[(3, 4)]", 'screen_res': b"[800, 600]"}
+
+
+# Binary tracings
+
+def _times(ticks):
+	# Timestamps that can be stored exactly, i.e. whole microseconds
+	return [t / float(TLTB_TICKS) for t in ticks]
+
+
+@pytest.mark.parametrize("samples", [
+	[],
+	[(5, 6)],
+	[(5, 6, 0.25)],
+	[(5, 6, None)],
+	[(0, 0)] * 3,
+	[(i * 3, 1080 - i, t) for i, t in enumerate(_times(range(0, 20000, 16667)))],
+	# Negative coordinates and deltas (including a clock running backwards)
+	list(zip([10, -5, -300, 40000, -40000], [0, -1, 2, -3, 4], _times([5, 3, -2, 7, -9]))),
+	# Large timestamps, e.g. from a system clock, with deltas that need 64 bits
+	list(zip([1, 2, 3], [4, 5, 6], _times([1700000000123456, 1700000000140123, 2 ** 62]))),
+	# Missing timestamps, including at the start and end
+	[(1, 2, None), (3, 4, 0.1), (5, 6, None), (7, 8, None), (9, 10, 0.3), (1, 1, None)],
+])
+def test_tltb_round_trip(samples):
+	buf = trace_to_tltb(samples)
+	assert tltb_to_trace(buf) == samples
+	xy, times = tltb_arrays(buf)
+	assert xy.shape == (len(samples), 2)
+	if samples and len(samples[0]) > 2:
+		missing = [s[2] is None for s in samples]
+		assert np.isnan(times).tolist() == missing
+
+
+def test_tltb_delta_sizes():
+	# Slow-moving tracings should only need a byte per coordinate delta
+	slow = [(100 + i % 3, 200 - i % 2, i / 1000.0) for i in range(1000)]
+	fast = [(100 + i * 1000, 200, i / 1000.0) for i in range(1000)]
+	assert len(trace_to_tltb(slow)) < len(trace_to_tltb(fast))
+	assert len(trace_to_tltb(slow)) < 1000 * 5
+
+
+def test_tltb_invalid():
+	with pytest.raises(ValueError):
+		trace_to_tltb([(1.5, 2, 0.0)])
+	with pytest.raises(ValueError):
+		tltb_to_trace(b"TLTX" + trace_to_tltb([(1, 2)])[4:])
+
+
+# Trial archives and the figure store
+
+SEGMENTS = ((False, ((960, 780), (480, 360))), (True, ((480, 360), (960, 360), (720, 120))))
+FRAMES = tuple((960 - i, 780 - i, t) for i, t in enumerate(_times(range(0, 1000000, 16667))))
+TRACING = tuple((961 - i, 779 + i % 7, t) for i, t in enumerate(_times(range(0, 800000, 4001))))
+
+
+def _trial_snapshots(fig_dir, trial, store=True, binary=True):
+	figure = FigureSnapshot(
+		fig_dir=fig_dir, file_name=trial + ".tlf", data=FRAMES,
+		outputs=(".tlfx", ".tlfp", ".tlfs", "_preview.png"), points=((960, 780), (480, 360)),
+		segments=SEGMENTS, screen_res=(1920, 1080), ext_frames=((1, 2), (3, 4)),
+		ext_timing=None, color=(211, 211, 211), store=store, binary=binary,
+	)
+	tracing = figure._replace(file_name=trial + ".tlt", data=TRACING, outputs=())
+	return (figure, tracing)
+
+
+def test_figure_store_reference(tmpdir):
+	fig_dir = str(tmpdir)
+	for trial in ("p1_s1_b1_t1", "p1_s1_b1_t2"):
+		for snapshot in _trial_snapshots(fig_dir, trial):
+			write_snapshot(snapshot)
+	key = figure_key(_trial_snapshots(fig_dir, "p1_s1_b1_t1")[0])
+
+	# Both trials should reference the same copy of the figure's static files
+	assert os.listdir(os.path.join(fig_dir, FIGURE_STORE)) == [key + ".zip"]
+	path = os.path.join(fig_dir, "p1_s1_b1_t1.zip")
+	with zipfile.ZipFile(path) as archive:
+		names = archive.namelist()
+		assert names == ["p1_s1_b1_t1.tlfr", "p1_s1_b1_t1.tlfab", "p1_s1_b1_t1.tltb"]
+		assert archive.read("p1_s1_b1_t1.tlfr").decode('utf-8') == key
+
+	# Static files should be read from the store through the reference
+	with zipfile.ZipFile(os.path.join(fig_dir, FIGURE_STORE, key + ".zip")) as store:
+		for ext in (".tlfx", ".tlfp", ".tlfs", "_preview.png"):
+			assert read_trial_file(path, ext) == store.read(key + ext)
+	tlfs = b"((960, 780), (480, 360)),((480, 360), (960, 360), (720, 120))"
+	assert read_trial_file(path[:-4], ".tlfs") == tlfs
+	assert read_trial_file(path, ".tlfx") == b"[(1, 2), (3, 4)]"
+	with pytest.raises(KeyError):
+		read_trial_file(path, "_ext_preview.png")
+
+	# Trial-specific samples should come from the trial's own archive
+	assert read_trial_samples(path, ".tlf") == list(FRAMES)
+	assert read_trial_samples(path, ".tlt") == list(TRACING)
+
+
+def test_trial_samples_text_and_binary(tmpdir):
+	text_dir = str(tmpdir.mkdir("text"))
+	bin_dir = str(tmpdir.mkdir("binary"))
+	for snapshot in _trial_snapshots(text_dir, "p1_s1_b1_t1", store=False, binary=False):
+		write_snapshot(snapshot)
+	for snapshot in _trial_snapshots(bin_dir, "p1_s1_b1_t1", store=False, binary=True):
+		write_snapshot(snapshot)
+	text_path = os.path.join(text_dir, "p1_s1_b1_t1.zip")
+	bin_path = os.path.join(bin_dir, "p1_s1_b1_t1.zip")
+	for ext in (".tlf", ".tlt"):
+		assert read_trial_samples(bin_path, ext) == read_trial_samples(text_path, ext)
+
+	# Exported text versions of binary samples should match the original text files
+	assert sorted(export_text_traces(bin_path)) == ["p1_s1_b1_t1.tlf", "p1_s1_b1_t1.tlt"]
+	for ext in (".tlf", ".tlt"):
+		exported = read_trial_file(bin_path, ext).decode('utf-8')
+		assert ast.literal_eval(exported) == ast.literal_eval(
+			read_trial_file(text_path, ext).decode('utf-8')
+		)
+	assert export_text_traces(bin_path) == []
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the headless figure preview renderer in figurepreview.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+import sys
+import shutil
+import subprocess
+
+import pytest
+from PIL import Image
+
+import figurepreview
+from figureio import read_figure
+from drawingutils import segments_bounds
+
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIGURE_DIR = os.path.join(CODE_DIR, "..", "figures")
+FIGURES = sorted(f[:-4] for f in os.listdir(FIGURE_DIR) if f.endswith(".zip"))
+
+# Renders previews in worker processes with KLibs made unimportable (even if installed)
+NO_KLIBS_SCRIPT = """
+import sys
+from figurepreview import render_previews
+results = list(render_previews(sys.argv[1:-1], (1280, 720), 2, crop=True, out_dir=sys.argv[-1]))
+assert 'klibs' not in sys.modules
+for path, out, err in results:
+	if err:
+		raise err
+"""
+
+
+def test_scale():
+	assert figurepreview._scale((960, 540), (1920, 1080), (1920, 1080)) == (960, 540)
+	assert figurepreview._scale((960, 540), (1920, 1080), (1280, 720)) == (640, 360)
+	assert figurepreview._scale((100, 101), (1920, 1080), (1280, 720)) == (66, 67)
+
+
+def test_scale_matches_klibs():
+	from klibs.KLUtilities import scale
+	points, segments, figure_res = read_figure(os.path.join(FIGURE_DIR, FIGURES[0] + ".zip"))
+	for screen_res in [(1280, 720), (2560, 1440), (1920, 1200)]:
+		try:
+			expected = [scale(p, figure_res, screen_res) for p in points]
+		except NotImplementedError:
+			pytest.skip("Requires KLibs.")
+		assert [figurepreview._scale(p, figure_res, screen_res) for p in points] == expected
+
+
+def test_segments_bounds():
+	for figure in FIGURES:
+		points, segments, figure_res = read_figure(os.path.join(FIGURE_DIR, figure + ".zip"))
+		(x1, y1), (x2, y2) = figurepreview._segments_bounds(segments)
+		(ex1, ey1), (ex2, ey2) = segments_bounds(segments)
+		assert (x1, y1, x2, y2) == pytest.approx((ex1, ey1, ex2, ey2))
+
+
+def test_render_preview(tmpdir):
+	out_dir = str(tmpdir)
+	path = os.path.join(FIGURE_DIR, FIGURES[0] + ".zip")
+	out = figurepreview.render_preview(path, (1280, 720), out_dir=out_dir)
+	assert out == os.path.join(out_dir, FIGURES[0] + figurepreview.PREVIEW_SUFFIX)
+	assert Image.open(out).size == (1280, 720)
+
+	cropped = figurepreview.render_preview(path, (1280, 720), crop=True, out_dir=out_dir)
+	points, segments, figure_res = read_figure(path)
+	(x1, y1), (x2, y2) = segments_bounds(
+		[[c, [figurepreview._scale(p, figure_res, (1280, 720)) for p in pts]]
+		for c, pts in segments]
+	)
+	width, height = Image.open(cropped).size
+	assert x2 - x1 < width <= x2 - x1 + 6
+	assert y2 - y1 < height <= y2 - y1 + 6
+
+
+def test_workers_without_klibs(tmpdir):
+	# Shadow KLibs with a package that can't be imported, which the spawned worker
+	# processes also inherit through PYTHONPATH
+	blocker = tmpdir.mkdir("blocker").mkdir("klibs")
+	blocker.join("__init__.py").write("raise ImportError('KLibs is unavailable')\n")
+	archives = []
+	for figure in FIGURES[:3]:
+		archives.append(str(tmpdir.join(figure + ".zip")))
+		shutil.copy(os.path.join(FIGURE_DIR, figure + ".zip"), archives[-1])
+	out_dir = str(tmpdir.mkdir("out"))
+
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join([blocker.dirname, CODE_DIR])
+	cmd = [sys.executable, "-c", NO_KLIBS_SCRIPT] + archives + [out_dir]
+	result = subprocess.run(cmd, env=env, cwd=str(tmpdir), capture_output=True)
+	assert result.returncode == 0, result.stderr.decode('utf-8')
+	expected = sorted(f + figurepreview.PREVIEW_SUFFIX for f in FIGURES[:3])
+	assert sorted(os.listdir(out_dir)) == expected
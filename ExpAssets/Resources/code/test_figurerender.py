@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the display-independent figure and tracing rendering in figurerender.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import numpy as np
+
+from figurerender import points_to_array, frames_to_path, texture_box, draw_trace
+
+
+TRACE = [(10, 10, 0.0), (10, 10, 0.01), (10.4, 10.2, 0.02), (11.5, 10.5, 0.03),
+	(13, 12, 0.04), (13.2, 12.9, 0.05), (20, 20, 0.06)]
+SCREEN_RES = (100, 100)
+
+
+def _coords(path):
+	return np.asarray(path.coords()).reshape(-1, 2)
+
+
+def test_points_to_array():
+	xy = points_to_array(TRACE)
+	assert xy.shape == (len(TRACE), 2)
+	assert np.array_equal(xy, [(x, y) for x, y, t in TRACE])
+	assert np.array_equal(points_to_array(np.asarray(TRACE)), xy)
+
+
+def test_frames_to_path():
+	assert len(_coords(frames_to_path(TRACE))) == len(TRACE)
+	# Only the exact repeat of the first point should be dropped
+	unique = _coords(frames_to_path(TRACE, unique=True))
+	assert np.allclose(unique, points_to_array(TRACE)[1:])
+
+
+def test_frames_to_path_tolerance():
+	# With 2 px cells, points sharing a cell with the point before them are dropped
+	decimated = _coords(frames_to_path(TRACE, unique=True, tolerance=2))
+	assert np.allclose(decimated, [(10, 10), (13, 12), (20, 20)])
+	# A tolerance smaller than the spacing of the points is the same as unique=True
+	fine = _coords(frames_to_path(TRACE, unique=True, tolerance=0.01))
+	assert np.allclose(fine, _coords(frames_to_path(TRACE, unique=True)))
+
+
+def test_draw_trace_tolerance():
+	box = texture_box(((10, 10), (20, 20)), SCREEN_RES)
+	figure = np.zeros((box[3] - box[1], box[2] - box[0], 4), dtype=np.uint8)
+	full, full_box = draw_trace(figure, box, TRACE, (0, 255, 255), SCREEN_RES)
+	same, _ = draw_trace(figure, box, TRACE, (0, 255, 255), SCREEN_RES, tolerance=0.01)
+	coarse, coarse_box = draw_trace(figure, box, TRACE, (0, 255, 255), SCREEN_RES, 2)
+	assert np.array_equal(same, full)
+	assert coarse_box == full_box
+	assert coarse[:, :, 1].any() and not np.array_equal(coarse, full)
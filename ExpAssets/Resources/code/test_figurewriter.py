@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for writing out trial figures and tracings with figurewriter.
+
+The archives written from figure snapshots (both directly and on a FigureWriter's
+background thread) are compared against ones written by a copy of the original
+TraceLabFigure.write_out, which wrote each file to a temporary file in the figure
+folder before adding it to the archive.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+import io
+import zipfile
+import threading
+
+import pytest
+import aggdraw
+import numpy as np
+from PIL import Image
+
+import figurewriter
+import TraceLabFigure as tlf
+from figurewriter import FigureWriter, write_snapshot
+from figureio import read_figure
+from figurerender import segments_to_symbol
+from test_drawingutils import legacy_segments_to_frames
+
+
+FIGURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "figures")
+FIGURE_COLOR = (211, 211, 211)
+REFRESH_RATE = 60.0
+FRAMES = [(960 + i, 780 - 2 * i, i / REFRESH_RATE) for i in range(50)]
+TRACING = [(961 + i * 0.5, 781 - i, 0.004 * i) for i in range(120)]
+
+
+# A copy of TraceLabFigure.write_out and render from before figures were written from
+# snapshots, with figure attributes and params passed in directly
+
+def legacy_render(segments, screen_res):
+	canvas = Image.new("RGBA", screen_res, (0, 0, 0, 255))
+	surf = aggdraw.Draw(canvas)
+	s = segments_to_symbol(segments)
+	surf.symbol((0, 0), s, aggdraw.Pen(FIGURE_COLOR, 1, 255))
+	surf.flush()
+	return np.asarray(canvas)
+
+
+def legacy_write_out(fig_dir, file_name, points, segments, screen_res, trial_data):
+	utf8 = str
+	writing_tracing = file_name.endswith(".tlt")
+
+	points_file_name = file_name[:-4] + ".tlfp"
+	segments_file_name = file_name[:-4] + ".tlfs"
+	ext_interp_file_name = file_name[:-4] + ".tlfx"
+	thumb_file_name = file_name[:-4] + "_preview.png"
+	thumbx_file_name = file_name[:-4] + "_ext_preview.png"
+
+	fig_path = os.path.join(fig_dir, file_name)
+	points_path = os.path.join(fig_dir, points_file_name)
+	segments_path = os.path.join(fig_dir, segments_file_name)
+	ext_interpolation_path = os.path.join(fig_dir, ext_interp_file_name)
+	thumb_path = os.path.join(fig_dir, thumb_file_name)
+	thumbx_path = os.path.join(fig_dir, thumbx_file_name)
+
+	with zipfile.ZipFile(fig_path[:-3] + "zip", "a", zipfile.ZIP_DEFLATED) as fig_zip:
+
+		with io.open(fig_path, "w+", encoding='utf-8') as f:
+			f.write(utf8(trial_data))
+
+		if not writing_tracing:
+			with io.open(ext_interpolation_path, "w+", encoding='utf-8') as f:
+				ext = legacy_segments_to_frames(segments, 5000.0, fps=REFRESH_RATE)
+				f.write(utf8(ext))
+			fig_zip.write(ext_interpolation_path, ext_interp_file_name)
+			os.remove(ext_interpolation_path)
+
+			with io.open(points_path, "w+", encoding='utf-8') as f:
+				f.write(utf8(points))
+			fig_zip.write(points_path, points_file_name)
+			os.remove(points_path)
+
+			with io.open(segments_path, "w+", encoding='utf-8') as f:
+				f.write(u",".join(utf8(s[1]) for s in segments))
+			fig_zip.write(segments_path, segments_file_name)
+			os.remove(segments_path)
+
+			Image.fromarray(legacy_render(segments, screen_res)).save(thumb_path, 'PNG')
+			fig_zip.write(thumb_path, thumb_file_name)
+			os.remove(thumb_path)
+
+			Image.fromarray(legacy_render(segments, screen_res)).save(thumbx_path, 'PNG')
+			fig_zip.write(thumbx_path, thumbx_file_name)
+			os.remove(thumbx_path)
+
+		fig_zip.write(fig_path, file_name)
+		os.remove(fig_path)
+
+
+@pytest.fixture
+def figure(monkeypatch, tmpdir):
+	# The 'heart' figure as shown on a trial, set to write out all of its extra files
+	params = {
+		'capture_figures_mode': False, 'gen_tlfx': True, 'gen_tlfp': True, 'gen_tlfs': True,
+		'gen_png': True, 'gen_ext_png': True, 'refresh_rate': REFRESH_RATE,
+		'arc_length_tolerance': None, 'stimulus_feedback_color': FIGURE_COLOR,
+		'use_figure_store': False, 'binary_traces': False,
+	}
+	for name, value in params.items():
+		monkeypatch.setattr(tlf.P, name, value, raising=False)
+
+	class _Figure(tlf.TraceLabFigure):
+		exp = type("Experiment", (object,), {'fig_dir': str(tmpdir.mkdir("figures"))})
+
+	points, segments, screen_res = read_figure(os.path.join(FIGURE_DIR, "heart.zip"))
+	fig = _Figure.__new__(_Figure)
+	fig.raw_segments = segments
+	fig.points = points
+	fig.screen_res = screen_res
+	fig.trial_a_frames = FRAMES
+	return fig
+
+
+def _legacy_archive(fig, tmpdir):
+	fig_dir = str(tmpdir.mkdir("legacy"))
+	for file_name, data in [("trial.tlf", FRAMES), ("trial.tlt", TRACING)]:
+		legacy_write_out(fig_dir, file_name, fig.points, fig.raw_segments, fig.screen_res, data)
+	return os.path.join(fig_dir, "trial.zip")
+
+
+def _contents(path):
+	with zipfile.ZipFile(path) as archive:
+		return [(info.filename, archive.read(info)) for info in archive.infolist()]
+
+
+def _assert_same_archive(path, expected_path):
+	contents = _contents(path)
+	expected = _contents(expected_path)
+	assert [name for name, data in contents] == [name for name, data in expected]
+	for (name, data), (_, expected_data) in zip(contents, expected):
+		if name.endswith(".png"):
+			# Compare the images themselves, in case the PNG encoder settings differ
+			data = np.asarray(Image.open(io.BytesIO(data)))
+			expected_data = np.asarray(Image.open(io.BytesIO(expected_data)))
+			assert (data == expected_data).all(), name
+		else:
+			assert data == expected_data, name
+
+
+def test_write_snapshot_matches_legacy(figure, tmpdir):
+	write_snapshot(figure.snapshot("trial.tlf"))
+	write_snapshot(figure.snapshot("trial.tlt", TRACING))
+	path = os.path.join(figure.exp.fig_dir, "trial.zip")
+	_assert_same_archive(path, _legacy_archive(figure, tmpdir))
+	# No temporary files should be left behind in the figure folder
+	assert os.listdir(figure.exp.fig_dir) == ["trial.zip"]
+
+
+def test_figure_writer_matches_legacy(figure, tmpdir):
+	writer = FigureWriter()
+	writer.submit(figure.snapshot("trial.tlf"))
+	writer.submit(figure.snapshot("trial.tlt", TRACING))
+	writer.close()
+	writer.check()
+	path = os.path.join(figure.exp.fig_dir, "trial.zip")
+	_assert_same_archive(path, _legacy_archive(figure, tmpdir))
+
+
+def test_ext_frames_interpolated_by_writer(figure, monkeypatch):
+	# Taking a snapshot shouldn't interpolate anything on the calling thread
+	def _fail(*args, **kwargs):
+		raise AssertionError("Frames interpolated when taking snapshot.")
+	monkeypatch.setattr(tlf, "segments_to_frame_sets", _fail)
+	snapshot = figure.snapshot("trial.tlf")
+	assert snapshot.ext_frames is None
+	assert snapshot.ext_timing == (5000.0, REFRESH_RATE, figure.path_length, None)
+	assert figure.frame_sets == {}
+
+	threads = []
+	segments_to_frame_sets = figurewriter.segments_to_frame_sets
+	def _interpolate(*args):
+		threads.append(threading.current_thread().name)
+		return segments_to_frame_sets(*args)
+	monkeypatch.setattr(figurewriter, "segments_to_frame_sets", _interpolate)
+	writer = FigureWriter()
+	writer.submit(snapshot)
+	writer.submit(figure.snapshot("trial.tlt", TRACING))
+	writer.close()
+	writer.check()
+	assert threads == ["FigureWriter"]
+
+	with zipfile.ZipFile(os.path.join(figure.exp.fig_dir, "trial.zip")) as archive:
+		tlfx = archive.read("trial.tlfx").decode('utf-8')
+	assert tlfx == str(legacy_segments_to_frames(figure.raw_segments, 5000.0, REFRESH_RATE))
+
+
+def test_ext_frames_reused(figure, monkeypatch):
+	# If the figure already has frames for 5 s, they're passed to the writer as-is
+	frames = [(1, 2), (3, 4)]
+	figure.frame_sets[5000.0] = frames
+	snapshot = figure.snapshot("trial.tlf")
+	assert snapshot.ext_frames == tuple(frames)
+	monkeypatch.setattr(figurewriter, "segments_to_frame_sets", None)
+	files = dict((name, data) for name, data, compress in figurewriter.snapshot_files(snapshot))
+	assert files["trial.tlfx"] == str(frames)
+
+
+def test_writer_errors(figure, monkeypatch):
+	def _fail(snapshot, archive=None):
+		raise IOError("Disk full")
+	monkeypatch.setattr(figurewriter, "write_snapshot", _fail)
+	writer = FigureWriter()
+	writer.submit(figure.snapshot("trial.tlf"))
+	writer.close()
+	with pytest.raises(IOError):
+		writer.check()
+	with pytest.raises(RuntimeError):
+		writer.submit(figure.snapshot("trial.tlf"))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the screen flip timing summaries in frametiming.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import json
+
+import pytest
+
+from frametiming import summarize_flips
+
+
+def _flips(refreshes, refresh_rate=60.0, start=10.0):
+	return [start + r / refresh_rate for r in refreshes]
+
+
+def test_perfect_timing():
+	summary = summarize_flips([_flips(range(10))], 60.0)
+	assert summary['flips'] == 10
+	assert summary['mean_interval'] == pytest.approx(16.667)
+	assert summary['max_jitter'] == pytest.approx(0.0)
+	assert summary['dropped_frames'] == 0
+	assert json.loads(summary['interval_hist']) == {"<1": 0, "1": 9, "2": 0, "3": 0, "4+": 0}
+
+
+def test_missed_refreshes():
+	# Intervals of 1, 1, 2, 1, 3, 1, and 6 refreshes: 1 + 2 + 5 = 8 refreshes missed
+	summary = summarize_flips([_flips([0, 1, 2, 4, 5, 8, 9, 15])], 60.0)
+	assert summary['flips'] == 8
+	assert summary['mean_interval'] == pytest.approx(round(15 / 7.0 * 1000 / 60.0, 3))
+	assert summary['max_jitter'] == pytest.approx(round(5 * 1000 / 60.0, 3))
+	assert summary['dropped_frames'] == 8
+	assert json.loads(summary['interval_hist']) == {"<1": 0, "1": 4, "2": 1, "3": 1, "4+": 1}
+
+
+def test_jitter_and_bins():
+	# 120 Hz, with intervals of 0.3, 1.2, 1.6, and 3.49 refreshes
+	interval = 1 / 120.0
+	flips = [0.0, 0.3, 1.5, 3.1, 6.59]
+	summary = summarize_flips([[t * interval for t in flips]], 120.0)
+	assert summary['mean_interval'] == pytest.approx(round(6.59 / 4 * 1000 / 120.0, 3))
+	assert summary['max_jitter'] == pytest.approx(round(2.49 * 1000 / 120.0, 3))
+	# Intervals round to 0, 1, 2, and 3 refreshes, so 0 + 0 + 1 + 2 are missed
+	assert summary['dropped_frames'] == 3
+	assert json.loads(summary['interval_hist']) == {"<1": 1, "1": 1, "2": 1, "3": 1, "4+": 0}
+
+
+def test_gaps_between_runs_ignored():
+	# The pause between separate runs (e.g. keyframes) shouldn't count as dropped frames
+	runs = [_flips(range(5)), _flips(range(5), start=20.0), _flips([0])]
+	summary = summarize_flips(runs, 60.0)
+	assert summary['flips'] == 11
+	assert summary['mean_interval'] == pytest.approx(16.667)
+	assert summary['dropped_frames'] == 0
+	assert json.loads(summary['interval_hist'])["1"] == 8
+
+
+def test_no_intervals():
+	for runs in ([], [[]], [[1.0]], [[1.0], [2.0]]):
+		summary = summarize_flips(runs, 60.0)
+		assert summary['flips'] == sum(len(r) for r in runs)
+		assert summary['mean_interval'] == 0.0
+		assert summary['max_jitter'] == 0.0
+		assert summary['dropped_frames'] == 0
+		assert sum(json.loads(summary['interval_hist']).values()) == 0
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the spatial index of figure paths in pathindex.
+
+Nearest-point queries on the index are checked against the brute-force search in
+traceerror.nearest_points, using the figures in the figure library.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+
+import pytest
+import numpy as np
+
+from figureio import read_figure
+from traceerror import nearest_points, segments_to_path
+from pathindex import PathIndex, flatten_segments
+
+
+FIGURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "figures")
+FIGURES = sorted(f for f in os.listdir(FIGURE_DIR) if f.endswith(".zip"))
+
+
+def _query_points(screen_res, n=2000, seed=0):
+	# Random points across the screen, including some beyond the edges of the index grid
+	rng = np.random.RandomState(seed)
+	x = rng.uniform(-300, screen_res[0] + 300, n)
+	y = rng.uniform(-300, screen_res[1] + 300, n)
+	return np.column_stack([x, y])
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_nearest_matches_brute_force(figure):
+	points, segments, screen_res = read_figure(os.path.join(FIGURE_DIR, figure))
+	path = segments_to_path(segments, spacing=3.0)
+	queries = _query_points(screen_res)
+	index = PathIndex(path)
+	assert not (index._cells(queries) >= 0).all()  # some points fall outside the grid
+
+	# Indexes of plain paths should give the same results as checking every line
+	dists, pos = index.nearest(queries)
+	expected_dists, expected_pos = nearest_points(queries, path)
+	assert np.allclose(dists, expected_dists, rtol=0, atol=1e-9)
+	assert np.allclose(pos, expected_pos, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("figure", FIGURES)
+def test_from_segments_matches_brute_force(figure):
+	points, segments, screen_res = read_figure(os.path.join(FIGURE_DIR, figure))
+	queries = _query_points(screen_res, n=500, seed=1)
+
+	# Closest points on curves are refined against the exact curve, so should agree with
+	# a very densely interpolated path, even though the index's path is much coarser
+	dense = segments_to_path(segments, spacing=0.1)
+	dists, pos = PathIndex.from_segments(segments).nearest(queries)
+	expected_dists, expected_pos = nearest_points(queries, dense)
+	assert np.allclose(dists, expected_dists, rtol=0, atol=0.01)
+	assert np.allclose(pos, expected_pos, rtol=0, atol=1.0)
+
+
+@pytest.mark.parametrize("cell_size, padding", [(4.0, 0.0), (16.0, 64.0), (100.0, 10.0)])
+def test_grid_sizes(cell_size, padding):
+	points, segments, screen_res = read_figure(os.path.join(FIGURE_DIR, FIGURES[0]))
+	path = segments_to_path(segments, spacing=2.0)
+	queries = _query_points(screen_res, seed=2)
+	dists, pos = PathIndex(path, cell_size, padding).nearest(queries)
+	expected_dists, expected_pos = nearest_points(queries, path)
+	assert np.allclose(dists, expected_dists, rtol=0, atol=1e-9)
+	assert np.allclose(pos, expected_pos, rtol=0, atol=1e-6)
+
+
+def test_points_on_path():
+	points, segments, screen_res = read_figure(os.path.join(FIGURE_DIR, FIGURES[0]))
+	path, seg_ids, params = flatten_segments(segments, spacing=1.0)
+	dists, pos = PathIndex.from_segments(segments).nearest(path)
+	assert np.allclose(dists, 0, atol=1e-6)
+
+
+def test_short_paths():
+	queries = np.array([(0, 0), (3, 4), (500, -20)], dtype=np.float64)
+	# A single point, with and without times
+	for path in [[(3, 4)], [(3, 4, 0.5)]]:
+		dists, pos = PathIndex(path).nearest(queries)
+		expected_dists, expected_pos = nearest_points(queries, np.array(path)[:, :2])
+		assert dists.tolist() == pytest.approx(expected_dists.tolist())
+		assert pos.tolist() == [0, 0, 0]
+	# A single line, with a repeated point
+	path = np.array([(0, 10), (100, 10), (100, 10)], dtype=np.float64)
+	dists, pos = PathIndex(path).nearest(queries)
+	assert dists.tolist() == pytest.approx([10, 6, np.hypot(400, 30)])
+	assert pos.tolist() == pytest.approx([0, 3, 100])
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the append-only session archive in sessionarchive.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+import zlib
+import zipfile
+
+import pytest
+
+from sessionarchive import SessionArchive, split_archive, _TLSA_HEADER, _RECORD_HEADER
+from figurewriter import FigureSnapshot, write_snapshot
+
+
+TRIAL_1 = "p1_s1_b1_t1_2020-01-01"
+TRIAL_2 = "p1_s1_b1_t2_2020-01-01"
+TRIAL_3 = "p1_s1_b2_t1_2020-01-01"
+
+FILES_1 = [
+	(TRIAL_1, TRIAL_1 + ".tlf", u"[(1, 2, 0.0), (3, 4, 0.016)]", True),
+	(TRIAL_1, TRIAL_1 + ".tlfb", b"\x00\x01\x02" * 100, False),
+]
+FILES_2 = [
+	(TRIAL_2, TRIAL_2 + ".tlf", u"[(5, 6, 0.0)]", True),
+	(TRIAL_2, TRIAL_2 + ".tlt", u"[(7, 8, 0.0)]" * 50, True),
+]
+
+
+@pytest.fixture
+def path(tmpdir):
+	return str(tmpdir.join("session.tlsa"))
+
+
+def _write(path, *batches):
+	archive = SessionArchive(path)
+	sizes = []
+	for files in batches:
+		archive.append(files)
+		sizes.append(os.path.getsize(path))
+	archive.close()
+	return sizes
+
+
+def _contents(archive):
+	return dict((key, archive.read(*key)) for key in archive.index.keys())
+
+
+def _expected(*batches):
+	contents = {}
+	for files in batches:
+		for trial, name, data, compress in files:
+			contents[(trial, name)] = data if isinstance(data, bytes) else data.encode('utf-8')
+	return contents
+
+
+def test_new_archive(path):
+	archive = SessionArchive(path)
+	assert archive.archives() == []
+	archive.close()
+	assert os.path.getsize(path) == _TLSA_HEADER.size
+	with pytest.raises(IOError):
+		SessionArchive(path + ".missing", read_only=True)
+
+
+def test_write_and_reopen(path):
+	archive = SessionArchive(path)
+	archive.append(FILES_1)
+	archive.append(FILES_2)
+	assert _contents(archive) == _expected(FILES_1, FILES_2)
+	archive.close()
+
+	archive = SessionArchive(path)
+	assert _contents(archive) == _expected(FILES_1, FILES_2)
+	assert archive.archives() == [TRIAL_1, TRIAL_2]
+	assert archive.files(TRIAL_2) == [TRIAL_2 + ".tlf", TRIAL_2 + ".tlt"]
+	assert archive.find(1, 2) == [TRIAL_2]
+	assert archive.find(2, 1) == []
+
+	# Appending after reopening should add to the end of the existing records
+	archive.append([(TRIAL_3, TRIAL_3 + ".tlf", u"[]", True)])
+	archive.close()
+	archive = SessionArchive(path, read_only=True)
+	assert archive.archives() == [TRIAL_1, TRIAL_2, TRIAL_3]
+	assert archive.find(2, 1) == [TRIAL_3]
+	archive.close()
+
+
+def test_rewritten_file_replaced(path):
+	redone = [(TRIAL_1, TRIAL_1 + ".tlf", u"[(9, 9, 0.0)]", True)]
+	_write(path, FILES_1, FILES_2, redone)
+	archive = SessionArchive(path)
+	assert archive.read(TRIAL_1, TRIAL_1 + ".tlf") == b"[(9, 9, 0.0)]"
+	# The replaced file moves to the end, but trials keep their original order
+	assert archive.files(TRIAL_1) == [TRIAL_1 + ".tlfb", TRIAL_1 + ".tlf"]
+	assert archive.archives() == [TRIAL_1, TRIAL_2]
+	archive.close()
+
+
+# The sizes of the parts of the last record in FILES_2
+LAST_NAME = len(FILES_2[1][0]) + len(FILES_2[1][1])
+LAST_DATA = len(zlib.compress(FILES_2[1][2].encode('utf-8')))
+
+
+@pytest.mark.parametrize("cut", [
+	1,  # in the data of the last record
+	LAST_DATA + 3,  # in the names of the last record
+	LAST_DATA + LAST_NAME + _RECORD_HEADER.size // 2,  # in the header of the last record
+])
+def test_truncated_tail(path, cut):
+	sizes = _write(path, FILES_1, FILES_2)
+	assert sizes[1] - sizes[0] > LAST_DATA + LAST_NAME + _RECORD_HEADER.size
+	with open(path, "r+b") as f:
+		f.truncate(sizes[-1] - cut)
+
+	# The incomplete last record should be discarded and removed from the file, keeping
+	# everything written before it
+	archive = SessionArchive(path)
+	expected = _expected(FILES_1, FILES_2[:1])
+	assert _contents(archive) == expected
+	archive.close()
+	tail_size = os.path.getsize(path)
+	assert sizes[0] < tail_size < sizes[1] - cut
+
+	# Rewriting the lost file should work as normal
+	archive = SessionArchive(path)
+	archive.append(FILES_2[1:])
+	archive.close()
+	archive = SessionArchive(path, read_only=True)
+	assert _contents(archive) == _expected(FILES_1, FILES_2)
+	assert os.path.getsize(path) == sizes[-1]
+	archive.close()
+
+
+def test_corrupt_tail(path):
+	sizes = _write(path, FILES_1, FILES_2)
+	with open(path, "r+b") as f:
+		f.seek(sizes[-1] - 10)
+		f.write(b"\xff" * 10)
+
+	# A complete last record with bad data should also be discarded
+	archive = SessionArchive(path)
+	assert _contents(archive) == _expected(FILES_1, FILES_2[:1])
+	archive.close()
+	assert os.path.getsize(path) < sizes[-1]
+
+
+def test_corrupt_tail_restores_replaced_file(path):
+	redone = [(TRIAL_1, TRIAL_1 + ".tlf", u"[(9, 9, 0.0)]" * 20, True)]
+	sizes = _write(path, FILES_1, redone)
+	with open(path, "r+b") as f:
+		f.truncate(sizes[-1] - 5)
+
+	# If the incomplete record was replacing an earlier copy of a file, that copy is kept
+	archive = SessionArchive(path)
+	assert _contents(archive) == _expected(FILES_1)
+	assert archive.files(TRIAL_1) == [TRIAL_1 + ".tlf", TRIAL_1 + ".tlfb"]
+	archive.close()
+
+
+def test_garbage_tail(path):
+	sizes = _write(path, FILES_1)
+	with open(path, "ab") as f:
+		f.write(b"\x00" * (_RECORD_HEADER.size + 3))
+	archive = SessionArchive(path)
+	assert _contents(archive) == _expected(FILES_1)
+	archive.close()
+	assert os.path.getsize(path) == sizes[0]
+
+
+def test_read_only_keeps_tail(path):
+	sizes = _write(path, FILES_1, FILES_2)
+	with open(path, "r+b") as f:
+		f.truncate(sizes[-1] - 1)
+	archive = SessionArchive(path, read_only=True)
+	assert _contents(archive) == _expected(FILES_1, FILES_2[:1])
+	archive.close()
+	assert os.path.getsize(path) == sizes[-1] - 1
+
+
+@pytest.mark.parametrize("contents", [b"PK\x03\x04" + b"\x00" * 20, b"TLSA", b""])
+def test_invalid_archive(path, contents):
+	with open(path, "wb") as f:
+		f.write(contents)
+	with pytest.raises(ValueError):
+		SessionArchive(path)
+
+
+# Splitting into legacy trial archives
+
+def _snapshots(fig_dir):
+	# The figure and tracing snapshots for two trials, including an uncompressed file
+	segments = ((False, ((960, 780), (480, 360))), (True, ((480, 360), (960, 360), (720, 120))))
+	points = ((960, 780), (480, 360), (960, 360))
+	snapshots = []
+	for trial, offset in [(TRIAL_1, 0), (TRIAL_2, 10)]:
+		frames = tuple((960 + i + offset, 780 - i, i / 60.0) for i in range(30))
+		tracing = tuple((961 + i, 779 - i + offset, i * 0.004) for i in range(90))
+		figure = FigureSnapshot(
+			fig_dir=fig_dir, file_name=trial + ".tlf", data=frames,
+			outputs=(".tlfb", ".tlfx", ".tlfp", ".tlfs", "_preview.png"), points=points,
+			segments=segments, screen_res=(1920, 1080), ext_frames=((1, 2), (3, 4)),
+			ext_timing=None, color=(211, 211, 211), store=False, binary=False,
+		)
+		snapshots.append(figure)
+		snapshots.append(figure._replace(file_name=trial + ".tlt", data=tracing, outputs=()))
+	return snapshots
+
+
+def _zip_contents(path):
+	with zipfile.ZipFile(path) as z:
+		return [(i.filename, i.compress_type, z.read(i)) for i in z.infolist()]
+
+
+def test_split_matches_legacy_archives(tmpdir):
+	legacy_dir = str(tmpdir.mkdir("legacy"))
+	session_dir = str(tmpdir.mkdir("session"))
+	archive = SessionArchive(os.path.join(session_dir, "session.tlsa"))
+	for snapshot in _snapshots(legacy_dir):
+		write_snapshot(snapshot)
+		write_snapshot(snapshot, archive)
+	archive.close()
+
+	out_dir = os.path.join(session_dir, "split")
+	written = split_archive(os.path.join(session_dir, "session.tlsa"), out_dir)
+	assert [os.path.basename(p) for p in written] == [TRIAL_1 + ".zip", TRIAL_2 + ".zip"]
+	assert sorted(os.listdir(out_dir)) == sorted(os.listdir(legacy_dir))
+	for p in written:
+		split = _zip_contents(p)
+		legacy = _zip_contents(os.path.join(legacy_dir, os.path.basename(p)))
+		assert split == legacy
+		assert (os.path.basename(p)[:-4] + ".tlfb", zipfile.ZIP_STORED) in [s[:2] for s in split]
+
+
+def test_split_default_folder(path):
+	_write(path, FILES_1)
+	written = split_archive(path)
+	assert written == [os.path.join(os.path.dirname(path), TRIAL_1 + ".zip")]
+	assert [(n, c, d) for n, c, d in _zip_contents(written[0])] == [
+		(TRIAL_1 + ".tlf", zipfile.ZIP_DEFLATED, FILES_1[0][2].encode('utf-8')),
+		(TRIAL_1 + ".tlfb", zipfile.ZIP_STORED, FILES_1[1][2]),
+	]
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the bulk trial data loader in tracedata.
+
+The tests build a small data folder of trial archives and session archives written
+the same way as during a session, and check the loaded frames and tracings against
+the samples they were written from.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import os
+import sqlite3
+import zipfile
+
+import pytest
+import numpy as np
+
+import tracedata
+from tracedata import (RaggedArray, TraceDataset, text_to_samples, tltb_to_samples,
+	find_trials, load_trials, read_trials_table, load_dataset)
+from figureio import trace_to_tltb, FIGURE_STORE
+from figurewriter import FigureSnapshot, write_snapshot
+from sessionarchive import SessionArchive, split_archive, SESSION_ARCHIVE
+
+
+SEGMENTS = ((False, ((960, 780), (480, 360))), (False, ((480, 360), (960, 780))))
+
+
+def _trial_name(p, s, b, t):
+	return "p{0}_s{1}_b{2}_t{3}_2020-01-0{0}".format(p, s, b, t)
+
+
+def _samples(p, s, b, t, n, step=0.016):
+	# Distinct samples for each trial, with whole-microsecond timestamps
+	return tuple((100 * p + i, 10 * b + t + i % 3, round(i * step, 6)) for i in range(n))
+
+
+def _write_trial(fig_dir, name, frames, tracing, binary=False, archive=None):
+	figure = FigureSnapshot(
+		fig_dir=fig_dir, file_name=name + ".tlf", data=frames, outputs=(".tlfs",),
+		points=((960, 780), (480, 360)), segments=SEGMENTS, screen_res=(1920, 1080),
+		ext_frames=None, ext_timing=None, color=(211, 211, 211), store=False, binary=binary,
+	)
+	write_snapshot(figure, archive)
+	if tracing is not None:
+		tracing = figure._replace(file_name=name + ".tlt", data=tracing, outputs=())
+		write_snapshot(tracing, archive)
+
+
+@pytest.fixture
+def data_dir(tmpdir):
+	"""A data folder with two participants, one with separate trial archives (in text and
+	binary formats) and one with a session archive, along with their expected samples.
+	"""
+	root = tmpdir.mkdir("Data")
+	expected = {}
+
+	p1_dir = str(root.mkdir("p1_2020-01-01").mkdir("session_1"))
+	for b, t, binary in [(1, 1, False), (1, 2, True), (2, 1, False)]:
+		name = _trial_name(1, 1, b, t)
+		expected[name] = (_samples(1, 1, b, t, 30), _samples(1, 1, b, t, 80, 0.004))
+		_write_trial(p1_dir, name, expected[name][0], expected[name][1], binary)
+	# An imagery trial without a tracing
+	name = _trial_name(1, 1, 2, 2)
+	expected[name] = (_samples(1, 1, 2, 2, 30), ())
+	_write_trial(p1_dir, name, expected[name][0], None)
+	# Files that aren't trial archives, and a figure store, should be skipped
+	os.mkdir(os.path.join(p1_dir, FIGURE_STORE))
+	zipfile.ZipFile(os.path.join(p1_dir, FIGURE_STORE, "p9_s9_b9_t9_x.zip"), "w").close()
+	zipfile.ZipFile(os.path.join(p1_dir, "heart.zip"), "w").close()
+
+	p2_dir = str(root.mkdir("p2_2020-01-02").mkdir("session_1"))
+	archive = SessionArchive(os.path.join(p2_dir, SESSION_ARCHIVE))
+	for b, t in [(1, 2), (1, 1)]:
+		name = _trial_name(2, 1, b, t)
+		expected[name] = (_samples(2, 1, b, t, 40), _samples(2, 1, b, t, 60, 0.005))
+		_write_trial(p2_dir, name, expected[name][0], expected[name][1], True, archive)
+	archive.close()
+
+	return (str(root), expected)
+
+
+def _as_array(samples):
+	return np.array(samples, dtype=np.float64).reshape(-1, 3)
+
+
+# RaggedArray and TraceDataset
+
+def test_ragged_array():
+	arrays = [np.ones((3, 3)), np.empty((0, 3)), np.arange(6.0).reshape(2, 3)]
+	ragged = RaggedArray.from_arrays(arrays)
+	assert len(ragged) == 3
+	assert ragged.lengths.tolist() == [3, 0, 2]
+	assert ragged.offsets.tolist() == [0, 3, 3, 5]
+	for a, b in zip(ragged, arrays):
+		assert np.array_equal(a, b)
+	assert np.array_equal(ragged[-1], arrays[-1])
+
+	empty = RaggedArray.from_arrays([])
+	assert len(empty) == 0
+	assert empty.data.shape == (0, 3)
+
+
+def test_dataset_save_load(tmpdir):
+	trials = [
+		{'name': _trial_name(1, 1, 1, 1), 'participant': 1, 'block': 1, 'mt': 1.5},
+		{'name': _trial_name(1, 1, 1, 2), 'participant': 1, 'block': 1, 'mt': None},
+	]
+	frames = RaggedArray.from_arrays([_as_array(_samples(1, 1, 1, 1, 5)), np.empty((0, 3))])
+	traces = RaggedArray.from_arrays([
+		_as_array(_samples(1, 1, 1, 1, 7)), np.array([[1.0, 2.0, np.nan]])
+	])
+	dataset = TraceDataset(trials, frames, traces, [("bad.zip", "Bad archive")])
+	path = str(tmpdir.join("study.npz"))
+	dataset.save(path)
+
+	loaded = TraceDataset.load(path)
+	assert loaded.trials == trials
+	assert loaded.errors == [("bad.zip", "Bad archive")]
+	for a, b in [(loaded.frames, frames), (loaded.traces, traces)]:
+		assert np.array_equal(a.offsets, b.offsets)
+		assert np.array_equal(a.data, b.data, equal_nan=True)
+	assert loaded.find(participant=1, block=1) == [0, 1]
+	assert loaded.find(mt=None) == [1]
+
+
+def test_text_and_binary_samples():
+	samples = [(1, 2, 0.0), (3, 4, None), (-5, 6, 0.25)]
+	expected = np.array([[1, 2, 0.0], [3, 4, np.nan], [-5, 6, 0.25]])
+	assert np.array_equal(text_to_samples(repr(samples)), expected, equal_nan=True)
+	assert np.array_equal(tltb_to_samples(trace_to_tltb(samples)), expected, equal_nan=True)
+	no_times = text_to_samples(repr([(1, 2), (3, 4)]))
+	assert np.array_equal(no_times, [[1, 2, np.nan], [3, 4, np.nan]], equal_nan=True)
+	for empty in ("NA", "[]", ""):
+		assert text_to_samples(empty).shape == (0, 3)
+
+
+# Reading trials from a data folder
+
+def test_find_trials(data_dir):
+	root, expected = data_dir
+	sources = find_trials(root)
+	p1_dir = os.path.join(root, "p1_2020-01-01", "session_1")
+	p2_archive = os.path.join(root, "p2_2020-01-02", "session_1", SESSION_ARCHIVE)
+	assert sources == [
+		(p1_dir, sorted(n for n in expected if n.startswith("p1_"))),
+		(p2_archive, [_trial_name(2, 1, 1, 2), _trial_name(2, 1, 1, 1)]),
+	]
+
+
+def test_find_trials_with_exported_archive(data_dir):
+	# Trials exported from a session archive should only be read from the archive
+	root, expected = data_dir
+	p2_dir = os.path.join(root, "p2_2020-01-02", "session_1")
+	split_archive(os.path.join(p2_dir, SESSION_ARCHIVE))
+	assert sorted(os.listdir(p2_dir)) == sorted(
+		[SESSION_ARCHIVE] + [n + ".zip" for n in expected if n.startswith("p2_")]
+	)
+	sources = [s for s in find_trials(root) if s[0].startswith(p2_dir)]
+	assert sources == [
+		(os.path.join(p2_dir, SESSION_ARCHIVE), [_trial_name(2, 1, 1, 2), _trial_name(2, 1, 1, 1)])
+	]
+
+
+def test_load_trials(data_dir):
+	root, expected = data_dir
+	for source, names in find_trials(root):
+		trials, frames, traces, errors = load_trials(source, names)
+		assert errors == []
+		assert [t['name'] for t in trials] == names
+		for info, trial_frames, trace in zip(trials, frames, traces):
+			assert np.array_equal(trial_frames, _as_array(expected[info['name']][0]))
+			assert np.array_equal(trace, _as_array(expected[info['name']][1]))
+			assert info['participant'] == int(info['name'][1])
+			assert info['path'].startswith(source)
+
+
+def test_load_trials_errors(data_dir):
+	root, expected = data_dir
+	p1_dir = os.path.join(root, "p1_2020-01-01", "session_1")
+	broken = _trial_name(1, 1, 3, 1)
+	with open(os.path.join(p1_dir, broken + ".zip"), "wb") as f:
+		f.write(b"not a zip file")
+	names = [broken, _trial_name(1, 1, 1, 1)]
+	trials, frames, traces, errors = load_trials(p1_dir, names)
+	assert [t['name'] for t in trials] == [_trial_name(1, 1, 1, 1)]
+	assert [e[0] for e in errors] == [os.path.join(p1_dir, broken + ".zip")]
+
+
+def _write_db(path, rows):
+	db = sqlite3.connect(path)
+	db.execute(
+		"CREATE TABLE trials (id INTEGER PRIMARY KEY, participant_id INTEGER, "
+		"block_num INTEGER, trial_num INTEGER, figure_file TEXT, mt REAL)"
+	)
+	db.executemany(
+		"INSERT INTO trials (participant_id, block_num, trial_num, figure_file, mt) "
+		"VALUES (?, ?, ?, ?, ?)", rows
+	)
+	db.commit()
+	db.close()
+
+
+def test_read_trials_table(tmpdir):
+	db_path = str(tmpdir.join("TraceLab.db"))
+	name = _trial_name(1, 1, 1, 1)
+	_write_db(db_path, [
+		(1, 1, 1, name + ".tlf", 1.0),
+		(1, 1, 2, _trial_name(1, 1, 1, 2) + ".tlf", 2.0),
+		(1, 1, 1, name + ".tlf", 3.0),  # the same trial redone after resuming
+	])
+	rows = read_trials_table(db_path)
+	assert sorted(rows.keys()) == [name, _trial_name(1, 1, 1, 2)]
+	assert rows[name]['mt'] == 3.0
+	assert rows[name]['id'] == 3
+
+
+def test_load_dataset(data_dir, tmpdir, monkeypatch):
+	root, expected = data_dir
+	db_path = str(tmpdir.join("TraceLab.db"))
+	rows = []
+	for name in expected:
+		p, s, b, t = [int(n) for n in tracedata.TRIAL_RE.match(name).groups()]
+		rows.append((p, b, t, name + ".tlf", p * 10.0 + t))
+	_write_db(db_path, rows[1:])  # one trial is missing from the database
+
+	# Use small chunks so that trials are split between several worker tasks
+	monkeypatch.setattr(tracedata, "CHUNK_SIZE", 2)
+	dataset = load_dataset(root, db_path, max_workers=2)
+	assert dataset.errors == []
+	order = sorted(expected, key=lambda n: tracedata.TRIAL_RE.match(n).groups())
+	assert [t['name'] for t in dataset.trials] == order
+	for i, name in enumerate(order):
+		assert np.array_equal(dataset.frames[i], _as_array(expected[name][0]))
+		assert np.array_equal(dataset.traces[i], _as_array(expected[name][1]))
+
+	# Database columns are joined by name without overwriting the trial's own info
+	missing = list(expected)[0]
+	for info in dataset.trials:
+		if info['name'] == missing:
+			assert 'mt' not in info
+		else:
+			assert info['mt'] == info['participant'] * 10.0 + info['trial']
+			assert info['figure_file'] == info['name'] + ".tlf"
+			assert info['block'] == info['block_num']
+	assert dataset.find(participant=2) == [order.index(_trial_name(2, 1, 1, 1)),
+		order.index(_trial_name(2, 1, 1, 2))]
+
+	# Saving and reloading the dataset should keep everything
+	path = str(tmpdir.join("study.npz"))
+	dataset.save(path)
+	loaded = TraceDataset.load(path)
+	assert loaded.trials == dataset.trials
+	assert np.array_equal(loaded.traces.data, dataset.traces.data)
+	assert np.array_equal(loaded.frames.offsets, dataset.frames.offsets)
+
+
+def test_load_empty_folder(tmpdir):
+	dataset = load_dataset(str(tmpdir))
+	assert len(dataset) == 0
+	assert len(dataset.frames) == 0 and len(dataset.traces) == 0
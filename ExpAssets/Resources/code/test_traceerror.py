@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the tracing accuracy measures in traceerror.
+
+Most tests use simple shapes (lines and squares) whose errors are known exactly.
+
+Run with 'python -m pytest ExpAssets/Resources/code' from the TraceLab folder.
+
+"""
+
+import math
+
+import pytest
+import numpy as np
+
+import traceerror
+from traceerror import (arc_lengths, resample_path, nearest_points, shape_error, time_error,
+	completion, score_tracing, score_tracings, segments_to_path, TracingScores)
+from pathindex import PathIndex
+
+
+# A 100 x 100 square, traced clockwise from its top-left corner
+SQUARE = np.array([(0, 0), (100, 0), (100, 100), (0, 100), (0, 0)], dtype=np.float64)
+
+
+def _line(start, end, n, t0=0.0, duration=1.0):
+	# Samples evenly spaced along a line and in time
+	f = np.linspace(0, 1, n)[:, None]
+	xy = np.asarray(start) + f * (np.asarray(end) - np.asarray(start))
+	return np.column_stack([xy, t0 + f[:, 0] * duration])
+
+
+def _square_trace(n=401, offset=(0, 0), duration=2.0):
+	# A tracing of the square at constant speed, optionally shifted by an offset
+	path = resample_path(SQUARE, n) + offset
+	return np.column_stack([path, np.linspace(0, duration, n)])
+
+
+def test_arc_lengths_and_resampling():
+	assert arc_lengths(SQUARE).tolist() == [0, 100, 200, 300, 400]
+	assert arc_lengths(SQUARE[:1]).tolist() == [0]
+	resampled = resample_path(SQUARE, 9)
+	assert resampled.tolist() == [
+		[0, 0], [50, 0], [100, 0], [100, 50], [100, 100], [50, 100], [0, 100], [0, 50], [0, 0]
+	]
+
+
+def test_nearest_points():
+	points = np.array([(50, -10), (110, 50), (50, 50), (-3, -4), (0, 0)])
+	dists, pos = nearest_points(points, SQUARE)
+	assert dists.tolist() == pytest.approx([10, 10, 50, 5, 0])
+	assert pos[:2].tolist() == pytest.approx([50, 150])
+	assert pos[3:].tolist() == pytest.approx([0, 0])
+
+	# A path with a single point is treated as a point
+	dists, pos = nearest_points(points, SQUARE[:1])
+	assert dists.tolist() == pytest.approx([math.hypot(*p) for p in points])
+	assert pos.tolist() == [0] * len(points)
+
+
+def test_shape_error():
+	trace = _square_trace()
+	assert shape_error(trace, SQUARE) == pytest.approx(0, abs=1e-9)
+	# Tracing speed and sample count shouldn't matter, only the shape (the samples here
+	# still include the corners)
+	uneven = np.concatenate([resample_path(SQUARE[:2], 300), resample_path(SQUARE[1:], 31)])
+	assert shape_error(uneven, SQUARE) == pytest.approx(0, abs=1e-9)
+	# Shifting the whole tracing moves every resampled point by the same distance
+	assert shape_error(_square_trace(offset=(3, 4)), SQUARE) == pytest.approx(5)
+	# Tracing the right shape in the wrong direction
+	reverse = _square_trace()[::-1]
+	assert shape_error(reverse, SQUARE) > 25
+
+
+def test_time_error():
+	frames = _line((0, 0), (300, 0), 181, duration=3.0)
+	# Keeping pace with the animation, at any sampling rate or start time
+	assert time_error(_line((0, 0), (300, 0), 500, t0=10.0, duration=6.0), frames) == pytest.approx(0)
+	# Keeping pace, but 5 px away from the dot
+	assert time_error(_line((3, 4), (303, 4), 500), frames) == pytest.approx(5)
+	# Tracing the whole line in the first half of the time, then waiting at the end
+	rushed = np.concatenate([_line((0, 0), (300, 0), 101), _line((300, 0), (300, 0), 101, 1.0)])
+	expected = np.mean(np.abs(np.concatenate([
+		np.linspace(0, 300, 101) - np.linspace(0, 150, 101),
+		300 - np.linspace(150, 300, 101)
+	])))
+	assert time_error(rushed, frames) == pytest.approx(expected)
+
+
+def test_time_error_missing_times():
+	frames = _line((0, 0), (300, 0), 181)
+	trace = _line((0, 0), (300, 0), 50)
+	# Frames without times are assumed to be evenly spaced
+	assert time_error(trace, frames[:, :2]) == pytest.approx(0)
+	assert time_error(trace, [tuple(f) for f in frames[:, :2]]) == pytest.approx(0)
+	# Frames without times (e.g. skipped frames) and tracing samples without times are ignored
+	frames[5:20, 2] = np.nan
+	trace_list = [tuple(s) for s in trace]
+	trace_list[3] = (999, 999, None)
+	assert time_error(trace_list, frames) == pytest.approx(0)
+	# Tracings without any times have no time error
+	assert math.isnan(time_error(trace[:, :2], frames))
+	assert math.isnan(time_error([(1, 2, None), (3, 4, None)], frames))
+	assert math.isnan(time_error(trace[:1], frames))
+
+
+def test_completion():
+	assert completion(_square_trace(), SQUARE) == 1.0
+	# Tracing only the top and right sides, with the tolerance reaching around corners
+	half = resample_path(SQUARE[:3], 200)
+	assert completion(half, SQUARE, tolerance=0.5, resolution=401) == pytest.approx(0.5, abs=0.01)
+	assert completion(half, SQUARE, tolerance=20) > completion(half, SQUARE, tolerance=1)
+	far = _square_trace(offset=(0, 30))
+	assert completion(far, SQUARE) < 1.0
+	assert completion(far, SQUARE, tolerance=30.0) == 1.0
+	assert completion([(500, 500)], SQUARE) == 0.0
+
+
+def test_score_tracing():
+	# A tracing 2 px below a line, keeping pace with the animation
+	frames = _line((100, 100), (400, 100), 121)
+	trace = _line((100, 102), (400, 102), 300)
+	scores = score_tracing(trace, frames)
+	assert isinstance(scores, TracingScores)
+	assert scores.mean_error == pytest.approx(2)
+	assert scores.rms_error == pytest.approx(2)
+	assert scores.max_error == pytest.approx(2)
+	assert scores.shape_error == pytest.approx(2)
+	assert scores.time_error == pytest.approx(2)
+	assert scores.completion == 1.0
+
+	# Errors that vary along the tracing
+	zigzag = np.array([(100, 100, 0.0), (250, 106, 0.5), (400, 100, 1.0)])
+	scores = score_tracing(zigzag, frames)
+	assert scores.max_error == pytest.approx(6)
+	assert scores.mean_error == pytest.approx(2)
+	assert scores.rms_error == pytest.approx(math.sqrt(12))
+
+
+def test_score_tracing_empty():
+	for trace, path in [([], SQUARE), (np.empty((0, 3)), SQUARE), (_square_trace(), [])]:
+		scores = score_tracing(trace, path)
+		assert all(math.isnan(s) for s in scores)
+
+
+def test_score_tracing_frames():
+	trace = _square_trace()
+	# Paths without times (e.g. from segments) are treated as evenly-spaced frames
+	assert score_tracing(trace, resample_path(SQUARE, 401)).time_error == pytest.approx(0)
+	# Separate frames can be given for the time error
+	frames = _square_trace(offset=(0, 10))
+	assert score_tracing(trace, SQUARE, frames).time_error == pytest.approx(10)
+
+
+def test_score_tracing_with_path_index():
+	# Scoring against an index of the path should give the same results as the path
+	rng = np.random.RandomState(1)
+	frames = _square_trace(121, duration=5.0)
+	trace = _square_trace(600) + np.column_stack([rng.normal(0, 4, (600, 2)), np.zeros(600)])
+	expected = score_tracing(trace, frames)
+	scores = score_tracing(trace, PathIndex(frames))
+	for name, value, exp in zip(TracingScores._fields, scores, expected):
+		assert value == pytest.approx(exp, abs=1e-9), name
+
+	# Indexes built from segments don't have frames, so the time error needs them given
+	segments = [[False, ((0, 0), (100, 0))], [True, ((100, 0), (0, 100), (100, 100))]]
+	index = PathIndex.from_segments(segments)
+	path = segments_to_path(segments, spacing=0.1)
+	assert math.isnan(score_tracing(trace, index).time_error)
+	with_frames = score_tracing(trace, index, frames)
+	for name, value, exp in zip(TracingScores._fields, with_frames, score_tracing(trace, path, frames)):
+		assert value == pytest.approx(exp, abs=0.01), name
+
+
+def test_segments_to_path():
+	segments = [[False, ((0, 0), (100, 0))], [True, ((100, 0), (0, 100), (100, 100))]]
+	path = segments_to_path(segments, spacing=1.0)
+	assert path[0].tolist() == [0, 0]
+	assert path[-1].tolist() == [0, 100]
+	assert np.max(np.hypot(*np.diff(path[1:], axis=0).T)) <= 1.0
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_score_tracings(monkeypatch, max_workers):
+	# Use small chunks so that tracings are split between several worker tasks
+	monkeypatch.setattr(traceerror, "CHUNK_SIZE", 2)
+	traces = [_square_trace(offset=(0, d)) for d in range(5)] + [np.empty((0, 3))]
+	paths = [SQUARE] * 6
+	scores = score_tracings(traces, paths, max_workers=max_workers)
+	assert sorted(scores.keys()) == sorted(TracingScores._fields)
+	assert scores['shape_error'][:5] == pytest.approx(range(5))
+	assert math.isnan(scores['mean_error'][5])
+	for i, trace in enumerate(traces[:5]):
+		expected = score_tracing(trace, SQUARE)
+		for name in TracingScores._fields:
+			assert scores[name][i] == pytest.approx(getattr(expected, name), nan_ok=True)
+
+
+def test_score_tracings_empty():
+	scores = score_tracings([], [])
+	assert all(len(v) == 0 for v in scores.values())
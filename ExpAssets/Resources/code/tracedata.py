@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+"""Bulk loading of recorded figure frames and tracings for analysis.
+
+Every trial of a session saves the animation frames of the figure shown (.tlf) and the
+participant's tracing of it (.tlt) to its own archive in the session's data folder
+(e.g. 'Data/p1_2020-01-01/session_1'), or to the session archive if one was used.
+Reading these back one trial at a time (unzipping each archive and parsing each file as
+a Python literal) can take minutes for a whole study, so this module reads every trial
+found under a folder in parallel using a pool of worker processes, and packs the frames
+and tracings of all trials into a few large numpy arrays:
+
+	dataset = load_dataset("ExpAssets/Data", db_path="ExpAssets/TraceLab.db")
+	frames = dataset.frames[0]  # (x, y, time) of each frame shown on the first trial
+	trace = dataset.traces[0]  # (x, y, time) of each sample of its tracing
+
+If the path of the experiment's database is given, each trial's row from the 'trials'
+table is joined to it by name and added to its entry in 'dataset.trials'. Datasets can
+be saved to (and quickly reloaded from) a single .npz file, e.g. from the command line:
+
+	python tracedata.py ExpAssets/Data --db ExpAssets/TraceLab.db --out study.npz
+
+Both the text and binary (.tlfab/.tltb) sample formats are supported. Like figureio.py,
+this module intentionally has no dependencies on KLibs.
+
+"""
+
+import os
+import re
+import json
+import sqlite3
+import zipfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from figureio import find_archive_member, tltb_arrays, TLTB_EXTS, FIGURE_STORE
+from sessionarchive import SessionArchive
+
+
+TRIAL_RE = re.compile(r"^p(\d+)_s(\d+)_b(\d+)_t(\d+)_")
+CHUNK_SIZE = 64  # the number of trials read by each task given to the worker pool
+
+_TEXT_BRACKETS = {ord(c): u" " for c in u"[]()"}
+
+
+class RaggedArray(object):
+	"""A sequence of variable-length arrays, stored as a single array of all their rows
+	along with the offset of the first row of each.
+
+	Args:
+		data (:obj:`numpy.ndarray`): The rows of all arrays, concatenated.
+		offsets (:obj:`numpy.ndarray`): The index of the first row of each array in
+			'data', followed by the total number of rows.
+
+	"""
+	def __init__(self, data, offsets):
+		self.data = data
+		self.offsets = offsets
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self)
+		return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	@property
+	def lengths(self):
+		"""numpy.ndarray: The number of rows in each array.
+		"""
+		return np.diff(self.offsets)
+
+	@classmethod
+	def from_arrays(cls, arrays, width=3):
+		"""Creates a RaggedArray from a list of arrays with the same number of columns.
+		"""
+		offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+		np.cumsum([len(a) for a in arrays], out=offsets[1:])
+		data = np.concatenate(arrays) if arrays else np.empty((0, width))
+		return cls(data, offsets)
+
+
+class TraceDataset(object):
+	"""The figure frames and tracings from a set of trials.
+
+	The frames and tracing for each trial are (N x 3) float64 arrays of (x, y, time)
+	samples, with NaN times for any samples without timestamps. Trials without a tracing
+	(e.g. imagery trials) have an empty tracing.
+
+	Args:
+		trials (list): A dict of information about each trial, containing its 'name',
+			'participant', 'session', 'block', and 'trial' numbers, the 'path' of the file
+			it was read from, and any columns joined from the database.
+		frames (:obj:`RaggedArray`): The figure frames shown on each trial.
+		traces (:obj:`RaggedArray`): The participant's tracing on each trial.
+		errors (list, optional): The (path, error message) of any trials that couldn't be
+			read.
+
+	"""
+	def __init__(self, trials, frames, traces, errors=None):
+		self.trials = trials
+		self.frames = frames
+		self.traces = traces
+		self.errors = errors or []
+
+	def __len__(self):
+		return len(self.trials)
+
+	def find(self, **criteria):
+		"""Finds the trials matching a set of criteria.
+
+		For example, ``dataset.find(participant=3, session=1)`` finds the indices of all
+		trials from the first session of participant 3.
+
+		Returns:
+			list: The indices of all trials whose information matches every criterion.
+		"""
+		return [
+			i for i, t in enumerate(self.trials)
+			if all(t.get(k) == v for k, v in criteria.items())
+		]
+
+	def save(self, path):
+		"""Saves the dataset to a .npz file.
+
+		Args:
+			path (str): The path of the file to save the dataset to.
+		"""
+		np.savez(
+			path, frames=self.frames.data, frame_offsets=self.frames.offsets,
+			traces=self.traces.data, trace_offsets=self.traces.offsets,
+			trials=np.array(json.dumps(self.trials)), errors=np.array(json.dumps(self.errors))
+		)
+
+	@classmethod
+	def load(cls, path):
+		"""Loads a dataset previously saved using :meth:`save`.
+
+		Args:
+			path (str): The path of the .npz file to load.
+
+		Returns:
+			:obj:`TraceDataset`: The loaded dataset.
+		"""
+		with np.load(path) as f:
+			return cls(
+				json.loads(str(f['trials'])),
+				RaggedArray(f['frames'], f['frame_offsets']),
+				RaggedArray(f['traces'], f['trace_offsets']),
+				[tuple(e) for e in json.loads(str(f['errors']))]
+			)
+
+
+def text_to_samples(text):
+	"""Parses the text of a .tlt or .tlf file into an array of samples.
+
+	This is much faster than evaluating the text as a Python literal, but assumes that
+	the file contains a list of (x, y) or (x, y, time) tuples as written by TraceLab.
+
+	Args:
+		text (str): The contents of the file.
+
+	Returns:
+		:obj:`numpy.ndarray`: The (x, y, time) samples in the file as an N x 3 array,
+		with NaN for missing times. Files without samples ('NA') give an empty array.
+	"""
+	text = text.strip()
+	if text in (u"NA", u"[]", u""):
+		return np.empty((0, 3))
+	dims = text[:text.index(u")")].count(u",") + 1
+	values = text.translate(_TEXT_BRACKETS).replace(u"None", u"nan").split(u",")
+	samples = np.array(values, dtype=np.float64).reshape(-1, dims)
+	if dims == 2:
+		samples = np.column_stack([samples, np.full(len(samples), np.nan)])
+	return samples
+
+
+def tltb_to_samples(buf):
+	"""Decodes an encoded .tltb (or .tlfab) file into an array of samples.
+
+	Args:
+		buf (bytes): The contents of the file.
+
+	Returns:
+		:obj:`numpy.ndarray`: The (x, y, time) samples in the file as an N x 3 array,
+		with NaN for missing times.
+	"""
+	xy, times = tltb_arrays(buf)
+	samples = np.empty((len(xy), 3))
+	samples[:, :2] = xy
+	samples[:, 2] = np.nan if times is None else times
+	return samples
+
+
+def _read_samples(read, name, ext):
+	# Reads the samples from a trial's .tlf/.tlt (or the binary version of it), returning
+	# an empty array if the trial doesn't have one
+	try:
+		return tltb_to_samples(read(name + TLTB_EXTS[ext]))
+	except KeyError:
+		pass
+	try:
+		return text_to_samples(read(name + ext).decode('utf-8'))
+	except KeyError:
+		return np.empty((0, 3))
+
+
+def _trial_info(name, path):
+	p, s, b, t = [int(n) for n in TRIAL_RE.match(name).groups()]
+	return {'name': name, 'participant': p, 'session': s, 'block': b, 'trial': t, 'path': path}
+
+
+def load_trials(source, names):
+	"""Reads the frames and tracings of a set of trials from the same data folder or
+	session archive.
+
+	Args:
+		source (str): The path of the folder containing the trial archives, or of the
+			session archive containing the trials.
+		names (list): The names of the trials to read.
+
+	Returns:
+		tuple: The info for each trial read (see :class:`TraceDataset`), its frames and
+		tracing, and the (path, error message) of any trials that couldn't be read.
+	"""
+	trials, frames, traces, errors = ([], [], [], [])
+	archive = SessionArchive(source, read_only=True) if os.path.isfile(source) else None
+	try:
+		for name in names:
+			path = source if archive else os.path.join(source, name + ".zip")
+			try:
+				if archive:
+					read = lambda f: archive.read(name, f)
+					trial_frames = _read_samples(read, name, ".tlf")
+					trial_trace = _read_samples(read, name, ".tlt")
+				else:
+					with zipfile.ZipFile(path) as trial_zip:
+						def read(f):
+							member = find_archive_member(trial_zip, name, f[len(name):])
+							if not member:
+								raise KeyError(f)
+							return trial_zip.read(member)
+						trial_frames = _read_samples(read, name, ".tlf")
+						trial_trace = _read_samples(read, name, ".tlt")
+			except Exception as e:
+				errors.append((path if archive is None else path + ":" + name, str(e)))
+				continue
+			trials.append(_trial_info(name, path))
+			frames.append(trial_frames)
+			traces.append(trial_trace)
+	finally:
+		if archive:
+			archive.close()
+
+	return (trials, frames, traces, errors)
+
+
+def find_trials(root):
+	"""Finds all trial archives and session archives within a folder and its subfolders.
+
+	Trials in a session archive that have also been exported to separate trial archives
+	are only read from the session archive.
+
+	Args:
+		root (str): The path of a participant's data folder (or a folder containing them).
+
+	Returns:
+		list: The (source, names) of each folder or session archive containing trials,
+		where 'names' are the names of the trials it contains.
+	"""
+	sources = []
+	for dirpath, dirnames, filenames in os.walk(root):
+		dirnames[:] = sorted(d for d in dirnames if d not in (FIGURE_STORE, "__MACOSX"))
+		in_archives = set()
+		for f in sorted(filenames):
+			if f.endswith(".tlsa"):
+				path = os.path.join(dirpath, f)
+				archive = SessionArchive(path, read_only=True)
+				names = [a for a in archive.archives() if TRIAL_RE.match(a)]
+				archive.close()
+				in_archives.update(names)
+				sources.append((path, names))
+		names = [
+			f[:-4] for f in sorted(filenames)
+			if f.endswith(".zip") and TRIAL_RE.match(f) and f[:-4] not in in_archives
+		]
+		if names:
+			sources.append((dirpath, names))
+
+	return sources
+
+
+def read_trials_table(db_path):
+	"""Reads the rows of the 'trials' table from a TraceLab database.
+
+	Args:
+		db_path (str): The path of the database.
+
+	Returns:
+		dict: The columns of each trial's row, keyed by the name of the trial's archive.
+	"""
+	db = sqlite3.connect(db_path)
+	try:
+		cursor = db.execute("SELECT * FROM trials")
+		cols = [c[0] for c in cursor.description]
+		rows = [dict(zip(cols, row)) for row in cursor]
+	finally:
+		db.close()
+
+	# If a trial was redone (e.g. after resuming a session), the last row for it is used
+	return {os.path.splitext(row['figure_file'])[0]: row for row in rows}
+
+
+def iter_trials(root, max_workers=None):
+	"""Reads the frames and tracings of all trials within a folder and its subfolders in
+	parallel using a pool of worker processes, yielding them in batches as they're read.
+
+	Args:
+		root (str): The path of a participant's data folder (or a folder containing them).
+		max_workers (int, optional): The maximum number of worker processes to use.
+			Defaults to the number of CPU cores.
+
+	Yields:
+		tuple: The results of :func:`load_trials` for each batch of trials.
+	"""
+	tasks = []
+	for source, names in find_trials(root):
+		for i in range(0, len(names), CHUNK_SIZE):
+			tasks.append((source, names[i:i + CHUNK_SIZE]))
+
+	if not max_workers:
+		max_workers = os.cpu_count() or 1
+	max_workers = min(max_workers, len(tasks))
+	if max_workers < 1:
+		return
+
+	# As in figureloader, worker processes are spawned rather than forked so that they
+	# don't inherit any window or hardware handles if used from within an experiment
+	context = mp.get_context("spawn")
+	with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+		futures = [pool.submit(load_trials, source, names) for source, names in tasks]
+		for future in as_completed(futures):
+			yield future.result()
+
+
+def load_dataset(root, db_path=None, max_workers=None):
+	"""Loads the frames and tracings of all trials within a folder and its subfolders.
+
+	Args:
+		root (str): The path of a participant's data folder (or a folder containing them).
+		db_path (str, optional): The path of the experiment's database. If provided, the
+			columns of each trial's row in the 'trials' table are added to its info.
+		max_workers (int, optional): The maximum number of worker processes to use.
+			Defaults to the number of CPU cores.
+
+	Returns:
+		:obj:`TraceDataset`: The trials, sorted by participant, session, block, and trial.
+	"""
+	trials, frames, traces, errors = ([], [], [], [])
+	for batch in iter_trials(root, max_workers):
+		trials += batch[0]
+		frames += batch[1]
+		traces += batch[2]
+		errors += batch[3]
+
+	order = sorted(range(len(trials)), key=lambda i: (
+		trials[i]['participant'], trials[i]['session'], trials[i]['block'],
+		trials[i]['trial'], trials[i]['name']
+	))
+	trials = [trials[i] for i in order]
+	if db_path:
+		rows = read_trials_table(db_path)
+		for info in trials:
+			row = rows.get(info['name'], {})
+			info.update((k, v) for k, v in row.items() if k not in info)
+
+	return TraceDataset(
+		trials,
+		RaggedArray.from_arrays([frames[i] for i in order]),
+		RaggedArray.from_arrays([traces[i] for i in order]),
+		sorted(errors)
+	)
+
+
+if __name__ == "__main__":
+
+	import time
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Load all trial frames and tracings.")
+	parser.add_argument('path', help="a participant data folder or a folder containing them")
+	parser.add_argument('--db', default=None, help="the experiment's database")
+	parser.add_argument('--out', default=None, help="save the dataset to this .npz file")
+	parser.add_argument('--workers', type=int, default=None, help="number of processes")
+	args = parser.parse_args()
+
+	start = time.time()
+	dataset = load_dataset(args.path, args.db, args.workers)
+	for path, err in dataset.errors:
+		print("Skipped '{0}': {1}".format(path, err))
+	msg = "Loaded {0} trials ({1} frames, {2} tracing samples) in {3:.2f} s."
+	print(msg.format(
+		len(dataset), len(dataset.frames.data), len(dataset.traces.data), time.time() - start
+	))
+	if args.out:
+		dataset.save(args.out)
+		print("Saved to '{0}'".format(args.out))
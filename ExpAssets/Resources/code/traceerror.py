@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+"""Measures of how accurately a tracing follows the figure it was a tracing of.
+
+A figure's path can be given either as its animation frames (e.g. TraceLabFigure.a_frames,
+or the frames saved in a trial's .tlf), or as its raw [curve, points] segments converted
+to a path with :func:`segments_to_path`. Tracings and paths can be lists of (x, y) or
+(x, y, time) tuples, or N x 2 / N x 3 numpy arrays such as those loaded by tracedata.py,
+so every tracing in a study can be scored at once using a pool of worker processes:
+
+	dataset = tracedata.load_dataset("ExpAssets/Data")
+	scores = score_tracings(dataset.traces, dataset.frames)
+	scores['shape_error']  # the shape error of each trial's tracing
+
+The available measures (all in pixels, apart from completion) are:
+
+	- error: the distance from each sample of the tracing to the closest point on the
+	  figure's path, summarized by its mean, RMS, and maximum.
+	- shape_error: the mean distance between the tracing and the figure after both are
+	  resampled at the same number of equally-spaced points along their own lengths.
+	- time_error: the mean distance between each sample of the tracing and where the
+	  figure's animation was at the same proportion of its duration.
+	- completion: the proportion of the figure's path that the tracing passed close to.
+
+When scoring many tracings of the same figure, a PathIndex of the figure's path (see
+pathindex.py) can be used in place of the path to speed up finding the closest points.
+
+Like figureio.py, this module intentionally has no dependencies on KLibs.
+
+"""
+
+import os
+import multiprocessing as mp
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pathindex import PathIndex, flatten_segments
+
+
+TracingScores = namedtuple('TracingScores', [
+	'mean_error',  # the mean distance from the tracing to the figure's path
+	'rms_error',  # the root-mean-square distance from the tracing to the figure's path
+	'max_error',  # the largest distance from the tracing to the figure's path
+	'shape_error',  # the mean distance between the arc length-normalized shapes
+	'time_error',  # the mean distance from where the figure was at the same relative time
+	'completion',  # the proportion of the figure's path the tracing came close to
+])
+
+RESOLUTION = 200  # the number of points to resample shapes at for comparison
+TOLERANCE = 20.0  # the distance (in pixels) within which a tracing covers the figure
+CHUNK_SIZE = 64  # the number of tracings scored by each task given to the worker pool
+_MAX_PAIRS = 65536  # the number of point/line pairs to compare at once (sized to fit in cache)
+
+
+def _xy(samples):
+	# Converts a list of (x, y) or (x, y, time) samples into an N x 2 float64 array
+	if isinstance(samples, np.ndarray):
+		return samples[:, :2].astype(np.float64)
+	return np.array([s[:2] for s in samples], dtype=np.float64).reshape(-1, 2)
+
+
+def _times(samples):
+	# Gets the times of a list of (x, y, time) samples, with NaN for any missing times
+	if isinstance(samples, np.ndarray):
+		return samples[:, 2].astype(np.float64) if samples.shape[1] > 2 else None
+	if not len(samples) or len(samples[0]) < 3:
+		return None
+	return np.array([np.nan if s[2] is None else s[2] for s in samples], dtype=np.float64)
+
+
+def segments_to_path(segments, spacing=1.0):
+	"""Converts a figure's linear and/or bezier segments into a path of (x, y) points.
+
+	Args:
+		segments (list): A list of [curve, points] figure segments, where 'points' is a
+			(start, end) tuple for lines and a (start, end, ctrl) tuple for curves.
+		spacing (float, optional): The approximate distance (in pixels) between points
+			on curved segments. Defaults to 1.0.
+
+	Returns:
+		:obj:`numpy.ndarray`: The N x 2 array of points along the figure's path.
+	"""
+	return flatten_segments(segments, spacing)[0]
+
+
+def arc_lengths(path):
+	"""Calculates the distance (in pixels) along a path at each of its points.
+
+	Args:
+		path (:obj:`numpy.ndarray`): The N x 2 array of points along the path.
+
+	Returns:
+		:obj:`numpy.ndarray`: The distance along the path at each point, starting at 0.
+	"""
+	dists = np.zeros(len(path))
+	if len(path) > 1:
+		np.cumsum(np.hypot(*np.diff(path, axis=0).T), out=dists[1:])
+	return dists
+
+
+def resample_path(path, n=RESOLUTION):
+	"""Resamples a path at a given number of points equally spaced along its length.
+
+	Args:
+		path (:obj:`numpy.ndarray`): The N x 2 array of points along the path.
+		n (int, optional): The number of points to resample the path at.
+
+	Returns:
+		:obj:`numpy.ndarray`: The n x 2 array of resampled points.
+	"""
+	dists = arc_lengths(path)
+	targets = np.linspace(0, dists[-1], n)
+	x = np.interp(targets, dists, path[:, 0])
+	y = np.interp(targets, dists, path[:, 1])
+	return np.column_stack([x, y])
+
+
+def nearest_points(points, path):
+	"""Finds the closest point on a path to each of a set of points.
+
+	Args:
+		points (:obj:`numpy.ndarray`): The N x 2 array of points to find the closest
+			points on the path to.
+		path (:obj:`numpy.ndarray`): The M x 2 array of points along the path, or a
+			:obj:`pathindex.PathIndex` of the path.
+
+	Returns:
+		tuple: The distance from each point to the closest point on the path, and the
+		distance along the path (from its start) of that closest point.
+	"""
+	if isinstance(path, PathIndex):
+		return path.nearest(points)
+	points = np.asarray(points, dtype=np.float64)
+	if len(path) == 1:
+		return (np.hypot(*(points - path[0]).T), np.zeros(len(points)))
+
+	x1, y1 = (path[:-1, 0], path[:-1, 1])
+	dx, dy = (np.diff(path[:, 0]), np.diff(path[:, 1]))
+	lens_sq = dx ** 2 + dy ** 2
+	lens_sq[lens_sq == 0] = 1.0  # zero-length lines are treated as points
+	dists = arc_lengths(path)
+	seg_lens = np.diff(dists)
+
+	# Compare points against every line of the path in chunks to limit memory use
+	out_dist = np.empty(len(points))
+	out_pos = np.empty(len(points))
+	chunk = max(_MAX_PAIRS // len(x1), 1)
+	for i in range(0, len(points), chunk):
+		px = points[i:i + chunk, 0, None] - x1
+		py = points[i:i + chunk, 1, None] - y1
+		t = np.clip((px * dx + py * dy) / lens_sq, 0, 1)
+		px -= t * dx
+		py -= t * dy
+		dist_sq = px * px + py * py
+		closest = np.argmin(dist_sq, axis=1)
+		rows = np.arange(len(closest))
+		out_dist[i:i + chunk] = np.sqrt(dist_sq[rows, closest])
+		out_pos[i:i + chunk] = dists[closest] + t[rows, closest] * seg_lens[closest]
+
+	return (out_dist, out_pos)
+
+
+def shape_error(trace, path, resolution=RESOLUTION):
+	"""Calculates the mean distance between a tracing and a figure after resampling both
+	at the same number of points equally spaced along their own lengths, such that
+	differences in tracing speed don't affect the error.
+
+	Args:
+		trace (list): The (x, y) or (x, y, time) samples of the tracing.
+		path (list): The (x, y) points along the figure's path.
+		resolution (int, optional): The number of points to resample both shapes at.
+
+	Returns:
+		float: The mean distance (in pixels) between the resampled shapes.
+	"""
+	diffs = resample_path(_xy(trace), resolution) - resample_path(_xy(path), resolution)
+	return float(np.mean(np.hypot(*diffs.T)))
+
+
+def time_error(trace, frames):
+	"""Calculates the mean distance between each sample of a tracing and where the
+	figure's animation was at the same proportion of its duration.
+
+	Times are relative to the first and last samples of the tracing and the first and
+	last frames of the animation. If the frames don't have times (e.g. a_frames), they
+	are assumed to be evenly spaced in time, as they are during an animation. Any
+	individual frames without times (None or NaN) are ignored.
+
+	Args:
+		trace (list): The (x, y, time) samples of the tracing.
+		frames (list): The (x, y) or (x, y, time) frames of the figure's animation.
+
+	Returns:
+		float: The mean distance (in pixels) between the tracing and the animation, or
+		NaN if the tracing doesn't have times.
+	"""
+	trace_xy, trace_t = (_xy(trace), _times(trace))
+	frames_xy, frames_t = (_xy(frames), _times(frames))
+	if trace_t is None or len(trace_xy) < 2 or np.isnan(trace_t).all():
+		return float('nan')
+	if frames_t is None:
+		frames_t = np.arange(len(frames_xy), dtype=np.float64)
+	shown = ~np.isnan(frames_t)
+	frames_xy, frames_t = (frames_xy[shown], frames_t[shown])
+
+	def _relative(t):
+		span = t[-1] - t[0]
+		return (t - t[0]) / span if span > 0 else np.zeros(len(t))
+
+	valid = ~np.isnan(trace_t)
+	rel_t = _relative(trace_t[valid])
+	frames_rel = _relative(frames_t)
+	expected = np.column_stack([
+		np.interp(rel_t, frames_rel, frames_xy[:, 0]), np.interp(rel_t, frames_rel, frames_xy[:, 1])
+	])
+	return float(np.mean(np.hypot(*(trace_xy[valid] - expected).T)))
+
+
+def completion(trace, path, tolerance=TOLERANCE, resolution=RESOLUTION):
+	"""Calculates the proportion of a figure's path that a tracing came within a given
+	distance of.
+
+	Args:
+		trace (list): The (x, y) or (x, y, time) samples of the tracing.
+		path (list): The (x, y) points along the figure's path.
+		tolerance (float, optional): The distance (in pixels) a part of the figure must
+			be from the tracing to count as traced.
+		resolution (int, optional): The number of points along the figure to check.
+
+	Returns:
+		float: The proportion (from 0 to 1) of the figure's path that was traced.
+	"""
+	points = resample_path(_xy(path), resolution)
+	dists, _ = nearest_points(points, _xy(trace))
+	return float(np.mean(dists <= tolerance))
+
+
+def score_tracing(trace, path, frames=None, tolerance=TOLERANCE, resolution=RESOLUTION):
+	"""Calculates all accuracy measures for a tracing of a figure.
+
+	Args:
+		trace (list): The (x, y) or (x, y, time) samples of the tracing.
+		path (list): The (x, y) or (x, y, time) points along the figure's path, e.g. its
+			animation frames or the output of :func:`segments_to_path`. This can also be
+			a :obj:`pathindex.PathIndex` of the path (e.g. TraceLabFigure.path_index),
+			which is much faster when scoring many tracings of the same figure.
+		frames (list, optional): The animation frames of the figure to use for the time
+			error. If not provided, the frames are taken from 'path' when it is a list of
+			frames or an index built from one (i.e. its 'path' attribute is not None).
+			Otherwise (e.g. for an index built from the figure's segments), the time
+			error is NaN.
+		tolerance (float, optional): The distance (in pixels) within which the tracing
+			counts as having covered part of the figure (see :func:`completion`).
+		resolution (int, optional): The number of points to resample the shapes at for
+			the shape error and completion.
+
+	Returns:
+		:obj:`TracingScores`: The accuracy measures for the tracing. If the tracing is
+		empty, all measures are NaN.
+	"""
+	index = path if isinstance(path, PathIndex) else None
+	if index is not None:
+		path_xy = index.points
+		if frames is None:
+			frames = index.path
+	else:
+		path_xy = _xy(path)
+		if frames is None:
+			frames = path
+	trace_xy = _xy(trace)
+	if not len(trace_xy) or not len(path_xy):
+		return TracingScores(*([float('nan')] * len(TracingScores._fields)))
+
+	dists, _ = nearest_points(trace_xy, index if index is not None else path_xy)
+	return TracingScores(
+		mean_error=float(np.mean(dists)),
+		rms_error=float(np.sqrt(np.mean(dists ** 2))),
+		max_error=float(np.max(dists)),
+		shape_error=shape_error(trace_xy, path_xy, resolution),
+		time_error=time_error(trace, frames) if frames is not None else float('nan'),
+		completion=completion(trace_xy, path_xy, tolerance, resolution),
+	)
+
+
+def _score_chunk(traces, paths, frames, tolerance, resolution):
+	return [
+		score_tracing(trace, path, f, tolerance, resolution)
+		for trace, path, f in zip(traces, paths, frames)
+	]
+
+
+def score_tracings(traces, paths, frames=None, tolerance=TOLERANCE, resolution=RESOLUTION,
+		max_workers=None):
+	"""Calculates all accuracy measures for a set of tracings, in parallel using a pool of
+	worker processes.
+
+	Args:
+		traces (list): The samples of each tracing (e.g. TraceDataset.traces).
+		paths (list): The path of the figure for each tracing (e.g. TraceDataset.frames).
+		frames (list, optional): The animation frames of the figure for each tracing,
+			if different from 'paths'.
+		tolerance (float, optional): See :func:`score_tracing`.
+		resolution (int, optional): See :func:`score_tracing`.
+		max_workers (int, optional): The maximum number of worker processes to use.
+			Defaults to the number of CPU cores. If 1, all tracings are scored in the
+			current process.
+
+	Returns:
+		dict: An array of each measure in :obj:`TracingScores` for all tracings, in the
+		format {measure: array}.
+	"""
+	traces, paths = (list(traces), list(paths))
+	frames = [None] * len(traces) if frames is None else list(frames)
+	chunks = [
+		(traces[i:i + CHUNK_SIZE], paths[i:i + CHUNK_SIZE], frames[i:i + CHUNK_SIZE])
+		for i in range(0, len(traces), CHUNK_SIZE)
+	]
+
+	if not max_workers:
+		max_workers = os.cpu_count() or 1
+	max_workers = min(max_workers, len(chunks))
+	if max_workers > 1:
+		# As in figureloader, worker processes are spawned rather than forked so that they
+		# don't inherit any window or hardware handles if used from within an experiment
+		context = mp.get_context("spawn")
+		with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+			futures = [pool.submit(_score_chunk, *c, tolerance, resolution) for c in chunks]
+			scores = [s for future in futures for s in future.result()]
+	else:
+		scores = [s for c in chunks for s in _score_chunk(*c, tolerance, resolution)]
+
+	columns = zip(*scores) if scores else [[]] * len(TracingScores._fields)
+	return {
+		name: np.array(col, dtype=np.float64) for name, col in zip(TracingScores._fields, columns)
+	}
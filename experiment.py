@@ -3,6 +3,7 @@ __author__ = "Jonathan Mulle"
 
 import os
 import io
+import json
 import time
 
 from random import choice
@@ -24,6 +25,13 @@ from klibs.KLResponseCollectors import DrawResponse
 
 from TraceLabSession import TraceLabSession
 from TraceLabFigure import TraceLabFigure
+from figurecache import FigureCache, cache_key
+from figureloader import load_figure_data, iter_figure_data
+from figureindex import FigureIndex
+from frametiming import summarize_flips
+from figurewriter import FigureWriter
+from sessionarchive import SessionArchive, SESSION_ARCHIVE
+from compositor import Compositor
 from ButtonBar import ButtonBar
 from KeyFrames import FrameSet
 from InterfaceExtras import LikertPrompt, Aesthetics
@@ -109,6 +117,11 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 	it = None  # time between arriving at origin and intiating response (ie. between RT and MT)
 	control_response = None
 	test_figures = {}
+	figure_index = None
+	figure_cache = None
+	figure_writer = None
+	refresh_layers = None
+	frame_timing_warned = False
 	figure = None
 	control_question = None  # which question the control will be asked to report an answer for
 
@@ -164,9 +177,13 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 		# Pre-render shape stimuli
 		dot_stroke = [P.dot_stroke, P.dot_stroke_col, STROKE_OUTER] if P.dot_stroke > 0 else None
 		self.tracker_dot = Ellipse(P.dot_size, stroke=dot_stroke, fill=P.dot_color).render()
+		self.refresh_layers = Compositor()
 		self.origin_active = Ellipse(P.origin_size, fill=self.origin_active_color).render()
 		self.origin_inactive = Ellipse(P.origin_size, fill=self.origin_inactive_color).render()
 
+		# Index the figure library, re-reading only archives added or changed since last run
+		self.figure_index = FigureIndex(os.path.join(P.resources_dir, "figures"))
+
 		# If capture figures mode, generate, view, and optionally save some figures
 		if P.capture_figures_mode:
 			self.fig_dir = os.path.join(P.resources_dir, "figures")
@@ -190,6 +207,13 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 		self.session = TraceLabSession()
 		self.user_id = self.session.user_id
 
+		# Write out trial figures and tracings in the background between trials, optionally
+		# appending them all to a single archive for the session
+		archive = None
+		if P.use_session_archive:
+			archive = SessionArchive(os.path.join(self.fig_dir, SESSION_ARCHIVE))
+		self.figure_writer = FigureWriter(archive)
+
 		# Add flags for first block/trial of run, needed for resuming mid-session
 		self.first_block = True
 		self.first_trial = True
@@ -267,14 +291,16 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 			1, 10, vividness_msg, width=scale_width, origin=P.screen_c, aes=scale_aes
 		)
 
-		# Import all pre-generated figures needed for the current session
-		figures = list(set(self.trial_factory.exp_factors["figure_name"]))
-		figures.append(P.practice_figure)
-		for f in figures:
-			if f != "random":
-				ui_request()
-				fig_path = os.path.join(P.resources_dir, "figures", f)
-				self.test_figures[f] = TraceLabFigure(fig_path, handedness = self.handedness)
+		# Import all pre-generated figures needed for the current session, along with their
+		# animation frames for every animation duration used in the session
+		if P.cache_figures:
+			self.figure_cache = FigureCache(os.path.join(P.local_dir, "figure_cache"))
+		durations = set(self.trial_factory.exp_factors["animate_time"])
+		durations.update([P.practice_animation_time, 5000.0])
+		figures = set(self.trial_factory.exp_factors["figure_name"])
+		figures.add(P.practice_figure)
+		figures.discard("random")
+		self._load_figures(figures, durations)
 
 
 	def block(self):
@@ -346,6 +372,9 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 
 	def trial_prep(self):
 
+		# Raise any errors from writing out the previous trial's figure & tracing
+		self.figure_writer.check()
+
 		# If reloading incomplete block, update trial number accordingly
 		if self.first_trial:
 			trials_in_block = len(self.blocks.blocks[0])
@@ -365,10 +394,14 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 		if self.figure_name == "random":
 			self.figure = self._generate_figure(duration=self.animate_time)
 		else:
+			# Frames for each animation duration are interpolated when figures are loaded,
+			# so this just looks them up. The figure itself is only drawn during the
+			# animation in demo mode, so we skip rendering it otherwise.
 			self.figure = self.test_figures[self.figure_name]
 			self.figure.animate_target_time = self.animate_time
-			self.figure.render()
 			self.figure.prepare_animation()
+			if P.demo_mode:
+				self.figure.render(crop=True)
 
 		# Initialize origin position and origin boundaries based on the loaded figure
 		self.origin_pos = list(self.figure.points[0])
@@ -470,8 +503,11 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 	def trial_clean_up(self):
 
 		if not self.__practicing__:
-			self.figure.write_out(self.file_name + ".tlf")
-			self.figure.write_out(self.file_name + ".tlt", self.drawing)
+			self.figure_writer.submit(self.figure.snapshot(self.file_name + ".tlf"))
+			self.figure_writer.submit(self.figure.snapshot(self.file_name + ".tlt", self.drawing))
+			self._log_frame_timing(
+				"figure", [self.figure.flip_times], P.trial_number, self.figure.skipped_frames
+			)
 		self.rc.draw_listener.reset()
 		self.control_bar.reset()
 
@@ -551,15 +587,18 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 
 	def display_refresh(self):
 
-		fill()
+		# The origin only changes when the draw listener starts or stops, so it's kept in
+		# video memory as a static layer and only the drawing progress is re-uploaded
 		origin = self.origin_active if self.rc.draw_listener.active else self.origin_inactive
-		blit(origin, 5, self.origin_pos, flip_x=P.flip_x)
+		self.refresh_layers.set_layer("origin", origin, 5, self.origin_pos)
+		moving = []
 		if P.dm_render_progress or self.feedback_type in (FB_ALL, FB_DRAW):
 			try:
 				drawing = self.rc.draw_listener.render_progress()
-				blit(drawing, 5, P.screen_c, flip_x=P.flip_x)
+				moving.append((drawing, 5, P.screen_c))
 			except TypeError:
 				pass
+		self.refresh_layers.draw(moving)
 		flip()
 
 
@@ -608,7 +647,8 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 		if self.feedback_type in (FB_ALL, FB_RES) and not self.__practicing__:
 			flush()
 			fill()
-			blit(self.figure.render(trace=self.drawing), 5, P.screen_c, flip_x=P.flip_x)
+			self.figure.render(trace=self.drawing, crop=True)
+			self.figure.blit_rendered()
 			flip()
 			start = time.time()
 			while time.time() - start < P.feedback_duration / 1000.0:
@@ -629,6 +669,96 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 		self.control_response = self.control_bar.response
 
 
+	def _load_figures(self, names, durations):
+
+		# Load any figures with valid cached copies directly from the cache
+		to_load = {}
+		for name in names:
+			fig_path = os.path.join(P.resources_dir, "figures", name)
+			key = None
+			if self.figure_cache:
+				key = cache_key(
+					fig_path, P.screen_x_y, self.handedness, P.refresh_rate, P.arc_length_tolerance
+				)
+				cached = self.figure_cache.load(name, key)
+				if cached and all(float(d) in cached['frames'] for d in durations):
+					self.test_figures[name] = TraceLabFigure(manufacture = cached)
+					continue
+			to_load[name] = (fig_path, key)
+
+		# Import, scale, and interpolate any remaining figures, using a pool of worker
+		# processes if there's more than one to load
+		jobs = {}
+		for name, (fig_path, key) in to_load.items():
+			jobs[name] = (
+				fig_path, P.screen_x_y, self.handedness, durations, P.refresh_rate,
+				P.arc_length_tolerance
+			)
+		if P.parallel_figure_loading and len(jobs) > 1:
+			results = iter_figure_data(jobs)
+		else:
+			results = ((name, load_figure_data(*args)) for name, args in jobs.items())
+
+		loaded = len(names) - len(jobs)
+		self._show_loading_progress(loaded, len(names))
+		for result in results:
+			ui_request()
+			if result:
+				name, data = result
+				figure = TraceLabFigure(manufacture = data)
+				self.test_figures[name] = figure
+				if self.figure_cache:
+					self.figure_cache.save(
+						name, to_load[name][1], figure.points, figure.raw_segments,
+						figure.frame_sets, P.screen_x_y
+					)
+				loaded += 1
+			self._show_loading_progress(loaded, len(names))
+
+
+	def _show_loading_progress(self, loaded, total):
+
+		bar_width = int(P.screen_x * 0.3)
+		bar_pos = (P.screen_c[0] - bar_width // 2, P.screen_c[1] + 40)
+		fill()
+		blit(self.loading_msg, 5, P.screen_c)
+		blit(Rectangle(bar_width, 8, stroke=(1, WHITE, STROKE_OUTER)), 4, bar_pos)
+		if loaded > 0:
+			progress = int(bar_width * loaded / float(total))
+			blit(Rectangle(progress, 8, fill=WHITE), 4, bar_pos)
+		flip()
+
+
+	def _log_frame_timing(self, animation, flip_times, trial_num, skipped_frames=()):
+
+		# Summarize flip timing for the last animation and write it to the database, along
+		# with the indices of any animation frames skipped to stay on schedule. Tutorial
+		# animations are logged with a trial number of 0, since they happen before the first
+		# trial of the block.
+		timing = summarize_flips(flip_times, P.refresh_rate)
+		timing.update({
+			'participant_id': P.participant_id,
+			'session_num': self.session_number,
+			'block_num': P.block_number,
+			'trial_num': trial_num,
+			'animation': animation,
+			'refresh_rate': P.refresh_rate,
+			'skipped_frames': json.dumps(list(skipped_frames)),
+		})
+
+		# Databases created before the 'frame_timing' table was added (or changed) can't
+		# store the timing data, so warn (once per session) that it isn't being logged
+		columns = self.db.table_schemas.get('frame_timing', {})
+		if not all(col in columns for col in timing.keys()):
+			if not self.frame_timing_warned:
+				cso("<red>Warning: the database's 'frame_timing' table is missing or out of "
+					"date, so animation frame timing won't be logged. Export your data and run "
+					"'klibs db-rebuild' to update the database.</red>")
+				self.frame_timing_warned = True
+			return
+		self.db.insert(timing, "frame_timing")
+
+
 	def _generate_figure(self, duration):
 
 		failures = 0
@@ -638,8 +768,9 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 			ui_request()
 			try:
 				figure = TraceLabFigure(animate_time = duration, handedness = self.handedness)
-				figure.render()
 				figure.prepare_animation()
+				if P.demo_mode:
+					figure.render(crop=True)
 			except RuntimeError as e:
 				print(e)
 				failures += 1
@@ -684,6 +815,7 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 
 				figure = self._generate_figure(duration=5000.0)
 				figure.write_out("figure{0}_{1}.tlf".format(i + 1, P.random_seed))
+			self.figure_index.refresh()
 
 		else:
 
@@ -727,6 +859,7 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 						blit(msg, 5, P.screen_c)
 						flip()
 						figure.write_out(f_name)
+						self.figure_index.refresh()
 						break
 
 
@@ -755,6 +888,7 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 
 		if play_key_frames:
 			self.practice_kf.play()
+			self._log_frame_timing("tutorial", self.practice_kf.flip_times, 0)
 
 		self.practice_button_bar.reset()
 		self.practice_button_bar.render()
@@ -785,6 +919,12 @@ class TraceLab(klibs.Experiment, BoundaryInspector):
 
 
 	def quit(self):
+		# Make sure all figures & tracings have been written out before exiting
+		if self.figure_writer is not None:
+			self.figure_writer.close()
+			if self.figure_writer.error:
+				err = "\nError writing out figure data: {0}\n".format(self.figure_writer.error)
+				cso("<red>" + err + "</red>")
 		# Properly close trigger port for hardware that needs it
 		if self.trigger is not None:
 			self.trigger.close()